@@ -9,8 +9,72 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base_project.settings')
 
-application = get_asgi_application()
+
+def _read(parts, size):
+    """ Parts of a streaming response joined up to size bytes, b'' once they are over"""
+    chunk = bytearray()
+    for part in parts:
+        chunk += part
+        if len(chunk) >= size:
+            break
+    return bytes(chunk)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ Django's ASGI handler, iterating the content of the streaming responses (e.g. the ticket
+        export) in the thread of the sync views. Django 3.2 iterates it in the event loop, where
+        the lazy queries of the content are not allowed"""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        parts = iter(response)
+        response.streaming_content = []  # the handler sends the start and the end of the stream only
+
+        async def send_parts(message):
+            if message['type'] == 'http.response.body' and 'body' not in message:  # end of the stream
+                read = sync_to_async(_read, thread_sensitive=True)
+                chunk = await read(parts, self.chunk_size)
+                while chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    chunk = await read(parts, self.chunk_size)
+            await send(message)
+
+        await super().send_response(response, send_parts)
+
+
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+# imported once the apps are loaded
+from django.urls import resolve, Resolver404  # noqa: E402
+from book2fest.live import seat_stream  # noqa: E402
+
+SEAT_STREAM_URL = 'book2fest:event-seat-stream'
+
+
+def _seat_stream_event(scope):
+    """ pk of the event of a request for its seat stream, else None"""
+    if scope['type'] != 'http' or scope['method'] != 'GET' or not scope['path'].endswith('/seat-stream'):
+        return None
+    try:
+        match = resolve(scope['path'])
+    except Resolver404:
+        return None
+    return match.kwargs['pk'] if match.view_name == SEAT_STREAM_URL else None
+
+
+async def application(scope, receive, send):
+    """ Django, except for the seat streams of the events (book2fest.live): they are long lived
+        and are served without a thread each"""
+    event_id = _seat_stream_event(scope)
+    if event_id is not None:
+        return await seat_stream(scope, receive, send, event_id)
+    await django_application(scope, receive, send)
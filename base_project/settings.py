@@ -43,13 +43,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'book2fest.middleware.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'book2fest.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'book2fest.middleware.QueryProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'base_project.urls'
@@ -77,13 +80,60 @@ WSGI_APPLICATION = 'base_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Database settings come from the environment, e.g. for PostgreSQL:
+#   BOOK2FEST_DB_ENGINE=django.db.backends.postgresql BOOK2FEST_DB_NAME=book2fest BOOK2FEST_DB_HOST=...
+# Connections are kept open for BOOK2FEST_DB_CONN_MAX_AGE seconds and checked before every request.
+# BOOK2FEST_DB_REPLICA_NAME / BOOK2FEST_DB_REPLICA_HOST add a read replica, see book2fest.routers
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': os.environ.get('BOOK2FEST_DB_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.environ.get('BOOK2FEST_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('BOOK2FEST_DB_USER', ''),
+        'PASSWORD': os.environ.get('BOOK2FEST_DB_PASSWORD', ''),
+        'HOST': os.environ.get('BOOK2FEST_DB_HOST', ''),
+        'PORT': os.environ.get('BOOK2FEST_DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('BOOK2FEST_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('BOOK2FEST_DB_CONN_HEALTH_CHECKS', '1') == '1',
     }
 }
 
+if os.environ.get('BOOK2FEST_DB_REPLICA_NAME') or os.environ.get('BOOK2FEST_DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get('BOOK2FEST_DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        HOST=os.environ.get('BOOK2FEST_DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_REPLICA = 'replica' if 'replica' in DATABASES else None
+
+DATABASE_ROUTERS = ['book2fest.routers.PrimaryReplicaRouter']
+
+# seconds the reads of a client stay on the primary after a write
+REPLICA_PIN_SECONDS = 5
+
+# PRAGMAs run on every new SQLite connection: the defaults are in book2fest.sqlite.SQLITE_PRAGMAS,
+# SQLITE_PRAGMAS here overrides some of them, e.g. {'busy_timeout': 10000}
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# The local memory cache is per process: with several workers use a shared backend, e.g.
+#   BOOK2FEST_CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache BOOK2FEST_CACHE_LOCATION=127.0.0.1:11211
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('BOOK2FEST_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('BOOK2FEST_CACHE_LOCATION', 'book2fest'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# seconds anonymous pages and event page fragments are cached, see book2fest.caching
+PAGE_CACHE_TIMEOUT = 5 * 60
+
+FRAGMENT_CACHE_TIMEOUT = 10 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -137,4 +187,42 @@ LOGIN_URL = 'login'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-MEDIA_URL = '/media/'
\ No newline at end of file
+MEDIA_URL = '/media/'
+
+# Query profiling: count SQL queries per view and warn when a view goes over its budget.
+# The async views (ASYNC_VIEWS) go over it until the workers of their pool are connected, see book2fest.aio
+QUERY_PROFILING = DEBUG
+
+QUERY_BUDGETS = {
+    'homepage': 8,
+    'book2fest:event-list': 5,
+    'book2fest:event-detail': 14,
+    'book2fest:ticket-list': 5,
+    'book2fest:manage-seat': 8,
+    'book2fest:artist-list': 5,
+}
+
+# Notification fan-out: recipients are notified in batches by a background thread pool after commit
+NOTIFICATION_FANOUT_ASYNC = True
+
+NOTIFICATION_FANOUT_WORKERS = 2
+
+# Resized derivatives of the uploaded images, generated by a pool of worker threads
+IMAGE_WORKERS = 4
+
+# Seat holds: seconds a held seat is reserved to the holder, and seats a user can hold per event
+SEAT_HOLD_TTL = 5 * 60
+
+SEAT_HOLDS_PER_USER = 4
+
+# Live seat updates (server-sent events, under ASGI): seconds between keep-alive comments, and deltas
+# queued per stream before a slow client is told to reload
+SSE_HEARTBEAT = 15
+
+SSE_QUEUE_SIZE = 100
+
+# Async read-heavy pages (under ASGI, see book2fest.aio): served by async views whose queries run in a
+# pool of ASYNC_VIEWS_WORKERS threads, each with its own database connection
+ASYNC_VIEWS = os.environ.get('BOOK2FEST_ASYNC_VIEWS', '0') == '1'
+
+ASYNC_VIEWS_WORKERS = int(os.environ.get('BOOK2FEST_ASYNC_VIEWS_WORKERS', 8))
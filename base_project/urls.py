@@ -20,12 +20,13 @@ from django.urls import path, include
 from django.contrib.auth import views as auth_views
 
 import book2fest.views
+from book2fest.aio import page_view
 from base_project import settings
 from base_project.views import UserCreationView
 import notifications.urls
 
 urlpatterns = [
-    path('', book2fest.views.HomeView.as_view(), name='homepage'),
+    path('', page_view(book2fest.views.HomeView), name='homepage'),
     path('register/', UserCreationView.as_view(), name='user-create'),
     path('admin/', admin.site.urls),
     path('login/', auth_views.LoginView.as_view(), name='login'),
@@ -0,0 +1,70 @@
+""" Best available seat allocation (book2fest.allocator) against scanning the seat map for adjacent seats.
+
+    The event has --rows rows of --seats-per-row seats, more expensive towards the stage, and a
+    random --booked share of them is booked beforehand. Every lookup asks for 1 to 8 adjacent
+    seats up to a random price: on the free-seat index synced with the cache (find_block), on the
+    index alone, and by scanning the cached seat map (book2fest.seatmap.adjacent_seats, which only
+    finds the first block). Then the time to update the index after a booking, incrementally or by
+    building it again.
+
+        python -m benchmarks.allocator --rows 26 --seats-per-row 1500 --booked 0.4"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import setup_django, create_event, create_seats
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (f'p50 {statistics.median(samples) * 1e6:8.1f} us, '
+            f'p99 {samples[int(len(samples) * 0.99) - 1] * 1e6:8.1f} us')
+
+
+def measure(func, calls):
+    """ Percentiles of the time of func(*args) for the args of the calls"""
+    samples = []
+    for args in calls:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=26)
+    parser.add_argument('--seats-per-row', type=int, default=1500)
+    parser.add_argument('--booked', type=float, default=0.4)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from book2fest import allocator, seatmap
+    from book2fest.models import Seat
+
+    random.seed(0)
+    event = create_event(max_capacity=args.rows * args.seats_per_row)
+    create_seats(event, rows=args.rows, per_row=args.seats_per_row)
+    for r in range(args.rows):
+        Seat.objects.filter(event=event, row=chr(ord('A') + r)).update(price=100.0 - 3 * r)
+    seat_ids = list(Seat.objects.filter(event=event).values_list('pk', flat=True))
+    Seat.objects.filter(pk__in=random.sample(seat_ids, int(len(seat_ids) * args.booked))).update(available=False)
+
+    seat_map = seatmap.get_seat_map(event.pk)
+    index = allocator.get_index(event.pk)
+    requests = [(random.randint(1, 8), random.choice([None, random.randint(25, 100)])) for __ in range(args.lookups)]
+
+    print(f'{"find_block":>22}: {measure(lambda q, p: allocator.find_block(event.pk, q, p), requests)}')
+    print(f'{"best_block":>22}: {measure(lambda q, p: allocator.best_block(index, q, p), requests)}')
+    print(f'{"seat map scan":>22}: {measure(lambda q, p: seatmap.adjacent_seats(seatmap.get_seat_map(event.pk), q), requests)}')
+
+    free = [seat[seatmap.SEAT_PK] for row in seat_map['rows'] for seat in row['seats'] if seat[seatmap.SEAT_AVAILABLE]]
+    bookings = [(random.sample(free, 4),) for __ in range(100)]
+    print(f'{"incremental update":>22}: {measure(lambda seats: (allocator.seats_taken(event.pk, seats), allocator.get_index(event.pk)), bookings)}')
+    print(f'{"rebuild":>22}: {measure(lambda seats: allocator.build_index(seatmap.get_seat_map(event.pk)), bookings)}')
+
+
+if __name__ == '__main__':
+    main()
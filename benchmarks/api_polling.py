@@ -0,0 +1,64 @@
+""" Polling the seat availability of an event: the event page against the JSON API (book2fest.api),
+    answered in full or with 304 Not Modified to a client sending the ETag it has.
+
+    Every poll is a GET with the Django test client, bookings happen every --change polls so
+    that the ETag of the API changes now and then. Reports time, queries and bytes per poll.
+
+        python -m benchmarks.api_polling --polls 500 --seats 2000"""
+import argparse
+
+from benchmarks.common import setup_django, create_event, create_buyers, create_seats, create_delivery, timed
+
+
+def poll(client, url, polls, change, book, etag=False):
+    from book2fest.middleware import QueryRecorder
+
+    recorder = QueryRecorder()
+    size, elapsed, not_modified, headers = 0, 0.0, 0, {}
+    for i in range(polls):
+        if i and i % change == 0:
+            book()
+        with recorder.record():
+            response, seconds = timed(client.get, url, **headers)
+        elapsed += seconds
+        size += len(response.content)
+        not_modified += response.status_code == 304
+        if etag and response.has_header('ETag'):
+            headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+    return (f'{elapsed / polls * 1000:6.2f} ms, {recorder.count / polls:5.2f} queries, {size / polls:8.0f} bytes per poll'
+            f', {not_modified} not modified')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--polls', type=int, default=500)
+    parser.add_argument('--seats', type=int, default=2000)
+    parser.add_argument('--change', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import reverse
+    from book2fest.booking import book_seat
+    from book2fest.models import Seat
+
+    settings.QUERY_PROFILING = False
+    event = create_event(max_capacity=args.seats)
+    create_seats(event, rows=max(1, args.seats // 100), per_row=min(args.seats, 100))
+    buyer, delivery = create_buyers(1)[0], create_delivery()
+    seats = iter(Seat.objects.filter(event=event).order_by('pk'))
+
+    def book():
+        book_seat(buyer, event, next(seats), delivery)
+
+    client = Client(HTTP_HOST='localhost')
+    page = reverse('book2fest:event-detail', kwargs={'pk': event.pk})
+    api = reverse('book2fest:api-event-availability', kwargs={'pk': event.pk})
+    print(f'{"event page":>16}: {poll(client, page, args.polls, args.change, book)}')
+    print(f'{"API":>16}: {poll(client, api, args.polls, args.change, book)}')
+    print(f'{"API with ETag":>16}: {poll(client, api, args.polls, args.change, book, etag=True)}')
+
+
+if __name__ == '__main__':
+    main()
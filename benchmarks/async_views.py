@@ -0,0 +1,181 @@
+""" Latency of the read-heavy pages (home page, event list, event page, artist list) under
+    concurrent load: WSGI with a pool of threads, ASGI with the sync views, and ASGI with the async
+    views of book2fest.aio.
+
+    --clients logged users (their pages are not cached) GET the pages in turn, without the
+    network: the WSGI handler is called from --threads threads like a threaded WSGI server, the
+    ASGI application is called in one event loop like an ASGI server. Every mode runs in a process
+    of its own. SQLite answers in microseconds from the same process: --db-latency adds a round
+    trip of that many milliseconds to every query, like a database server over the network.
+
+        python -m benchmarks.async_views --clients 32 --requests 40 --db-latency 2"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, create_event, create_seats
+
+MODES = {
+    'wsgi': 'WSGI, sync views',
+    'asgi': 'ASGI, sync views',
+    'asgi-async': 'ASGI, async views',
+}
+
+
+def create_catalogue(events, artists):
+    """ Events with seats and artists, and the session cookie of a logged user"""
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY
+    from book2fest.models import Artist, Genre, Category, UserProfile
+
+    genre = Genre.objects.create(name='bench-genre', category=Category.objects.create(name='bench-category'))
+    Artist.objects.bulk_create([Artist(full_name=f'bench-artist-{i}', genre=genre, image='images/bench.jpg')
+                                for i in range(artists)])
+    artist_list = list(Artist.objects.order_by('pk'))
+    catalogue = []
+    for i in range(events):
+        event = create_event(max_capacity=100, days=i + 1, name=f'bench-event-{i}')
+        create_seats(event, rows=2, per_row=50)
+        event.artist_list.add(*artist_list[i % artists:i % artists + 5])
+        catalogue.append(event)
+
+    user = User.objects.create(username='bench-user')
+    UserProfile.objects.create(user=user)
+    session = SessionStore()
+    session.update({SESSION_KEY: str(user.pk), BACKEND_SESSION_KEY: 'django.contrib.auth.backends.ModelBackend',
+                    HASH_SESSION_KEY: user.get_session_auth_hash()})
+    session.create()
+    return catalogue, session.session_key
+
+
+def add_db_latency(latency):
+    """ Sleep latency seconds in every query of every connection, the GIL is released meanwhile"""
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def wrap(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(wrap, weak=False)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (f'p50 {statistics.median(samples) * 1000:7.1f} ms, p99 {samples[int(len(samples) * 0.99) - 1] * 1000:7.1f} ms, '
+            f'max {samples[-1] * 1000:7.1f} ms')
+
+
+def wsgi_client(threads):
+    """ Coroutine function GETting a path from the WSGI handler in a pool of threads: (status, body)"""
+    from django.core.handlers.wsgi import WSGIHandler
+    from wsgiref.util import setup_testing_defaults
+
+    handler, pool = WSGIHandler(), ThreadPoolExecutor(max_workers=threads)
+
+    def get(path, cookie):
+        environ = {'PATH_INFO': path, 'HTTP_HOST': 'localhost', 'HTTP_COOKIE': cookie}
+        setup_testing_defaults(environ)
+        status = []
+        body = b''.join(handler(environ, lambda code, headers, exc_info=None: status.append(int(code[:3]))))
+        return status[0], body
+
+    async def request(path, cookie):
+        return await asyncio.get_running_loop().run_in_executor(pool, get, path, cookie)
+
+    return request
+
+
+def asgi_client():
+    """ Coroutine function GETting a path from the ASGI application: (status, body)"""
+    from base_project.asgi import application
+
+    async def request(path, cookie):
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'scheme': 'http',
+                 'server': ('localhost', 80), 'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())]}
+        status, body = [], []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            else:
+                body.append(message.get('body', b''))
+
+        await application(scope, receive, send)
+        return status[0], b''.join(body)
+
+    return request
+
+
+async def load(request, paths, cookie, clients, requests):
+    """ Latencies of clients * requests GETs, every client waiting for its response before the next GET"""
+    latencies = []
+
+    async def client(offset):
+        for i in range(requests):
+            start = time.perf_counter()
+            status, body = await request(paths[(offset + i) % len(paths)], cookie)
+            latencies.append(time.perf_counter() - start)
+            assert status == 200, (status, body[:200])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(clients)))
+    return latencies, time.perf_counter() - start
+
+
+def run_mode(mode, args):
+    setup_django()
+    from django.conf import settings
+    from django.urls import reverse
+
+    settings.QUERY_PROFILING = False
+    catalogue, session_key = create_catalogue(args.events, args.artists)
+    if args.db_latency:
+        add_db_latency(args.db_latency / 1000)
+    paths = [reverse('homepage'), reverse('book2fest:event-list'), reverse('book2fest:artist-list')] + \
+        [reverse('book2fest:event-detail', kwargs={'pk': event.pk}) for event in catalogue[:5]]
+    cookie = f'{settings.SESSION_COOKIE_NAME}={session_key}'
+    request = wsgi_client(args.threads) if mode == 'wsgi' else asgi_client()
+
+    async def bench():
+        await load(request, paths, cookie, 1, len(paths))  # warm up
+        return await load(request, paths, cookie, args.clients, args.requests)
+
+    latencies, elapsed = asyncio.run(bench())
+    print(f'{MODES[mode]:>18}: {percentiles(latencies)}, {len(latencies) / elapsed:6.0f} requests/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=40, help='requests per client')
+    parser.add_argument('--threads', type=int, default=8, help='threads of the WSGI server')
+    parser.add_argument('--db-latency', type=float, default=0.0, help='milliseconds added to every query')
+    parser.add_argument('--events', type=int, default=30)
+    parser.add_argument('--artists', type=int, default=50)
+    parser.add_argument('--mode', choices=MODES)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args.mode, args)
+
+    print(f'{args.clients} clients, {args.requests} requests each, {args.db_latency} ms per query')
+    for mode in MODES:
+        env = dict(os.environ, BOOK2FEST_ASYNC_VIEWS='1' if mode == 'asgi-async' else '0')
+        subprocess.run([sys.executable, '-m', 'benchmarks.async_views', '--mode', mode] + sys.argv[1:], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
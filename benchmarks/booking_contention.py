@@ -0,0 +1,81 @@
+""" Multi-threaded contention benchmark for book2fest.booking.book_seat.
+
+    A pool of buyers hammers the seats of one event, every buyer trying to book random seats.
+    Reports successful bookings per second and the number of double-sells (must be zero).
+
+        python -m benchmarks.booking_contention --seats 200 --threads 8 --attempts 100"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import setup_django, create_event, create_buyers, create_seats, create_delivery
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seats', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=100, help='booking attempts per thread')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from book2fest.booking import book_seat
+    from book2fest.models import Ticket, Seat
+
+    per_row = 20
+    event = create_event(max_capacity=args.seats)
+    seats = create_seats(event, rows=(args.seats + per_row - 1) // per_row, per_row=per_row)[:args.seats]
+    buyers = create_buyers(args.threads)
+    delivery = create_delivery()
+
+    wins = Counter()    # seat pk -> number of buyers that were told they got it
+    errors = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def buyer(profile):
+        rnd = random.Random(profile.pk)
+        barrier.wait()
+        try:
+            for __ in range(args.attempts):
+                seat = rnd.choice(seats)
+                try:
+                    ticket, __ = book_seat(profile, event, seat, delivery)
+                except Exception as e:  # e.g. database is locked
+                    with lock:
+                        errors[type(e).__name__] += 1
+                    continue
+                if ticket:
+                    with lock:
+                        wins[seat.pk] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buyer, args=(profile,)) for profile in buyers]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    booked = sum(wins.values())
+    double_sells = sum(count - 1 for count in wins.values() if count > 1)
+    tickets = Ticket.objects.filter(seat__event=event).count()
+    unavailable = Seat.objects.filter(event=event, available=False).count()
+
+    print(f'threads={args.threads} seats={len(seats)} attempts={args.threads * args.attempts}')
+    print(f'successful bookings: {booked} in {elapsed:.2f}s ({booked / elapsed:.1f} bookings/s)')
+    print(f'tickets in db: {tickets}, unavailable seats: {unavailable}')
+    print(f'double-sells: {double_sells}')
+    if errors:
+        print(f'errors: {dict(errors)}')
+    if double_sells or tickets != booked or unavailable != booked:
+        raise SystemExit('inconsistent booking state')
+
+
+if __name__ == '__main__':
+    main()
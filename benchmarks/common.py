@@ -0,0 +1,72 @@
+""" Shared helpers for the benchmark scripts.
+
+    Every benchmark runs against a throwaway SQLite file, never against db.sqlite3.
+    Run them from the project root, e.g. `python -m benchmarks.booking_contention`"""
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+import django
+
+
+def setup_django(db_name=None):
+    """ Point the default database to a temporary file, then migrate it"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base_project.settings')
+    from django.conf import settings
+
+    if db_name is None:
+        db_name = os.path.join(tempfile.mkdtemp(prefix='book2fest-bench-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = db_name
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_name
+
+
+def create_event(max_capacity, days=10, name='bench-event'):
+    """ Create an organizer and a future event owned by it"""
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from book2fest.models import OrganizerProfile, EventProfile
+
+    user, __ = User.objects.get_or_create(username='bench-organizer')
+    organizer, __ = OrganizerProfile.objects.get_or_create(user=user, company='bench', short_bio='bench')
+    start = timezone.now() + timedelta(days=days)
+    return EventProfile.objects.create(user=organizer, event_name=name, max_capacity=max_capacity,
+                                       event_start=start, event_end=start, avg_rating=0.0)
+
+
+def create_buyers(total):
+    """ Create `total` user profiles"""
+    from django.contrib.auth.models import User
+    from book2fest.models import UserProfile
+
+    User.objects.bulk_create([User(username=f'bench-user-{i}') for i in range(total)])
+    users = User.objects.filter(username__startswith='bench-user-').order_by('pk')
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+    return list(UserProfile.objects.order_by('pk'))
+
+
+def create_seats(event, rows, per_row, price=10.0):
+    """ Bulk create rows * per_row available seats for the event"""
+    from book2fest.models import Seat, SeatType
+
+    seat_type, __ = SeatType.objects.get_or_create(name='bench-seat-type')
+    Seat.objects.bulk_create([Seat(event=event, row=chr(ord('A') + r), number=n, price=price, seat_type=seat_type)
+                              for r in range(rows) for n in range(per_row)], batch_size=1000)
+    return list(Seat.objects.filter(event=event).order_by('pk'))
+
+
+def create_delivery():
+    from book2fest.models import Delivery
+
+    return Delivery.objects.create(name='bench-delivery', overprice=0.0, delivery_time=timedelta(days=1))
+
+
+def timed(func, *args, **kwargs):
+    """ Return (result, elapsed seconds) of func(*args, **kwargs)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,59 @@
+""" Import of a festival (book2fest.importer) against creating its objects one by one like the forms
+    of the site do: an artist at a time, then the event, its artists and a row of seats at a time.
+
+        python -m benchmarks.event_import --artists 200 --rows 26 --seats-per-row 1500"""
+import argparse
+
+from benchmarks.common import setup_django, create_event, timed
+
+
+def festival(name, artists, rows, seats_per_row):
+    return {'event_name': name, 'brief_description': "bench", 'description': "bench", 'city': "bench",
+            'province': "BE", 'cap': "00000", 'country': "bench", 'address': "bench", 'how_to_reach': "bench",
+            'max_capacity': rows * seats_per_row, 'event_start': "2030-07-01T20:00", 'event_end': "2030-07-03T23:00",
+            'artists': [{'full_name': f'{name} artist {i}', 'genre': 'bench-genre'} for i in range(artists)],
+            'seats': [{'rows': [chr(ord('A') + r) for r in range(rows)], 'seats_per_row': seats_per_row,
+                       'seat_type': 'bench-seat-type', 'price': 30}]}
+
+
+def one_by_one(organizer, entry):
+    from book2fest.models import Artist, Genre, SeatType
+    from book2fest.views import add_seats
+
+    genre = Genre.objects.get(name='bench-genre')
+    artists = [Artist.objects.create(full_name=artist['full_name'], genre=genre) for artist in entry['artists']]
+    event = create_event(max_capacity=entry['max_capacity'], name=entry['event_name'])
+    for artist in artists:
+        event.artist_list.add(artist)
+    seat_type, __ = SeatType.objects.get_or_create(name='bench-seat-type')
+    for block in entry['seats']:
+        for row in block['rows']:
+            add_seats(block['seats_per_row'], block['price'], row, seat_type, event)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=26)
+    parser.add_argument('--seats-per-row', type=int, default=1500)
+    args = parser.parse_args()
+
+    setup_django()
+    from book2fest.importer import import_events, summary
+    from book2fest.middleware import QueryRecorder
+    from book2fest.models import Genre, Category
+
+    Genre.objects.create(name='bench-genre', category=Category.objects.create(name='bench-category'))
+    organizer = create_event(max_capacity=0).user
+
+    for label, run in (('one by one', lambda entry: one_by_one(organizer, entry)),
+                       ('import', lambda entry: print(f'{"":>12}{summary(import_events(organizer, [entry]))}'))):
+        entry = festival(label, args.artists, args.rows, args.seats_per_row)
+        recorder = QueryRecorder()
+        with recorder.record():
+            __, elapsed = timed(run, entry)
+        print(f'{label:>10}: {elapsed:.2f}s, {recorder.count} queries')
+
+
+if __name__ == '__main__':
+    main()
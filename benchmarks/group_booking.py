@@ -0,0 +1,79 @@
+""" Group booking (book2fest.booking.book_seats) against booking the seats of the group one per request.
+
+    Every group books --size seats of an event through the views, with the Django test client:
+    either the event page and its booking form once per seat, or the event page once and a single
+    JSON POST to the group booking endpoint. Reports requests, queries and time per group.
+
+        python -m benchmarks.group_booking --groups 50 --size 6"""
+import argparse
+import json
+import logging
+
+from benchmarks.common import setup_django, create_event, create_buyers, create_seats, create_delivery, timed
+
+
+def single_bookings(client, event, group, delivery):
+    from django.urls import reverse
+
+    url = reverse('book2fest:event-detail', kwargs={'pk': event.pk})
+    for seat in group:
+        client.get(url)  # the seat map again, to choose the next seat
+        client.post(url, {'seat': seat.pk, 'delivery': delivery.pk})
+    return 2 * len(group)
+
+
+def group_booking(client, event, group, delivery):
+    from django.urls import reverse
+
+    client.get(reverse('book2fest:event-detail', kwargs={'pk': event.pk}))
+    response = client.post(reverse('book2fest:event-group-booking', kwargs={'pk': event.pk}),
+                           json.dumps({'seats': [seat.pk for seat in group], 'delivery': delivery.pk}),
+                           content_type='application/json', HTTP_ACCEPT='application/json')
+    assert response.json()['booked'], response.json()
+    return 2
+
+
+def run(book, event, buyers, delivery, size):
+    from django.test import Client
+    from book2fest.middleware import QueryRecorder
+    from book2fest.models import Seat, Ticket
+
+    seats = list(Seat.objects.filter(event=event).order_by('pk'))
+    requests, elapsed = 0, 0.0
+    recorder = QueryRecorder()
+    for i, buyer in enumerate(buyers):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(buyer.user)
+        with recorder.record():
+            sent, seconds = timed(book, client, event, seats[i * size:(i + 1) * size], delivery)
+        requests += sent
+        elapsed += seconds
+
+    assert Ticket.objects.filter(seat__event=event).count() == len(buyers) * size
+    groups = len(buyers)
+    return (f'{requests / groups:.0f} requests, {recorder.count / groups:.0f} queries, '
+            f'{elapsed / groups * 1000:.1f} ms per group')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--size', type=int, default=6)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    settings.QUERY_PROFILING = False
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    buyers = create_buyers(args.groups)
+    delivery = create_delivery()
+
+    for label, book in (('one seat per request', single_bookings), ('group booking', group_booking)):
+        event = create_event(max_capacity=args.groups * args.size, name=f'bench-{label}')
+        create_seats(event, rows=1, per_row=args.groups * args.size)
+        print(f'{label:>20}: {run(book, event, buyers, delivery, args.size)}')
+
+
+if __name__ == '__main__':
+    main()
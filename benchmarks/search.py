@@ -0,0 +1,65 @@
+""" Compare LIKE lookups with the FTS5 index of book2fest.search on a large catalogue.
+
+        python -m benchmarks.search --events 100000"""
+import argparse
+import random
+
+from benchmarks.common import setup_django, create_event, timed
+
+WORDS = ['summer', 'winter', 'rock', 'jazz', 'festival', 'night', 'live', 'open', 'air', 'tour', 'arena',
+         'electronic', 'classic', 'sound', 'wave', 'beach', 'city', 'dance', 'party', 'stage']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from book2fest.models import EventProfile, Artist, Genre, Category
+    from book2fest.search import search_events, rebuild_index, fts_enabled, EVENT_LOOKUPS
+
+    if not fts_enabled():
+        raise SystemExit('FTS5 is not available on this SQLite build')
+
+    rnd = random.Random(0)
+    organizer = create_event(max_capacity=1).user
+    categories = [Category.objects.create(name=name) for name in ('Music', 'Comedy', 'Theatre', 'Sport')]
+    genres = [Genre.objects.create(name=f'{rnd.choice(WORDS)}{i}', category=rnd.choice(categories)) for i in range(40)]
+    Artist.objects.bulk_create([Artist(full_name=f'{rnd.choice(WORDS).title()} Artist{i}', genre=rnd.choice(genres),
+                                       image='images/red.jpg') for i in range(args.artists)])
+    artists = list(Artist.objects.values_list('pk', flat=True))
+
+    now = timezone.now()
+    EventProfile.objects.bulk_create([
+        EventProfile(user=organizer, event_name=' '.join(rnd.sample(WORDS, 3)) + f' {i}', brief_description='',
+                     description=' '.join(rnd.choices(WORDS, k=30)), max_capacity=1, event_start=now, event_end=now)
+        for i in range(args.events)], batch_size=2000)
+    through = EventProfile.artist_list.through
+    through.objects.bulk_create([through(eventprofile_id=pk, artist_id=artist)
+                                 for pk in EventProfile.objects.values_list('pk', flat=True)
+                                 for artist in rnd.sample(artists, 3)], batch_size=5000)
+    __, elapsed = timed(rebuild_index)
+    print(f'{args.events} events, {args.artists} artists, index built in {elapsed:.2f}s')
+
+    searches = [('event_name', 'jazz'), ('artist', 'Artist12'), ('genre', genres[0].name), ('category', 'Comedy')]
+    for field, query in searches:
+        def like():
+            return EventProfile.objects.filter(**{EVENT_LOOKUPS[field]: query}).distinct().count()
+
+        def fts():
+            return EventProfile.objects.filter(pk__in=search_events(query, field)).count()
+
+        for name, func in (('LIKE', like), ('FTS5', fts)):
+            total = 0.0
+            for __ in range(args.repeat):
+                found, elapsed = timed(func)
+                total += elapsed
+            print(f'{field:10} {query!r:14} {name}: {found:6} events, {total / args.repeat * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+""" Time the creation of a large seat map with book2fest.seating.generate_seats,
+    compared with one INSERT per seat (the former add_seats loop) on a sample.
+
+        python -m benchmarks.seat_generation --seats 50000"""
+import argparse
+
+from benchmarks.common import setup_django, create_event, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seats', type=int, default=50000)
+    parser.add_argument('--per-row', type=int, default=2000, help='seats per row (at most 26 rows)')
+    parser.add_argument('--sample', type=int, default=2000, help='seats created one by one for comparison')
+    args = parser.parse_args()
+
+    setup_django()
+    from book2fest.models import Seat, SeatType
+    from book2fest.seating import generate_seats, SeatBlock
+
+    seat_type = SeatType.objects.create(name='bench-seat-type')
+    rows = [chr(ord('A') + r) for r in range(-(-args.seats // args.per_row))]
+
+    event = create_event(max_capacity=args.seats)
+    (flag, msg), elapsed = timed(generate_seats, event, [SeatBlock(rows, args.per_row, seat_type, 10.0)])
+    assert flag, msg
+    created = Seat.objects.filter(event=event).count()
+    print(f'generate_seats: {created} seats in {elapsed:.2f}s ({created / elapsed:.0f} seats/s)')
+
+    def one_by_one(event, total):
+        for number in range(total):
+            Seat(event=event, row='A', number=number, price=10.0, seat_type=seat_type, available=True).save()
+
+    event = create_event(max_capacity=args.sample, name='bench-loop')
+    __, elapsed = timed(one_by_one, event, args.sample)
+    print(f'Seat.save() loop: {args.sample} seats in {elapsed:.2f}s ({args.sample / elapsed:.0f} seats/s, '
+          f'~{args.seats * elapsed / args.sample:.1f}s for {args.seats} seats)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+""" Load simulation of booking with and without seat holds.
+
+    Buyers arrive in waves: the buyers of a wave look at the same seat map, each one picks a
+    random free seat and tries to get it, re-reading the seat map after a failure. Without holds
+    buyers go straight to the booking; with holds they first hold the seat and book it once the
+    hold is granted. Reports the failed booking rate and the database writes of both strategies.
+
+        python -m benchmarks.seat_holds --seats 500 --buyers 450 --wave 50"""
+import argparse
+import random
+import time
+
+from benchmarks.common import setup_django, create_event, create_buyers, create_seats, create_delivery
+
+
+def simulate(event, buyers, delivery, wave, retries, use_holds, seed=0):
+    from django.core.cache import cache
+    from book2fest.booking import book_seat
+    from book2fest.holds import place_hold
+    from book2fest.middleware import QueryRecorder
+    from book2fest.models import Seat
+    from book2fest.seatmap import get_seat_map, seat_choices
+
+    rnd = random.Random(seed)
+    seats = Seat.objects.in_bulk(Seat.objects.filter(event=event).values_list('pk', flat=True))
+    stats = {'bookings': 0, 'failed bookings': 0, 'holds': 0, 'failed holds': 0, 'gave up': 0}
+
+    def pick(holder, seat_map):
+        choices = seat_choices(seat_map, holder.pk)
+        return rnd.choice(choices)[0] if choices else None
+
+    recorder = QueryRecorder()
+    cache.clear()
+    start = time.perf_counter()
+    with recorder.record():
+        for first in range(0, len(buyers), wave):
+            group = buyers[first:first + wave]
+            snapshot = get_seat_map(event.pk)  # everybody in the wave sees the same seat map
+            chosen = []
+            for buyer in group:
+                seat_map = snapshot
+                for __ in range(retries):
+                    seat_id = pick(buyer, seat_map)
+                    if seat_id is None:
+                        break
+                    if use_holds:
+                        expires, __ = place_hold(buyer, event, seat_id)
+                        stats['holds'] += 1
+                        if expires:
+                            chosen.append((buyer, seat_id))
+                            break
+                        stats['failed holds'] += 1
+                    else:
+                        ticket, __ = book_seat(buyer, event, seats[seat_id], delivery)
+                        stats['bookings'] += 1
+                        if ticket:
+                            break
+                        stats['failed bookings'] += 1
+                    seat_map = get_seat_map(event.pk)
+                else:
+                    stats['gave up'] += 1
+
+            # with holds the buyers fill in the form and book the seat they hold
+            for buyer, seat_id in chosen:
+                ticket, __ = book_seat(buyer, event, seats[seat_id], delivery)
+                stats['bookings'] += 1
+                if not ticket:
+                    stats['failed bookings'] += 1
+    elapsed = time.perf_counter() - start
+
+    stats['db writes'] = sum(1 for sql, __ in recorder.queries if sql.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')))
+    stats['queries'] = recorder.count
+    stats['seconds'] = round(elapsed, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seats', type=int, default=500)
+    parser.add_argument('--buyers', type=int, default=450)
+    parser.add_argument('--wave', type=int, default=50, help='buyers looking at the same seat map')
+    parser.add_argument('--retries', type=int, default=5, help='attempts of a buyer before giving up')
+    args = parser.parse_args()
+
+    setup_django()
+    per_row = 25
+    buyers = create_buyers(args.buyers)
+    delivery = create_delivery()
+
+    for use_holds in (False, True):
+        event = create_event(max_capacity=args.seats, name=f'bench-event-{"holds" if use_holds else "no-holds"}')
+        create_seats(event, rows=(args.seats + per_row - 1) // per_row, per_row=per_row)
+        stats = simulate(event, buyers, delivery, args.wave, args.retries, use_holds)
+        rate = stats['failed bookings'] / stats['bookings'] if stats['bookings'] else 0.0
+        print(f'{"with holds   " if use_holds else "without holds"}: failed booking rate {rate:.1%}, '
+              + ', '.join(f'{key} {value}' for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
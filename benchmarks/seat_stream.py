@@ -0,0 +1,100 @@
+""" Fan-out of the live seat updates (book2fest.live) to many idle server-sent event streams.
+
+    --streams connections to the seat stream of an event are opened on the ASGI application
+    (base_project.asgi) in one event loop, like an ASGI server would, without the network. Then a
+    thread publishes --deltas bookings, like the booking views do after their commit, one every
+    --interval seconds. Reports the memory and the threads used by the idle streams, and the
+    latency from the publication of a delta to its write on the streams.
+
+        python -m benchmarks.seat_stream --streams 5000 --deltas 50"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django, create_event, create_seats
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (f'p50 {statistics.median(samples) * 1000:7.2f} ms, p99 {samples[int(len(samples) * 0.99) - 1] * 1000:7.2f} ms, '
+            f'max {samples[-1] * 1000:7.2f} ms')
+
+
+async def run(application, path, event_id, streams, deltas, interval):
+    from book2fest import live
+
+    # time and body of the writes of the streams, parsed at the end to keep send() cheap. Two lists
+    # of floats and bytes, which the garbage collector does not track, rather than a list of tuples
+    times, bodies = [], []
+    closed = asyncio.Event()
+
+    async def receive():
+        await closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        times.append(time.perf_counter())
+        bodies.append(message.get('body', b''))
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': [], 'query_string': b''}
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    threads = threading.active_count()
+    tasks = [asyncio.ensure_future(application(scope, receive, send)) for __ in range(streams)]
+    while live.subscribers(event_id) < streams:
+        await asyncio.sleep(0.05)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f'{streams} streams open: {memory / streams / 1024:.1f} KiB each, '
+          f'{threading.active_count() - threads} more threads')
+
+    def publisher():
+        for i in range(deltas):
+            time.sleep(interval)
+            live.publish(event_id, {'booked': [i], 'sent': time.perf_counter()})
+
+    await asyncio.to_thread(publisher)
+    await asyncio.sleep(1)
+    closed.set()
+    await asyncio.gather(*tasks)
+
+    latencies, last = [], {}  # last write of every delta, for the fan-out time of the whole delta
+    for written, body in zip(times, bodies):
+        for line in body.split(b'\n'):
+            if line.startswith(b'data: {"booked"'):
+                sent = json.loads(line[6:])['sent']
+                latencies.append(written - sent)
+                last[sent] = max(written, last.get(sent, 0))
+    assert len(latencies) == deltas * streams, len(latencies)
+
+    print(f'{"per stream":>12}: {percentiles(latencies)}')
+    print(f'{"whole delta":>12}: {percentiles([write - sent for sent, write in last.items()])}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=5000)
+    parser.add_argument('--deltas', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.2)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from book2fest.seatmap import get_seat_map
+
+    event = create_event(max_capacity=100)
+    create_seats(event, rows=1, per_row=100)
+    get_seat_map(event.pk)
+
+    from base_project.asgi import application
+
+    path = reverse('book2fest:event-seat-stream', kwargs={'pk': event.pk})
+    asyncio.run(run(application, path, event.pk, args.streams, args.deltas, args.interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+""" EventList read throughput while a writer books seats, with the default SQLite settings
+    (rollback journal) and with the PRAGMAs of book2fest.sqlite (WAL).
+
+    Reader processes GET the event list in a loop while one writer process books the seats of an
+    event one by one. Reports reads/s, read latency, bookings/s and "database is locked" errors.
+
+        python -m benchmarks.sqlite_concurrency --readers 4 --seconds 5"""
+import argparse
+import logging
+import multiprocessing
+import statistics
+import time
+from collections import Counter
+
+from benchmarks.common import setup_django, create_event, create_buyers, create_seats, create_delivery
+
+# SQLite defaults, the lock timeout is the one of the Python driver (5s)
+ROLLBACK_JOURNAL = {'journal_mode': 'delete', 'synchronous': 'full', 'mmap_size': 0, 'cache_size': -2000,
+                    'busy_timeout': 5000}
+
+
+def reader(url, stop, results):
+    from django.db import connection
+    from django.test import Client
+
+    client = Client(HTTP_HOST='localhost')
+    latencies, errors = [], Counter()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            response = client.get(url)
+            assert response.status_code == 200
+        except Exception as e:  # e.g. database is locked
+            errors[f'read: {e}'] += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    results.put((latencies, 0, errors))
+
+
+def writer(event, seats, buyer, delivery, stop, results):
+    from django.db import connection
+    from book2fest.booking import book_seat
+
+    bookings, errors = 0, Counter()
+    for seat in seats:
+        if stop.is_set():
+            break
+        try:
+            ticket, __ = book_seat(buyer, event, seat, delivery)
+        except Exception as e:
+            errors[f'write: {e}'] += 1
+            continue
+        bookings += bool(ticket)
+    connection.close()
+    results.put(([], bookings, errors))
+
+
+def run(event, seats, buyer, delivery, readers, seconds, pragmas):
+    """ Run the readers and the writer in their own processes, like the workers of an app server"""
+    from django.conf import settings
+    from django.db import connections
+    from django.urls import reverse
+
+    settings.SQLITE_PRAGMAS = pragmas
+    connections.close_all()  # the processes open new connections, with the new PRAGMAs
+
+    context = multiprocessing.get_context('fork')
+    stop, results = context.Event(), context.Queue()
+    url = reverse('book2fest:event-list')
+    processes = ([context.Process(target=reader, args=(url, stop, results)) for __ in range(readers)]
+                 + [context.Process(target=writer, args=(event, seats, buyer, delivery, stop, results))])
+    for process in processes:
+        process.start()
+    time.sleep(seconds)
+    stop.set()
+
+    latencies, bookings, errors = [], 0, Counter()
+    for __ in processes:
+        process_latencies, process_bookings, process_errors = results.get()
+        latencies += process_latencies
+        bookings += process_bookings
+        errors.update(process_errors)
+    for process in processes:
+        process.join()
+
+    latencies.sort()
+    return {
+        'reads/s': round(len(latencies) / seconds, 1),
+        'read p50 ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'read p99 ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+        'bookings/s': round(bookings / seconds, 1),
+        'errors': dict(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--seats', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from book2fest.sqlite import pragmas
+
+    tuned = pragmas()
+    settings.QUERY_PROFILING = False
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # failed reads are counted
+    for i in range(args.events - 1):
+        create_event(max_capacity=1, name=f'bench-event-{i}')
+    buyer = create_buyers(1)[0]
+    delivery = create_delivery()
+
+    for label, pragma_set in (('rollback journal', ROLLBACK_JOURNAL), ('SQLITE_PRAGMAS', tuned)):
+        event = create_event(max_capacity=args.seats, name=f'bench-booked-{label}')
+        seats = create_seats(event, rows=20, per_row=-(-args.seats // 20))
+        stats = run(event, seats, buyer, delivery, args.readers, args.seconds, pragma_set)
+        print(f'{label:>16}: ' + ', '.join(f'{key} {value}' for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+""" Memory and time of the ticket export of an event, streamed (book2fest.exports) and loaded at once
+    like the former ticket table of the event management page.
+
+        python -m benchmarks.ticket_export --tickets 100000"""
+import argparse
+import tracemalloc
+
+from benchmarks.common import setup_django, create_event, create_buyers, create_seats, create_delivery, timed
+
+
+def create_tickets(event, buyers, delivery):
+    """ Bulk create one ticket per seat of the event, for the buyers in turn"""
+    from book2fest.models import Seat, Ticket
+
+    seats = Seat.objects.filter(event=event).values_list('pk', flat=True)
+    Ticket.objects.bulk_create([Ticket(seat_id=seat_id, user=buyers[i % len(buyers)], delivery=delivery)
+                                for i, seat_id in enumerate(seats)], batch_size=1000)
+    Seat.objects.filter(event=event).update(available=False)
+
+
+def streamed(event):
+    from book2fest.exports import export_lines
+
+    size = 0
+    for line in export_lines(event, 'csv'):
+        size += len(line)
+    return size
+
+
+def loaded(event):
+    from book2fest.models import Ticket
+
+    tickets = list(Ticket.objects.filter(seat__event=event).attendees().select_related('delivery')
+                   .order_by('seat__row', 'seat__number'))
+    return sum(len(f'{t.seat.row},{t.seat.number},{t.seat.price},{t.user.user.email}') for t in tickets)
+
+
+def measure(func, event):
+    tracemalloc.start()
+    __, elapsed = timed(func, event)
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return f'{elapsed:.2f}s, peak memory {peak / 2 ** 20:.1f} MiB'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=100000)
+    parser.add_argument('--buyers', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    event = create_event(max_capacity=args.tickets)
+    create_seats(event, rows=20, per_row=-(-args.tickets // 20))
+    create_tickets(event, create_buyers(args.buyers), create_delivery())
+
+    print(f'streamed: {measure(streamed, event)}')
+    print(f'  loaded: {measure(loaded, event)}')
+
+
+if __name__ == '__main__':
+    main()
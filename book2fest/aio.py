@@ -0,0 +1,120 @@
+""" Async versions of the read-heavy pages (home page, event list, event page, artist list), served
+    by the ASGI application when settings.ASYNC_VIEWS is True.
+
+    Under ASGI, Django 3.2 runs every sync view in one and the same thread: a slow page holds up
+    all the others. The async views run their database work in a bounded pool of
+    ASYNC_VIEWS_WORKERS threads instead, and the queries of a page that do not depend on each other
+    (see AsyncViewMixin.get_concurrent_queries) run at the same time. Every worker keeps its own
+    database connection, so a process uses up to ASYNC_VIEWS_WORKERS connections more.
+
+    The pages run the queries of their sync views, within settings.QUERY_BUDGETS, once the workers
+    are connected. Until then a page also runs the PRAGMAs of every connection it opens (see
+    book2fest.sqlite), one per worker its queries land on: the first requests of a process, and the
+    ones after CONN_MAX_AGE, log a warning of the query profiling for going over budget.
+
+    The middleware of the project are async capable (see book2fest.middleware), so that the
+    requests reach the async views without going through the thread of the sync views."""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections
+
+ASYNC_VIEWS = getattr(settings, 'ASYNC_VIEWS', False)
+ASYNC_VIEWS_WORKERS = getattr(settings, 'ASYNC_VIEWS_WORKERS', 8)
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_VIEWS_WORKERS, thread_name_prefix='book2fest-aio')
+
+# query recorder of the request (see book2fest.middleware.QueryProfilingMiddleware), if profiled
+_recorder = contextvars.ContextVar('book2fest_query_recorder', default=None)
+
+
+@contextmanager
+def recording(recorder):
+    """ Record with the recorder the queries run in the pool by the calls of the block"""
+    token = _recorder.set(recorder)
+    try:
+        yield
+    finally:
+        _recorder.reset(token)
+
+
+def _call(func, args, kwargs):
+    # like a request: connections are closed if broken or past CONN_MAX_AGE, kept otherwise
+    close_old_connections()
+    try:
+        recorder = _recorder.get()
+        if recorder is None:
+            return func(*args, **kwargs)
+        with recorder.record():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(func, *args, **kwargs):
+    """ Result of func(*args, **kwargs) run in the pool. The context variables of the caller (e.g.
+        the pinning to the primary database, see book2fest.routers) follow the call"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, functools.partial(context.run, _call, func, args, kwargs))
+
+
+async def gather(*funcs):
+    """ List of the results of the callables, run concurrently in the pool"""
+    return await asyncio.gather(*(run(func) for func in funcs))
+
+
+def page_view(view_class):
+    """ View of the urls for the view class: the async one if settings.ASYNC_VIEWS"""
+    return view_class.as_async_view() if ASYNC_VIEWS else view_class.as_view()
+
+
+class AsyncViewMixin:
+    """ Read-only class-based view also served by an async function view, see as_async_view().
+
+        get_concurrent_queries() lists the queries of the page that do not depend on each other,
+        and query_results() returns their results: run concurrently by the async view before the
+        handler of the request, in turn by the sync view when first asked"""
+    prefetched = None
+
+    def get_concurrent_queries(self):
+        """ {name: callable} of the independent queries of a GET"""
+        return {}
+
+    def query_results(self):
+        if self.prefetched is None:
+            self.prefetched = {name: query() for name, query in self.get_concurrent_queries().items()}
+        return self.prefetched
+
+    @classmethod
+    def as_async_view(cls, **initkwargs):
+        """ Async function view of the class (class-based views are sync only in Django 3.2)"""
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            return await self.async_dispatch(request, *args, **kwargs)
+
+        view.view_class = cls
+        view.view_initkwargs = initkwargs
+        functools.update_wrapper(view, cls, updated=())
+        return view
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """ dispatch() of the async view. The handler of the method runs in the pool, where the
+            response is rendered too. dispatch() is not called: mixins overriding it have an
+            async_dispatch() of their own"""
+        method = request.method.lower()
+        if method not in self.http_method_names or not hasattr(self, method):
+            return self.http_method_not_allowed(request, *args, **kwargs)
+
+        if method in ('get', 'head'):
+            queries = self.get_concurrent_queries()
+            self.prefetched = dict(zip(queries, await gather(*queries.values())))
+        response = await run(getattr(self, method), request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = await run(response.render)
+        return response
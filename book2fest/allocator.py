@@ -0,0 +1,175 @@
+""" Free-seat index of an event, for the "best available" seat allocation.
+
+    The index lists, per seat type, the runs of free seats of the event: seats of a row with
+    consecutive numbers, the same price and type, not booked nor held. Runs are sorted from the best
+    to the worst: most expensive first, then by row and number, so the best block of seats within a
+    price is found with a bisection on the price and a scan for the first run long enough:
+
+        {'types': {seat type pk: {'keys': [[-price, row, first number], ...], 'seats': [[seat pk, ...], ...]}},
+         'where': {seat pk: (seat type pk, -price, row, number)}}
+
+    The index is built from the seat map (see book2fest.seatmap) and kept in the memory of the
+    process, it would take longer to read it from the cache than to search it. The cache holds its
+    version, the seats booked and held since it was built, which every process applies to its own
+    copy, and when it expires (it is not extended by the changes):
+
+        {'version': '<hex>', 'taken': [seat pk, ...], 'held': {seat pk: expiry timestamp}, 'expires': timestamp}
+
+    Bookings add their seats to the taken ones and holds to the held ones. A held seat is free again
+    when its hold expires: a copy that took held seats off is built again at the first expiry. New
+    seats, deleted tickets and released holds drop the version so that the index is built again. A
+    stale index is harmless: the seats it returns are claimed with a conditional update (see
+    book2fest.booking.book_best_available) which fails if any of them was taken."""
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+
+from django.core.cache import cache
+
+from book2fest import seatmap
+from book2fest.seatmap import SEAT_PK, SEAT_NUMBER, SEAT_PRICE, SEAT_TYPE, SEAT_AVAILABLE
+
+# taken seats logged before the index is built again from the seat map
+SEAT_INDEX_LOG_SIZE = 1000
+
+_indexes = {}  # event pk: [version, taken seats applied, index, first expiry of the holds applied]
+_lock = threading.Lock()
+
+
+def _cache_key(event_id):
+    return f'book2fest:seat-index:v2:{event_id}'
+
+
+def build_index(seat_map):
+    """ Free-seat index of the seat map"""
+    holds = seatmap.active_holds(seat_map)
+    runs = {}
+    for row in seat_map['rows']:
+        run = None
+        for seat in row['seats']:
+            free = (seat[SEAT_AVAILABLE] and str(seat[SEAT_PK]) not in holds and isinstance(seat[SEAT_NUMBER], int))
+            if not free:
+                run = None
+                continue
+            if (run is None or seat[SEAT_NUMBER] != run[2] + len(run[3]) or -seat[SEAT_PRICE] != run[0]
+                    or seat[SEAT_TYPE] != run[4]):
+                run = [-seat[SEAT_PRICE], row['row'], seat[SEAT_NUMBER], [], seat[SEAT_TYPE]]
+                runs.setdefault(seat[SEAT_TYPE], []).append(run)
+            run[3].append(seat[SEAT_PK])
+
+    index = {'types': {}, 'where': {}}
+    for seat_type, type_runs in runs.items():
+        type_runs.sort(key=lambda run: run[:3])
+        index['types'][seat_type] = {'keys': [run[:3] for run in type_runs], 'seats': [run[3] for run in type_runs]}
+        for price, row, number, seats, __ in type_runs:
+            for offset, seat in enumerate(seats):
+                index['where'][seat] = (seat_type, price, row, number + offset)
+    return index
+
+
+def take_seats(index, seat_ids):
+    """ Remove the seats from the index, splitting their runs"""
+    for seat in seat_ids:
+        where = index['where'].pop(seat, None)
+        if where is None:
+            continue
+        seat_type, price, row, number = where
+        runs = index['types'][seat_type]
+        position = bisect_right(runs['keys'], [price, row, number]) - 1
+        first, seats = runs['keys'][position][2], runs['seats'][position]
+        del runs['keys'][position], runs['seats'][position]
+        for start, part in ((first, seats[:number - first]), (number + 1, seats[number - first + 1:])):
+            if part:
+                runs['keys'].insert(position, [price, row, start])
+                runs['seats'].insert(position, part)
+                position += 1
+
+
+def best_block(index, quantity, max_price=None, seat_type=None):
+    """ pks of the best quantity adjacent free seats of the index costing at most max_price each,
+        of the seat type (pk) if given. None if there are none"""
+    best = None
+    for pk in [seat_type] if seat_type is not None else index['types']:
+        runs = index['types'].get(pk)
+        if runs is None:
+            continue
+        start = 0 if max_price is None else bisect_left(runs['keys'], [-max_price])
+        for position in range(start, len(runs['keys'])):
+            if len(runs['seats'][position]) >= quantity:
+                if best is None or runs['keys'][position] < best[0]:
+                    best = (runs['keys'][position], runs['seats'][position][:quantity])
+                break
+    return None if best is None else best[1]
+
+
+def _get_index(event_id, refresh):
+    key = _cache_key(event_id)
+    state = None if refresh else cache.get(key)
+    local = _indexes.get(event_id)
+    now = time.time()
+    if state is None or local is None or local[0] != state['version'] or local[3] <= now:
+        seat_map = seatmap.build_seat_map(event_id) if refresh else seatmap.get_seat_map(event_id)
+        if seat_map is None:
+            _indexes.pop(event_id, None)
+            return None
+        if state is None:
+            state = {'version': uuid.uuid4().hex, 'taken': [], 'held': {}, 'expires': now + seatmap.SEAT_MAP_TIMEOUT}
+            cache.set(key, state, seatmap.SEAT_MAP_TIMEOUT)
+        holds = seatmap.active_holds(seat_map, now)
+        local = _indexes[event_id] = [state['version'], 0, build_index(seat_map),
+                                      min((hold[0] for hold in holds.values()), default=float('inf'))]
+
+    take_seats(local[2], state['taken'][local[1]:])
+    local[1] = len(state['taken'])
+    held = {seat: expiry for seat, expiry in state['held'].items() if expiry > now}
+    take_seats(local[2], held)
+    local[3] = min([local[3], *held.values()])
+    return local[2]
+
+
+def get_index(event_id, refresh=False):
+    """ Return the free-seat index of the event, up to date with the seats taken so far.
+        None if the event does not exist.
+
+        A refreshed index is built from the db rather than from the cached seat map"""
+    with _lock:
+        return _get_index(event_id, refresh)
+
+
+def find_block(event_id, quantity, max_price=None, seat_type=None, refresh=False):
+    """ best_block() of the index of the event"""
+    with _lock:
+        index = _get_index(event_id, refresh)
+        return None if index is None else best_block(index, quantity, max_price=max_price, seat_type=seat_type)
+
+
+def _update(event_id, change):
+    """ Apply the change to the state of the indexes of the event, if any, without extending it"""
+    key = _cache_key(event_id)
+    state = cache.get(key)
+    if state is None:
+        return
+
+    change(state)
+    now = time.time()
+    state['held'] = {seat: expiry for seat, expiry in state['held'].items() if expiry > now}
+    if len(state['taken']) + len(state['held']) > SEAT_INDEX_LOG_SIZE or state['expires'] <= now:
+        cache.delete(key)  # built again from the seat map, which has all the bookings and holds
+    else:
+        cache.set(key, state, state['expires'] - now)
+
+
+def seats_taken(event_id, seat_ids):
+    """ Log the booked seats for the indexes of the event, if any"""
+    _update(event_id, lambda state: state['taken'].extend(seat_ids))
+
+
+def seats_held(event_id, seat_ids, expires_at):
+    """ Log the seats held until expires_at for the indexes of the event, if any: they are free again after"""
+    _update(event_id, lambda state: state['held'].update(dict.fromkeys(seat_ids, expires_at.timestamp())))
+
+
+def invalidate(event_id):
+    """ Drop the version of the index of the event: it will be built again"""
+    cache.delete(_cache_key(event_id))
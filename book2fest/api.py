@@ -0,0 +1,166 @@
+""" Read-only JSON API over the catalogue: events, artists, the seat availability and the rating
+    summary of an event.
+
+    Rows are serialized straight from values_list(), without building model instances. Clients
+    choose the fields with ?fields=name,city among the API fields of the resource, lists are
+    paginated with cursors (?cursor=, see book2fest.pagination).
+
+    Responses carry an ETag and a Last-Modified taken from the version of the event or of the
+    catalogue (see book2fest.caching), so polling clients get a 304 Not Modified until something
+    changes. Last-Modified has a resolution of a second, clients should send If-None-Match."""
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from book2fest import caching
+from book2fest.models import RatingSummary, EventProfile
+from book2fest.pagination import keyset_filter, encode_cursor, decode_cursor
+from book2fest.seatmap import SEAT_PRICE, SEAT_TYPE, SEAT_AVAILABLE
+
+API_PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 50)
+
+# API field: lookup of the model
+EVENT_FIELDS = {
+    'id': 'pk',
+    'name': 'event_name',
+    'brief_description': 'brief_description',
+    'description': 'description',
+    'city': 'city',
+    'province': 'province',
+    'country': 'country',
+    'address': 'address',
+    'how_to_reach': 'how_to_reach',
+    'start': 'event_start',
+    'end': 'event_end',
+    'max_capacity': 'max_capacity',
+    'seats_available': 'seats_available',
+    'avg_rating': 'avg_rating',
+    'rating_count': 'rating_count',
+    'cancelled': 'cancelled',
+}
+EVENT_LIST_FIELDS = ('id', 'name', 'city', 'start', 'end', 'seats_available', 'avg_rating')
+EVENT_ORDERING = ['event_start', 'pk']
+
+# fields of an event that are lists of related rows: API field: (through model of the event, lookups)
+EVENT_RELATED_FIELDS = {
+    'artists': (EventProfile.artist_list.through, {'id': 'artist', 'full_name': 'artist__full_name',
+                                                   'genre': 'artist__genre__name'}),
+    'services': (EventProfile.services.through, {'id': 'service', 'name': 'service__name'}),
+}
+
+ARTIST_FIELDS = {
+    'id': 'pk',
+    'full_name': 'full_name',
+    'genre': 'genre__name',
+    'category': 'genre__category__name',
+}
+ARTIST_LIST_FIELDS = ('id', 'full_name', 'genre')
+ARTIST_ORDERING = ['full_name', 'pk']
+
+
+def api_error(msg, status=400):
+    return JsonResponse({'error': msg}, status=status)
+
+
+def parse_fields(request, allowed, default):
+    """ Fields of the ?fields= parameter, the default ones if missing. Returns (fields, msg), where
+        fields is None if some of them are not allowed"""
+    value = request.GET.get('fields')
+    if not value:
+        return list(default), ""
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        return None, f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(allowed)}"
+    return fields, ""
+
+
+def serialize(queryset, lookups, fields):
+    """ Dicts of the fields of the rows of the queryset, read with values_list()"""
+    return [dict(zip(fields, row)) for row in queryset.values_list(*(lookups[field] for field in fields))]
+
+
+def keyset_page(queryset, ordering, lookups, fields, cursor, page_size=API_PAGE_SIZE):
+    """ Returns (rows, next cursor, msg): a page of serialize() after the cursor, if any. rows is None
+        if the cursor is not valid"""
+    if cursor:
+        values = decode_cursor(cursor, ordering, queryset)
+        if values is None:
+            return None, None, "Invalid cursor"
+        queryset = queryset.filter(keyset_filter(ordering, values, queryset))
+
+    rows = list(queryset.order_by(*ordering)
+                .values_list(*(lookups[field] for field in fields), *ordering)[:page_size + 1])
+    next_cursor = encode_cursor(ordering, list(rows[page_size - 1][len(fields):])) if len(rows) > page_size else None
+    return [dict(zip(fields, row)) for row in rows[:page_size]], next_cursor, ""
+
+
+def event_related(event_id, fields):
+    """ Lists of the related rows of the event for the EVENT_RELATED_FIELDS among the fields"""
+    related = {}
+    for field in fields:
+        if field in EVENT_RELATED_FIELDS:
+            through, lookups = EVENT_RELATED_FIELDS[field]
+            related[field] = serialize(through.objects.filter(eventprofile=event_id).order_by('pk'), lookups, list(lookups))
+    return related
+
+
+def availability(seat_map):
+    """ Available and occupied seats of the seat map, in total and per seat type with their prices"""
+    types = {}
+    for row in seat_map['rows']:
+        for seat in row['seats']:
+            seat_type = types.setdefault(seat[SEAT_TYPE], {'id': seat[SEAT_TYPE], 'name': seat_map['types'][str(seat[SEAT_TYPE])],
+                                                           'available': 0, 'occupied': 0, 'min_price': None, 'max_price': None})
+            if not seat[SEAT_AVAILABLE]:
+                seat_type['occupied'] += 1
+                continue
+            seat_type['available'] += 1
+            if seat_type['min_price'] is None or seat[SEAT_PRICE] < seat_type['min_price']:
+                seat_type['min_price'] = seat[SEAT_PRICE]
+            if seat_type['max_price'] is None or seat[SEAT_PRICE] > seat_type['max_price']:
+                seat_type['max_price'] = seat[SEAT_PRICE]
+    return {'event': seat_map['event'], 'available': seat_map['available'], 'occupied': seat_map['occupied'],
+            'seat_types': sorted(types.values(), key=lambda seat_type: seat_type['id'])}
+
+
+def rating_summary(event_id):
+    """ Number of reviews, average rating and histogram of the ratings of the event"""
+    summary = RatingSummary.objects.filter(event=event_id).values(
+        'count', 'total', 'last_review', *(f'stars_{stars}' for stars in range(6))).first()
+    if summary is None:
+        return {'event': event_id, 'count': 0, 'average': None, 'histogram': [0] * 6, 'last_review': None}
+    return {'event': event_id, 'count': summary['count'],
+            'average': round(summary['total'] / summary['count'], 2) if summary['count'] else None,
+            'histogram': [summary[f'stars_{stars}'] for stars in range(6)], 'last_review': summary['last_review']}
+
+
+class ConditionalApiMixin:
+    """ ETag and Last-Modified of the version of get_version(), which is the catalogue one by
+        default, and 304 Not Modified to the clients that have it already"""
+
+    def get_version(self):
+        return caching.catalogue_version()
+
+    def dispatch(self, request, *args, **kwargs):
+        version = self.get_version()
+        # the same version has a representation per query (fields, cursor)
+        etag = f'{version}-{hashlib.md5(request.GET.urlencode().encode()).hexdigest()[:12]}'
+        last_modified = datetime.fromtimestamp(version / 1000, tz=timezone.utc)
+
+        view = condition(etag_func=lambda *args, **kwargs: etag,
+                         last_modified_func=lambda *args, **kwargs: last_modified)(super().dispatch)
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, no_cache=True)  # may be stored, but always revalidated
+        return response
+
+
+class EventConditionalApiMixin(ConditionalApiMixin):
+    """ ConditionalApiMixin with the version of the event of the url"""
+
+    def get_version(self):
+        return caching.event_version(self.kwargs['pk'])
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class Book2FestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'book2fest'
+
+    def ready(self):
+        from book2fest import signals  # noqa: F401 connect signal receivers
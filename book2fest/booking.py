@@ -0,0 +1,124 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from book2fest import allocator, seatmap, signals
+from book2fest.models import Seat, SeatHold, Ticket
+from book2fest.sqlite import retry_on_locked
+
+_logger = logging.getLogger(__name__)
+
+GROUP_BOOKING_SIZE = getattr(settings, 'GROUP_BOOKING_SIZE', 10)
+
+SEAT_TAKEN = "Something went wrong with your booking procedure. The seat is not available"
+SEATS_TAKEN = "Some of the seats are not available anymore, nothing was booked"
+GROUP_SIZE = f"Please choose from 1 to {GROUP_BOOKING_SIZE} seats"
+NO_ADJACENT_SEATS = "There are not enough adjacent seats available, please choose fewer seats or another row"
+NO_SEATS_AVAILABLE = "There are not enough adjacent seats available at this price, please choose fewer seats or raise the price"
+
+
+def _not_held(profile):
+    """ Seats not held by other users (see book2fest.holds)"""
+    return Q(hold__isnull=True) | Q(hold__user=profile) | Q(hold__expires_at__lte=timezone.now())
+
+
+@retry_on_locked
+def book_seat(profile, event, seat, delivery):
+    """ Atomically claim a seat of the event and create its ticket.
+
+        The seat is claimed with a single conditional UPDATE (available=True -> False),
+        so among concurrent buyers only one can win it. Seats held by other users (see
+        book2fest.holds) can not be claimed. Returns (ticket, msg), where ticket is None if
+        the seat has already been taken"""
+    try:
+        with transaction.atomic():
+            claimed = Seat.objects.filter(_not_held(profile), pk=seat.pk, event=event, available=True).update(available=False)
+            if not claimed:
+                return None, SEAT_TAKEN
+            seat.available = False
+            SeatHold.objects.filter(seat=seat).delete()  # the hold ends with the booking
+
+            ticket = Ticket.objects.create(seat=seat, user=profile, delivery=delivery)
+
+    except IntegrityError:
+        # seat flagged as available but already bound to a ticket: the claim is rolled back
+        _logger.warning(f'Seat {seat.pk} is available but already has a ticket')
+        return None, SEAT_TAKEN
+
+    return ticket, "Ticket booked successfully"
+
+
+@retry_on_locked
+def book_seats(profile, event, seat_ids, delivery):
+    """ Atomically claim all the seats of the event and create their tickets: either every seat
+        is booked or none is.
+
+        The seats are claimed with a single conditional UPDATE over all of them and the tickets
+        are bulk inserted. Returns (tickets, msg), where tickets is None if any seat was taken"""
+    seat_ids = sorted(set(seat_ids))
+    if not 0 < len(seat_ids) <= GROUP_BOOKING_SIZE:
+        return None, GROUP_SIZE
+
+    try:
+        with transaction.atomic():
+            claimed = (Seat.objects.filter(_not_held(profile), pk__in=seat_ids, event=event, available=True)
+                       .update(available=False))
+            if claimed != len(seat_ids):
+                transaction.set_rollback(True)  # release the seats claimed so far
+                return None, SEATS_TAKEN
+            SeatHold.objects.filter(seat__in=seat_ids).delete()
+
+            Ticket.objects.bulk_create([Ticket(seat_id=seat_id, user=profile, delivery=delivery) for seat_id in seat_ids])
+            tickets = list(Ticket.objects.filter(seat__in=seat_ids).select_related('seat').order_by('seat'))
+
+            signals.tickets_created(event.pk, seat_ids, profile.user_id)  # bulk_create sends no signals
+
+    except IntegrityError:
+        _logger.warning(f'Seats {seat_ids} are available but some already have a ticket')
+        return None, SEATS_TAKEN
+
+    return tickets, f"{len(tickets)} tickets booked successfully"
+
+
+def book_adjacent_seats(profile, event, quantity, delivery, row=None, seat_type=None):
+    """ Book quantity adjacent seats of the event, in the row and of the seat type if given.
+
+        The seats are chosen on the cached seat map: if it was stale and some of them got taken in
+        the meantime, they are chosen again once on a fresh seat map. Returns (tickets, msg) like book_seats"""
+    if not 0 < quantity <= GROUP_BOOKING_SIZE:
+        return None, GROUP_SIZE
+
+    seat_map = seatmap.get_seat_map(event.pk)
+    for attempt in range(2):
+        seat_ids = seatmap.adjacent_seats(seat_map, quantity, row=row, seat_type=seat_type, profile_id=profile.pk)
+        if seat_ids is None:
+            return None, NO_ADJACENT_SEATS
+        tickets, msg = book_seats(profile, event, seat_ids, delivery)
+        if tickets is not None:
+            return tickets, msg
+        seat_map = seatmap.refresh_seat_map(event.pk)
+    return None, msg
+
+
+def book_best_available(profile, event, quantity, delivery, max_price=None, seat_type=None):
+    """ Book the best quantity adjacent seats of the event costing at most max_price each, of the
+        seat type if given (see book2fest.allocator).
+
+        The seats are chosen on the free-seat index: if it was stale and some of them got
+        taken in the meantime, or it has no block for them, they are chosen again once on a fresh
+        index. Returns (tickets, msg) like book_seats"""
+    if not 0 < quantity <= GROUP_BOOKING_SIZE:
+        return None, GROUP_SIZE
+
+    msg = NO_SEATS_AVAILABLE
+    for attempt in range(2):
+        seat_ids = allocator.find_block(event.pk, quantity, max_price=max_price, seat_type=seat_type, refresh=attempt > 0)
+        if seat_ids is None:
+            continue  # the stale index may miss seats freed since, e.g. by expired holds
+        tickets, msg = book_seats(profile, event, seat_ids, delivery)
+        if tickets is not None:
+            return tickets, msg
+    return None, msg
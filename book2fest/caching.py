@@ -0,0 +1,150 @@
+""" Versioned page and fragment caching.
+
+    Every event has a version, a millisecond timestamp kept in the cache, and the catalogue has a
+    version of its own. Both are bumped when an event, its seats, tickets, reviews, artists or
+    services change (see book2fest.signals), so cache keys that contain a version never serve
+    stale content: they are simply no longer used. The versions also tell when an event last
+    changed.
+
+    Two layers use them:
+    - AnonymousPageCacheMixin caches whole pages (home page, event list) for anonymous users,
+      keyed by the catalogue version
+    - the {% cache %} fragments of the event page (artists, services, reviews), keyed by the
+      event version passed to the template as event_version"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from book2fest import aio
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 5 * 60)
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 10 * 60)
+
+CATALOGUE = 'catalogue'
+
+_pending = threading.local()
+
+
+def _version_key(name):
+    return f'book2fest:version:{name}'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # unknown or evicted: a new version, so no key built on an older one is used again
+        version = _now_ms()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def event_version(event_id):
+    """ Version of the event: millisecond timestamp of its last change, as far as the cache knows"""
+    return _version(event_id)
+
+
+def catalogue_version():
+    """ Version of the whole catalogue of events"""
+    return _version(CATALOGUE)
+
+
+def bump(event_ids):
+    """ Bump the versions of the events and of the catalogue"""
+    now = _now_ms()
+    names = [CATALOGUE] + [event_id for event_id in event_ids if event_id is not None]
+    current = cache.get_many([_version_key(name) for name in names])
+    cache.set_many({_version_key(name): max(now, current.get(_version_key(name), 0) + 1) for name in names}, None)
+
+
+def _scheduled(func):
+    """ Whether func is still waiting for the commit of the current transaction: a rollback drops it"""
+    return any(callback is func for __, callback in transaction.get_connection().run_on_commit)
+
+
+def bump_on_commit(event_id):
+    """ Bump the version of the event when the current transaction commits, once per transaction.
+        None bumps the catalogue only"""
+    events, flush = getattr(_pending, 'batch', (None, None))
+    if events is not None and _scheduled(flush):
+        events.add(event_id)
+        return
+
+    events = {event_id}
+
+    def flush():
+        bump(events)
+
+    _pending.batch = (events, flush)
+    transaction.on_commit(flush)
+
+
+def _page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'book2fest:page:{catalogue_version()}:{request.method}:{path}'
+
+
+def page_cacheable(request):
+    """ Anonymous GET/HEAD without messages to show"""
+    return (request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+            and not len(get_messages(request)))
+
+
+class AnonymousPageCacheMixin:
+    """ Serve the page from the cache to anonymous users, until the catalogue changes.
+        Pages with messages or that set cookies (e.g. CSRF) are not cached"""
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    page_key = None
+
+    def get_cached_response(self, request):
+        """ The page from the cache, None if missing or not cacheable"""
+        if not page_cacheable(request):
+            return None
+        self.page_key = _page_key(request)
+        cached = cache.get(self.page_key)
+        if cached is None:
+            return None
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Page-Cache'] = 'hit'
+        return response
+
+    def cache_response(self, request, response):
+        """ Store the page in the cache once rendered, if cacheable"""
+        if self.page_key is None:
+            return response
+        key = self.page_key
+        if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            def store(rendered):
+                if not rendered.cookies and not request.META.get('CSRF_COOKIE_USED'):
+                    cache.set(key, (rendered.content, rendered['Content-Type']), self.page_cache_timeout)
+
+            response.add_post_render_callback(store)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self.get_cached_response(request)
+        if response is None:
+            response = self.cache_response(request, super().dispatch(request, *args, **kwargs))
+        return response
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """ Cached page of the async view (see book2fest.aio.AsyncViewMixin): the cache is read
+            before the queries of the page run"""
+        response = await aio.run(self.get_cached_response, request)
+        if response is None:
+            response = self.cache_response(request, await super().async_dispatch(request, *args, **kwargs))
+        return response
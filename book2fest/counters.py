@@ -0,0 +1,110 @@
+""" Denormalized per-event counters: EventProfile.seats_available, EventProfile.avg_rating and
+    the RatingSummary (rating histogram) of the events.
+
+    The counters are updated incrementally with F() expressions, so listing events never has
+    to recompute them. rebuild_counters() recalculates them from scratch in bulk."""
+from django.db.models import F, FloatField, Count, Sum, Max, OuterRef, Subquery, IntegerField, Value
+from django.db.models.functions import Coalesce, NullIf, Floor
+from django.utils import timezone
+
+from book2fest import caching
+from book2fest.models import EventProfile, Seat, Review, RatingSummary
+
+
+def seats_changed(event, delta):
+    """ Add delta (possibly negative) to the available seats of the event.
+        event can be an event pk or a subquery returning it"""
+    if delta:
+        EventProfile.objects.filter(pk=event).update(seats_available=F('seats_available') + delta)
+
+
+def rating_changed(event, sum_delta, count_delta):
+    """ Update the running rating sum and count of the event, then its average"""
+    if not sum_delta and not count_delta:
+        return
+
+    total = F('rating_sum') + sum_delta
+    count = F('rating_count') + count_delta
+    EventProfile.objects.filter(pk=event).update(
+        rating_sum=total,
+        rating_count=count,
+        # every expression refers to the values before the update
+        avg_rating=Coalesce(total / NullIf(count, 0), Value(0.0), output_field=FloatField()),
+    )
+
+
+def rating_summary_changed(event, old, new):
+    """ Move a review of the event from the histogram bucket of the old rating (None: not rated)
+        to the one of the new rating. The summary is built from the reviews if it does not exist"""
+    changes = {}
+    if old is not None:
+        changes[RatingSummary.stars_field(old)] = F(RatingSummary.stars_field(old)) - 1
+    if new is not None:
+        field = RatingSummary.stars_field(new)
+        changes[field] = changes[field] + 1 if field in changes else F(field) + 1
+        changes['last_review'] = timezone.now()
+    if not changes:
+        return
+
+    # plain numbers as parameters: some databases (e.g. PostgreSQL) do not add booleans to integers
+    count = int(new is not None) - int(old is not None)
+    updated = RatingSummary.objects.filter(event=event).update(
+        count=F('count') + count,
+        total=F('total') + ((new or 0.0) - (old or 0.0)),
+        **changes,
+    )
+    if not updated and new is not None:
+        rebuild_rating_summaries([event])
+
+
+def rebuild_rating_summaries(events, chunk_size=500):
+    """ Recalculate the RatingSummary of the events (pks) from their reviews"""
+    events = list(events)
+    for start in range(0, len(events), chunk_size):
+        chunk = events[start:start + chunk_size]
+        summaries = {event: RatingSummary(event_id=event) for event in chunk}
+        buckets = (Review.objects.filter(event__in=chunk, rating__isnull=False).order_by()
+                   .annotate(stars=Floor(F('rating') + 0.5)).values('event', 'stars')
+                   .annotate(reviews=Count('pk'), total=Sum('rating'), last=Max('date')))
+        for bucket in buckets:
+            summary = summaries[bucket['event']]
+            field = RatingSummary.stars_field(bucket['stars'])
+            setattr(summary, field, getattr(summary, field) + bucket['reviews'])
+            summary.count += bucket['reviews']
+            summary.total += bucket['total']
+            summary.last_review = max(filter(None, (summary.last_review, bucket['last'])), default=None)
+
+        RatingSummary.objects.filter(event__in=chunk).delete()
+        RatingSummary.objects.bulk_create(summaries.values())
+
+
+def rebuild_counters(events=None):
+    """ Recalculate the counters of the given events (all events by default) in bulk"""
+    events = EventProfile.objects.all() if events is None else events
+
+    available = (Seat.objects.filter(event=OuterRef('pk'), available=True).order_by()
+                 .values('event').annotate(total=Count('pk')).values('total'))
+    ratings = (Review.objects.filter(ticket__seat__event=OuterRef('pk'), rating__isnull=False).order_by()
+               .values('ticket__seat__event'))
+
+    events = events.annotate(
+        new_seats_available=Coalesce(Subquery(available, output_field=IntegerField()), 0),
+        new_rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total'),
+                                         output_field=FloatField()), 0.0),
+        new_rating_count=Coalesce(Subquery(ratings.annotate(total=Count('pk')).values('total'),
+                                           output_field=IntegerField()), 0),
+    ).only('pk')
+
+    updated = []
+    for event in events.iterator():
+        event.seats_available = event.new_seats_available
+        event.rating_sum = event.new_rating_sum
+        event.rating_count = event.new_rating_count
+        event.avg_rating = event.rating_sum / event.rating_count if event.rating_count else 0.0
+        updated.append(event)
+
+    EventProfile.objects.bulk_update(updated, ['seats_available', 'rating_sum', 'rating_count', 'avg_rating'],
+                                     batch_size=500)
+    rebuild_rating_summaries(event.pk for event in updated)
+    caching.bump([event.pk for event in updated])
+    return len(updated)
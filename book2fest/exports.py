@@ -0,0 +1,64 @@
+""" Streaming export of the tickets of an event, for its organizer.
+
+    Rows are read with values_list() and iterator(), EXPORT_CHUNK_SIZE at a time, and written to
+    the response while they are read: the memory used does not depend on the number of tickets."""
+import csv
+import json
+
+from book2fest.models import Ticket
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (column, lookup of the ticket)
+EXPORT_COLUMNS = (
+    ('ticket', 'pk'),
+    ('seat', 'seat__name'),
+    ('row', 'seat__row'),
+    ('number', 'seat__number'),
+    ('seat_type', 'seat__seat_type__name'),
+    ('price', 'seat__price'),
+    ('delivery', 'delivery__name'),
+    ('first_name', 'user__user__first_name'),
+    ('last_name', 'user__user__last_name'),
+    ('email', 'user__user__email'),
+    ('rating', 'review_structure__rating'),
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_rows(event, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Tuples of the EXPORT_COLUMNS of the tickets of the event, by row and number"""
+    return (Ticket.objects.filter(seat__event=event)
+            .order_by('seat__row', 'seat__number', 'pk')
+            .values_list(*(lookup for __, lookup in EXPORT_COLUMNS))
+            .iterator(chunk_size=chunk_size))
+
+
+class _Echo:
+    """ File-like object that returns what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, __ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    columns = [column for column, __ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + '\n'
+
+
+def export_lines(event, export_format):
+    """ Lines of the export of the tickets of the event, in the format (a key of EXPORT_FORMATS)"""
+    lines = csv_lines if export_format == 'csv' else jsonl_lines
+    return lines(export_rows(event))
@@ -0,0 +1,88 @@
+""" Background fan-out of the notifications sent to the ticket holders of an event.
+
+    Jobs run on a local thread pool after the transaction that queued them commits: recipients
+    are deduplicated (one notification per user, whatever the number of tickets) and the
+    notifications are bulk inserted in chunks. The progress of every job is kept in the cache."""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction, connection
+from django.utils import timezone
+from swapper import load_model
+
+from book2fest.models import Ticket, EventProfile
+
+_logger = logging.getLogger(__name__)
+
+FANOUT_CHUNK_SIZE = 1000
+FANOUT_PROGRESS_TIMEOUT = 60 * 60
+
+_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'NOTIFICATION_FANOUT_WORKERS', 2),
+                               thread_name_prefix='book2fest-fanout')
+
+
+def _progress_key(job_id):
+    return f'book2fest:fanout:{job_id}'
+
+
+def get_progress(job_id):
+    """ {'event': pk, 'total': recipients or None if not started, 'sent': notifications sent,
+        'finished': bool}, None if the job is unknown"""
+    return cache.get(_progress_key(job_id))
+
+
+def _set_progress(job_id, **progress):
+    cache.set(_progress_key(job_id), progress, FANOUT_PROGRESS_TIMEOUT)
+
+
+def notify_ticket_holders(event, verb, description):
+    """ Queue the notification of every user holding a ticket for the event. The job starts
+        when the current transaction commits, return its id"""
+    job_id = uuid.uuid4().hex
+    _set_progress(job_id, event=event.pk, total=None, sent=0, finished=False)
+
+    if getattr(settings, 'NOTIFICATION_FANOUT_ASYNC', True):
+        transaction.on_commit(lambda: _executor.submit(_run_in_worker, job_id, event.pk, verb, description))
+    else:
+        transaction.on_commit(lambda: run_job(job_id, event.pk, verb, description))
+    return job_id
+
+
+def _run_in_worker(job_id, event_id, verb, description):
+    try:
+        run_job(job_id, event_id, verb, description)
+    except Exception:
+        _logger.exception(f'Notification job {job_id} of event {event_id} failed')
+    finally:
+        connection.close()  # connections are per thread, don't leak the one of the worker
+
+
+def run_job(job_id, event_id, verb, description, chunk_size=FANOUT_CHUNK_SIZE):
+    """ Send the notifications of the job, in chunks"""
+    Notification = load_model('notifications', 'Notification')
+    recipients = list(Ticket.objects.filter(seat__event=event_id).order_by()
+                      .values_list('user__user_id', flat=True).distinct())
+    _set_progress(job_id, event=event_id, total=len(recipients), sent=0, finished=False)
+
+    user_type = ContentType.objects.get_for_model(User)
+    event_type = ContentType.objects.get_for_model(EventProfile)
+    timestamp = timezone.now()
+
+    for start in range(0, len(recipients), chunk_size):
+        # every user notifies itself, like notify.send(user, recipient=user, ...)
+        Notification.objects.bulk_create([
+            Notification(recipient_id=user_id, actor_content_type=user_type, actor_object_id=user_id,
+                         verb=verb, description=description, target_content_type=event_type,
+                         target_object_id=event_id, timestamp=timestamp, level=Notification.LEVELS.info)
+            for user_id in recipients[start:start + chunk_size]])
+        sent = min(start + chunk_size, len(recipients))
+        _set_progress(job_id, event=event_id, total=len(recipients), sent=sent, finished=False)
+        _logger.debug(f'Notification job {job_id}: {sent}/{len(recipients)}')
+
+    _set_progress(job_id, event=event_id, total=len(recipients), sent=len(recipients), finished=True)
+    _logger.info(f'Notification job {job_id}: notified {len(recipients)} users of event {event_id}')
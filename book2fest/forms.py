@@ -1,5 +1,7 @@
 from django import forms
-from book2fest.models import Artist, OrganizerProfile, UserProfile, Seat, SeatType, Genre, Service, EventProfile, Ticket, Review, Picture
+from book2fest.models import Artist, OrganizerProfile, UserProfile, Seat, SeatType, Genre, Service, EventProfile, Ticket, Review, Picture, \
+    Delivery
+from book2fest.seatmap import seat_choices
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Layout, Div, HTML, Field, MultiField, Fieldset
 
@@ -121,6 +123,23 @@ class SeatForm(forms.ModelForm):
         model = Seat
         fields = ['seat_type', 'row', 'price', 'number', 'quantity']
 
+class EventImportForm(forms.Form):
+    file = forms.FileField(help_text="JSON or CSV, see book2fest.importer")
+    dry_run = forms.BooleanField(required=False, label="Only validate the file")
+
+    helper = FormHelper()
+    helper.form_id = 'event_import_crispy_form'
+    helper.form_method = 'POST'
+    helper.add_input(Submit('submit', 'Import'))
+    helper.inputs[0].field_classes = 'btn btn-success'
+
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if file.name.rsplit('.', 1)[-1].lower() not in ('json', 'csv'):
+            raise forms.ValidationError("Please upload a .json or .csv file")
+        return file
+
+
 class SeatTypeForm(forms.ModelForm):
 
     helper = FormHelper()
@@ -154,9 +173,14 @@ class TicketForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         event_pk = kwargs.pop('event_pk', None)  # pop pk event
+        seat_map = kwargs.pop('seat_map', None)  # cached seat map of the event, see book2fest.seatmap
+        holder = kwargs.pop('holder', None)  # user profile pk, seats held by other users are not offered
         super(TicketForm, self).__init__(*args, **kwargs)
         if event_pk:
             self.fields['seat'].queryset = Seat.objects.filter(event_id=event_pk).filter(available=True).order_by('row','number')
+        if seat_map:
+            # render the choices from the seat map instead of querying the seats
+            self.fields['seat'].choices = [('', self.fields['seat'].empty_label)] + seat_choices(seat_map, holder)
 
 
         #self.fields['seat'].disabled = True
@@ -165,6 +189,30 @@ class TicketForm(forms.ModelForm):
         model = Ticket
         fields = ('seat', 'delivery')
 
+class GroupBookingForm(forms.Form):
+    """ Seats to book at once: the listed seats, quantity adjacent seats in a row, or the best
+        quantity adjacent seats available (up to a price, of a seat type)"""
+    seats = forms.CharField(required=False, widget=forms.HiddenInput)  # comma separated seat pks
+    quantity = forms.IntegerField(required=False, min_value=1)
+    row = forms.CharField(required=False, max_length=1)
+    seat_type = forms.ModelChoiceField(queryset=SeatType.objects.all(), required=False)
+    max_price = forms.FloatField(required=False, min_value=0, label="Max price per seat")
+    delivery = forms.ModelChoiceField(queryset=Delivery.objects.all(), required=True)
+
+    def clean_seats(self):
+        seats = self.cleaned_data.get('seats')
+        try:
+            return [int(seat) for seat in seats.split(',') if seat.strip()]
+        except ValueError:
+            raise forms.ValidationError("Please choose valid seats")
+
+    def clean(self):
+        cleaned_data = super(GroupBookingForm, self).clean()
+        if not cleaned_data.get('seats') and not cleaned_data.get('quantity') and 'seats' not in self.errors:
+            raise forms.ValidationError("Please choose the seats or how many adjacent seats to book")
+        return cleaned_data
+
+
 class ReviewForm(forms.ModelForm):
 
     helper = FormHelper()
@@ -0,0 +1,77 @@
+""" Short lived seat holds.
+
+    A user can hold up to SEAT_HOLDS_PER_USER seats of an event for SEAT_HOLD_TTL seconds while
+    filling the booking form: held seats are hidden from the other users and can only be booked
+    by the holder (see book2fest.booking). Expired holds are taken over lazily by the next hold
+    of the seat, and deleted in batch by sweep_holds (`manage.py sweep_seat_holds`)."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from book2fest import allocator, live, seatmap
+from book2fest.booking import SEAT_TAKEN
+from book2fest.models import Seat, SeatHold
+from book2fest.sqlite import retry_on_locked
+
+SEAT_HOLD_TTL = getattr(settings, 'SEAT_HOLD_TTL', 5 * 60)
+SEAT_HOLDS_PER_USER = getattr(settings, 'SEAT_HOLDS_PER_USER', 4)
+
+SEAT_HELD = "The seat is held by someone else, please choose another one"
+HOLD_LIMIT = f"You can hold at most {SEAT_HOLDS_PER_USER} seats at a time"
+
+
+@retry_on_locked
+def place_hold(profile, event, seat_id, ttl=None):
+    """ Hold the seat of the event for the user, or renew the hold of the user on it.
+
+        Returns (expiry, msg), where expiry is None if the seat can not be held"""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=SEAT_HOLD_TTL if ttl is None else ttl)
+
+    with transaction.atomic():
+        if not Seat.objects.filter(pk=seat_id, event=event, available=True).exists():
+            return None, SEAT_TAKEN
+
+        held = (SeatHold.objects.filter(user=profile, seat__event=event, expires_at__gt=now)
+                .exclude(seat_id=seat_id).count())
+        if held >= SEAT_HOLDS_PER_USER:
+            return None, HOLD_LIMIT
+
+        try:
+            with transaction.atomic():
+                SeatHold.objects.create(seat_id=seat_id, user=profile, expires_at=expires_at)
+        except IntegrityError:
+            # the seat has a hold already: renew the own hold or take over an expired one
+            taken = (SeatHold.objects.filter(seat_id=seat_id).filter(Q(user=profile) | Q(expires_at__lte=now))
+                     .update(user=profile, expires_at=expires_at))
+            if not taken:
+                return None, SEAT_HELD
+
+        transaction.on_commit(lambda: seatmap.seat_held(event.pk, seat_id, expires_at, profile.pk))
+        transaction.on_commit(lambda: allocator.seats_held(event.pk, [seat_id], expires_at))
+        live.publish_on_commit(event.pk, held=[seat_id])
+
+    return expires_at, f"Seat held until {timezone.localtime(expires_at):%H:%M:%S}"
+
+
+def release_hold(profile, event, seat_id):
+    """ Release the hold of the user on the seat. Returns (released, msg)"""
+    with transaction.atomic():
+        released, __ = SeatHold.objects.filter(seat_id=seat_id, seat__event=event, user=profile).delete()
+        if released:
+            transaction.on_commit(lambda: seatmap.seat_released(event.pk, seat_id))
+            transaction.on_commit(lambda: allocator.invalidate(event.pk))  # the seat is free again
+            live.publish_on_commit(event.pk, released=[seat_id])
+
+    if not released:
+        return False, "You are not holding this seat"
+    return True, "Seat released"
+
+
+def sweep_holds(now=None):
+    """ Delete the expired holds, return how many were deleted"""
+    deleted, __ = SeatHold.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
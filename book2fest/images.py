@@ -0,0 +1,114 @@
+""" Resized derivatives of the uploaded images (Artist.image, Picture.img).
+
+    Every image gets a derivative per size in IMAGE_SIZES and per format in IMAGE_FORMATS, named
+    after the hash of the original content: derivatives/<hash[:2]>/<hash>-<size>-<w>x<h>.<ext>.
+    Identical uploads share the same derivatives, which are generated only once. The hash is kept
+    in the <field>_hash column of the model, the image_url/picture template tags turn it into the
+    url of the right size and fall back to the original upload when the hash is missing."""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+_logger = logging.getLogger(__name__)
+
+IMAGE_SIZES = getattr(settings, 'IMAGE_SIZES', {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'hero': (1600, 900),
+})
+
+# format -> (extension, Pillow save options)
+IMAGE_FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 4)
+
+DERIVATIVES_DIR = 'derivatives'
+
+
+def content_hash(field_file):
+    """ Hash of the content of the stored file"""
+    digest = hashlib.sha256()
+    with field_file.storage.open(field_file.name, 'rb') as stored:
+        for chunk in stored.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def derivative_name(digest, size, fmt):
+    """ Storage name of the derivative of the image with the given content hash"""
+    width, height = IMAGE_SIZES[size]
+    extension = IMAGE_FORMATS[fmt][0]
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}-{size}-{width}x{height}.{extension}'
+
+
+def generate_derivatives(field_file):
+    """ Generate the missing derivatives of the image, return its content hash.
+
+        Returns an empty string if the file is not a readable image"""
+    try:
+        digest = content_hash(field_file)
+        missing = [(size, fmt) for size in IMAGE_SIZES for fmt in IMAGE_FORMATS
+                   if not default_storage.exists(derivative_name(digest, size, fmt))]
+        if not missing:
+            return digest
+
+        # the stored file is opened again: the uploaded one may have been closed by the storage
+        with field_file.storage.open(field_file.name, 'rb') as stored:
+            original = ImageOps.exif_transpose(Image.open(stored)).convert('RGB')
+
+        # largest size first, smaller sizes are resized from the previous one
+        image = original
+        for size in sorted(IMAGE_SIZES, key=lambda s: IMAGE_SIZES[s], reverse=True):
+            image = image.copy()
+            image.thumbnail(IMAGE_SIZES[size], Image.LANCZOS)
+            for fmt in IMAGE_FORMATS:
+                if (size, fmt) in missing:
+                    buffer = BytesIO()
+                    image.save(buffer, fmt.upper(), **IMAGE_FORMATS[fmt][1])
+                    default_storage.save(derivative_name(digest, size, fmt), ContentFile(buffer.getvalue()))
+        return digest
+
+    except (OSError, UnidentifiedImageError, ValueError):
+        _logger.warning(f'Can not generate the derivatives of {field_file.name}', exc_info=True)
+        return ''
+
+
+def process_images(instances, field_name, workers=IMAGE_WORKERS):
+    """ Generate the derivatives of the images of the instances in a pool of worker threads
+        and store their content hash. Returns the instances processed"""
+    instances = [instance for instance in instances if getattr(instance, field_name)]
+    if not instances:
+        return instances
+
+    files = [getattr(instance, field_name) for instance in instances]
+    if len(files) == 1 or workers <= 1:
+        digests = list(map(generate_derivatives, files))
+    else:
+        # Pillow releases the GIL while decoding, resizing and encoding
+        with ThreadPoolExecutor(max_workers=min(workers, len(files)), thread_name_prefix='book2fest-images') as pool:
+            digests = list(pool.map(generate_derivatives, files))
+
+    hash_field = f'{field_name}_hash'
+    for instance, digest in zip(instances, digests):
+        setattr(instance, hash_field, digest)
+    type(instances[0]).objects.bulk_update(instances, [hash_field])
+    return instances
+
+
+def image_url(field_file, size, fmt='jpeg'):
+    """ Url of the derivative of the image, or of the original upload if it has none"""
+    if not field_file:
+        return ''
+    digest = getattr(field_file.instance, f'{field_file.field.name}_hash', '')
+    if digest and size in IMAGE_SIZES:
+        return default_storage.url(derivative_name(digest, size, fmt))
+    return field_file.url
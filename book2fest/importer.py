@@ -0,0 +1,286 @@
+""" Bulk import of events, with their artists, services and seats, from a JSON or CSV file.
+
+    Every entry of the file is validated before anything is written: artists are matched to the
+    existing ones or created with an existing genre, services must exist, seat types are created
+    when missing. Then the whole file is written in a single transaction, with bulk inserts for the
+    artists, the artists/services of the events and the seats. Bulk inserts send no signals, so the
+    search index and the cache versions are updated here.
+
+    JSON: {"events": [{"event_name": ..., "event_start": "2026-07-01T20:00", ...,
+                       "artists": ["Existing artist", {"full_name": ..., "genre": ..., "category": ...}],
+                       "services": ["Existing service"],
+                       "seats": [{"rows": "A-C", "seats_per_row": 100, "seat_type": "Standard", "price": 30}]}]}
+    CSV: one event per line with the same columns, where "artists", "services" and "seats" are lists
+         separated by ";": an artist is "full_name[:genre[:category]]" and a seat block is
+         "rows:seats_per_row:seat_type:price" """
+import csv
+import io
+import json
+import time
+from collections import namedtuple, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from book2fest import caching, search
+from book2fest.images import process_images
+from book2fest.models import EventProfile, Artist, Genre, Service, SeatType
+from book2fest.seating import generate_seats, SeatBlock
+
+IMPORT_FORMATS = ('json', 'csv')
+IMPORT_BATCH_SIZE = 500
+
+EVENT_FIELDS = ('event_name', 'brief_description', 'description', 'city', 'province', 'cap', 'country', 'address',
+                'how_to_reach', 'max_capacity', 'event_start', 'event_end')
+
+ImportReport = namedtuple('ImportReport', ['events', 'artists', 'seat_types', 'seats', 'errors', 'elapsed', 'dry_run'])
+
+# an event to create, with the artists (existing or new), services and seat blocks
+_EventPlan = namedtuple('_EventPlan', ['event', 'artists', 'services', 'seats'])
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(';') if part.strip()]
+
+
+def _csv_entry(line):
+    entry = {field: line.get(field) or None for field in EVENT_FIELDS}
+    entry['artists'] = [value if ':' not in value else dict(zip(('full_name', 'genre', 'category'),
+                                                                (part.strip() for part in value.split(':'))))
+                        for value in _split(line.get('artists'))]
+    entry['services'] = _split(line.get('services'))
+    entry['seats'] = [dict(zip(('rows', 'seats_per_row', 'seat_type', 'price'), value.split(':')))
+                      for value in _split(line.get('seats'))]
+    return entry
+
+
+def parse_file(file, import_format):
+    """ Event entries of a JSON or CSV file, opened in binary or text mode"""
+    content = file.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if import_format == 'csv':
+        return [_csv_entry(line) for line in csv.DictReader(io.StringIO(content))]
+    data = json.loads(content)
+    return data['events'] if isinstance(data, dict) else data
+
+
+def _values(entry, kind):
+    """ Values of the list of the entry, [] if it is not a list (reported by _plan_event)"""
+    values = entry.get(kind)
+    return values if isinstance(values, list) else []
+
+
+def _rows(rows):
+    """ "A-C" -> ['A', 'B', 'C'], "A,C" or ["A", "C"] -> ['A', 'C']"""
+    if isinstance(rows, str):
+        rows = rows.strip()
+        if len(rows) == 3 and rows[1] == '-':
+            return [chr(code) for code in range(ord(rows[0]), ord(rows[2]) + 1)]
+        rows = rows.split(',')
+    return [str(row).strip() for row in rows]
+
+
+class _Resolver:
+    """ Existing genres, artists, services and seat types named by the entries, read once"""
+
+    def __init__(self, entries):
+        # values of the wrong type are skipped here, and reported by _plan_event
+        artists = [artist for entry in entries for artist in _values(entry, 'artists')]
+        names = {artist if isinstance(artist, str) else artist.get('full_name') for artist in artists
+                 if isinstance(artist, str) or isinstance(artist, dict) and isinstance(artist.get('full_name'), str)}
+        services = {service for entry in entries for service in _values(entry, 'services') if isinstance(service, str)}
+
+        self.genres = defaultdict(list)
+        for genre in Genre.objects.select_related('category').order_by('pk'):
+            self.genres[genre.name].append(genre)
+        self.artists = defaultdict(list)
+        for artist in Artist.objects.filter(full_name__in=names).order_by('pk'):
+            self.artists[artist.full_name].append(artist)
+        self.services = {service.name: service for service in Service.objects.filter(name__in=services).order_by('-pk')}
+        self.seat_types = {seat_type.name: seat_type for seat_type in SeatType.objects.order_by('-pk')}
+        self.new_artists = {}     # (full_name, genre pk): Artist
+        self.new_seat_types = {}  # name: SeatType
+
+    def genre(self, name, category=None):
+        if not isinstance(name, str) or not isinstance(category, (str, type(None))):
+            raise ValueError(f"genre {name}" + (f" ({category})" if category else "") + ": a name is required")
+        genres = [genre for genre in self.genres.get(name, []) if category is None or genre.category.name == category]
+        if not genres:
+            raise ValueError(f"unknown genre {name}" + (f" ({category})" if category else ""))
+        if len(genres) > 1:
+            raise ValueError(f"more genres named {name}, please add the category")
+        return genres[0]
+
+    def artist(self, value):
+        if isinstance(value, str):
+            if not self.artists.get(value):
+                raise ValueError(f"unknown artist {value}, please add the genre")
+            return self.artists[value][0]
+        if not isinstance(value, dict) or not isinstance(value.get('full_name'), str):
+            raise ValueError(f"artist {value}: a name or an object with full_name and genre is required")
+
+        full_name = value.get('full_name')
+        genre = self.genre(value.get('genre'), value.get('category'))
+        for artist in self.artists.get(full_name, []):
+            if artist.genre_id == genre.pk:
+                return artist
+        key = (full_name, genre.pk)
+        if key not in self.new_artists:
+            artist = Artist(full_name=full_name, genre=genre, image=value.get('image') or '')
+            try:
+                artist.full_clean(exclude=['genre', 'image', 'image_hash'])
+            except ValidationError as e:
+                raise ValueError(f"artist {full_name}: {'; '.join(e.messages)}")
+            self.new_artists[key] = artist
+        return self.new_artists[key]
+
+    def service(self, name):
+        if not isinstance(name, str):
+            raise ValueError(f"service {name}: a name is required")
+        if name not in self.services:
+            raise ValueError(f"unknown service {name}")
+        return self.services[name]
+
+    def seat_type(self, name):
+        if not name:
+            raise ValueError("missing seat type")
+        if name not in self.seat_types:
+            self.seat_types[name] = self.new_seat_types[name] = SeatType(name=name)
+        return self.seat_types[name]
+
+    def seat_block(self, value):
+        if not isinstance(value, dict):
+            raise ValueError(f"seat block {value}: an object with rows, seats_per_row, seat_type and price is required")
+        try:
+            rows, seats_per_row, price = _rows(value['rows']), int(value['seats_per_row']), float(value['price'])
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"seat block {value}: missing or invalid {e}")
+        except ValueError:
+            raise ValueError(f"seat block {value}: seats per row and price must be numbers")
+        block = SeatBlock(rows, seats_per_row, self.seat_type(str(value.get('seat_type') or '').strip()), price)
+        if not rows or any(len(row) != 1 for row in rows):
+            raise ValueError(f"seat block {value}: rows are named by a single character")
+        if block.seats_per_row <= 0 or block.price < 0:
+            raise ValueError(f"seat block {value}: seats per row must be positive, the price not negative")
+        return block
+
+
+def _plan_event(organizer, entry, resolver):
+    """ Validate the entry, return its _EventPlan and the list of its errors"""
+    errors = []
+    event = EventProfile(user=organizer, **{field: entry.get(field) for field in EVENT_FIELDS})
+    try:
+        event.full_clean(exclude=['user'])
+    except ValidationError as e:
+        errors += [f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items()]
+    else:
+        event.event_start, event.event_end = (timezone.make_aware(value) if timezone.is_naive(value) else value
+                                              for value in (event.event_start, event.event_end))
+        if event.event_start > event.event_end:
+            errors.append("the event ends before it starts")
+        if event.max_capacity <= 0:
+            errors.append("max capacity must be positive")
+
+    plan = _EventPlan(event, [], [], [])
+    for kind, resolve in (('artists', resolver.artist), ('services', resolver.service), ('seats', resolver.seat_block)):
+        if entry.get(kind) and not isinstance(entry[kind], list):
+            errors.append(f"{kind} must be a list")
+        for value in _values(entry, kind):
+            try:
+                getattr(plan, kind).append(resolve(value))
+            except ValueError as e:
+                errors.append(str(e))
+    if not entry.get('artists'):
+        errors.append("at least an artist is required")
+
+    seats = sum(len(block.rows) * block.seats_per_row for block in plan.seats)
+    if isinstance(event.max_capacity, int) and seats > event.max_capacity:
+        errors.append(f"{seats} seats exceed the max capacity of {event.max_capacity}")
+    return plan, errors
+
+
+def _write(plans, resolver):
+    with transaction.atomic():
+        SeatType.objects.bulk_create(resolver.new_seat_types.values())
+        new_artists = list(resolver.new_artists.values())
+        Artist.objects.bulk_create(new_artists, batch_size=IMPORT_BATCH_SIZE)
+        if new_artists and new_artists[0].pk is None:
+            # the database does not return the pks of bulk inserts (e.g. SQLite): the new artists
+            # are the last ones with their name and genre
+            created = {(artist.full_name, artist.genre_id): artist.pk for artist in
+                       Artist.objects.filter(full_name__in={artist.full_name for artist in new_artists}).order_by('pk')}
+            for artist in new_artists:
+                artist.pk = created[(artist.full_name, artist.genre_id)]
+        if resolver.new_seat_types and next(iter(resolver.new_seat_types.values())).pk is None:
+            for seat_type in SeatType.objects.filter(name__in=resolver.new_seat_types).order_by('pk'):
+                resolver.new_seat_types[seat_type.name].pk = seat_type.pk
+
+        for plan in plans:
+            plan.event.save()  # one insert per event, to get its pk
+
+        artist_list = EventProfile.artist_list.through
+        artist_list.objects.bulk_create([artist_list(eventprofile_id=event, artist_id=artist) for event, artist in
+                                         {(plan.event.pk, artist.pk) for plan in plans for artist in plan.artists}],
+                                        batch_size=IMPORT_BATCH_SIZE)
+        services = EventProfile.services.through
+        services.objects.bulk_create([services(eventprofile_id=event, service_id=service) for event, service in
+                                      {(plan.event.pk, service.pk) for plan in plans for service in plan.services}],
+                                     batch_size=IMPORT_BATCH_SIZE)
+
+        for plan in plans:
+            # chunked seat inserts, they update the counters and the seat map of the event
+            flag, msg = generate_seats(plan.event, plan.seats)
+            if not flag:
+                raise ValueError(f"{plan.event.event_name}: {msg}")
+
+        # no signals for the bulk inserts above
+        events = [plan.event.pk for plan in plans]
+        search.index_artists([artist.pk for artist in new_artists])
+        search.index_events(events)
+        for event in events:
+            caching.bump_on_commit(event)
+
+    process_images([artist for artist in new_artists if artist.image], 'image')
+
+
+def import_events(organizer, entries, dry_run=False):
+    """ Validate the entries, then create the events of the organizer unless dry_run.
+        Nothing is written if any entry is not valid. Returns an ImportReport"""
+    start = time.perf_counter()
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return ImportReport(0, 0, 0, 0, ["the file must contain a list of events"], 0.0, dry_run)
+
+    resolver = _Resolver(entries)
+    plans, errors = [], []
+    for i, entry in enumerate(entries, 1):
+        plan, event_errors = _plan_event(organizer, entry, resolver)
+        plans.append(plan)
+        errors += [f"event {i} ({entry.get('event_name')}): {error}" for error in event_errors]
+
+    if not errors and not dry_run:
+        _write(plans, resolver)
+
+    seats = sum(len(block.rows) * block.seats_per_row for plan in plans for block in plan.seats)
+    return ImportReport(len(plans), len(resolver.new_artists), len(resolver.new_seat_types), seats, errors,
+                        time.perf_counter() - start, dry_run)
+
+
+def import_file(organizer, file, import_format, dry_run=False):
+    """ import_events() of the entries of a JSON or CSV file"""
+    try:
+        entries = parse_file(file, import_format)
+    except (ValueError, KeyError, csv.Error) as e:  # UnicodeDecodeError and JSONDecodeError are ValueErrors
+        return ImportReport(0, 0, 0, 0, [f"can't read the file: {e}"], 0.0, dry_run)
+    return import_events(organizer, entries, dry_run)
+
+
+def summary(report):
+    """ Human readable outcome of an import, with its throughput"""
+    if report.errors:
+        return f"Nothing imported, {len(report.errors)} errors: " + "; ".join(report.errors)
+    verb = "Valid: would import" if report.dry_run else "Imported"
+    rate = f", {report.seats / report.elapsed:.0f} seats/s" if report.elapsed and report.seats else ""
+    return (f"{verb} {report.events} events, {report.artists} new artists, {report.seat_types} new seat types "
+            f"and {report.seats} seats in {report.elapsed:.2f}s{rate}")
@@ -0,0 +1,205 @@
+""" Live seat availability of the events, streamed to the browsers as server-sent events.
+
+    A local, in-process publish/subscribe: bookings, holds and new seats publish the deltas of an
+    event once their transaction commits, and every open stream of the event receives them. A
+    stream starts with a snapshot of the seats, taken once subscribed so that no delta is missed
+    in between (the deltas that follow may repeat what the snapshot already shows):
+
+        event: snapshot               availability (see book2fest.api.availability), with
+                                      "booked" and "held": [seat pk, ...]
+
+        {"booked": [seat pk, ...]}    seats booked, not available anymore
+        {"held": [seat pk, ...]}      seats held by a user for a few minutes (see book2fest.holds)
+        {"released": [seat pk, ...]}  seats available again
+        {"changed": true}             seats added or removed, or deltas lost: reload the seat map
+
+    Streams are plain ASGI handlers (seat_stream, routed by base_project.asgi): each one is a
+    coroutine waiting on a future, so idle connections cost no thread. Publishers run in any
+    thread: a delta is encoded once and handed to the event loop of the streams with
+    call_soon_threadsafe, once per loop for all its streams of the event. Only the streams of the
+    same process are reached."""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from book2fest.api import availability
+from book2fest.seatmap import get_seat_map, active_holds, SEAT_PK, SEAT_AVAILABLE
+
+SSE_HEARTBEAT = getattr(settings, 'SSE_HEARTBEAT', 15)
+SSE_QUEUE_SIZE = getattr(settings, 'SSE_QUEUE_SIZE', 100)
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),  # no buffering by nginx
+]
+
+_RESET = {'changed': True}
+
+_subscriptions = defaultdict(set)  # event pk: Subscriptions
+_heartbeats = set()  # event loops with a heartbeat scheduled
+_lock = threading.Lock()
+
+
+def _message(data, event=None):
+    return ((f'event: {event}\n' if event else '') + f'data: {json.dumps(data)}\n\n').encode()
+
+
+class Subscription:
+    """ Messages of the deltas of an event waiting to be sent by a stream, on the event loop of the stream"""
+
+    def __init__(self, event_id, loop):
+        self.event_id = event_id
+        self.loop = loop
+        self.messages = []
+        self.last_sent = loop.time()
+        self.disconnected = False
+        self._waiter = None
+
+    def _wake_up(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def deliver(self, message):
+        if len(self.messages) >= SSE_QUEUE_SIZE:
+            # the client is too slow: it gets a reload instead of the deltas it missed
+            self.messages = [_message(_RESET)]
+        else:
+            self.messages.append(message)
+        self._wake_up()
+
+    def ping(self):
+        """ Wake the stream up without messages, for a keep-alive"""
+        self._wake_up()
+
+    async def get(self):
+        """ The messages delivered since the last call, waiting for some. Empty list for a keep-alive"""
+        if not self.messages:
+            self._waiter = self.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        messages, self.messages = self.messages, []
+        self.last_sent = self.loop.time()
+        return messages
+
+
+def _heartbeat(loop):
+    """ Ping the streams of the loop idle for SSE_HEARTBEAT seconds, every SSE_HEARTBEAT seconds"""
+    with _lock:
+        subscriptions = [subscription for event_subscriptions in _subscriptions.values()
+                         for subscription in event_subscriptions if subscription.loop is loop]
+        if not subscriptions:
+            _heartbeats.discard(loop)
+            return
+    idle = loop.time() - SSE_HEARTBEAT
+    for subscription in subscriptions:
+        if subscription.last_sent <= idle:
+            subscription.ping()
+    loop.call_later(SSE_HEARTBEAT, _heartbeat, loop)
+
+
+def subscribe(event_id):
+    """ New Subscription to the deltas of the event, on the running event loop"""
+    loop = asyncio.get_running_loop()
+    subscription = Subscription(event_id, loop)
+    with _lock:
+        _subscriptions[event_id].add(subscription)
+        heartbeat = loop not in _heartbeats
+        _heartbeats.add(loop)
+    if heartbeat:
+        loop.call_later(SSE_HEARTBEAT, _heartbeat, loop)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        subscriptions = _subscriptions.get(subscription.event_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del _subscriptions[subscription.event_id]
+
+
+def subscribers(event_id):
+    """ Number of the open streams of the event"""
+    with _lock:
+        return len(_subscriptions.get(event_id, ()))
+
+
+def _deliver(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.deliver(message)
+
+
+def publish(event_id, delta):
+    """ Send the delta to the streams of the event, from any thread. It is encoded once for all of them"""
+    with _lock:
+        subscriptions = list(_subscriptions.get(event_id, ()))
+    if not subscriptions:
+        return
+    message = _message(delta)
+    loops = defaultdict(list)
+    for subscription in subscriptions:
+        loops[subscription.loop].append(subscription)
+    for loop, loop_subscriptions in loops.items():
+        try:
+            loop.call_soon_threadsafe(_deliver, loop_subscriptions, message)
+        except RuntimeError:
+            pass  # the loop is closed, its streams are gone
+
+
+def publish_on_commit(event_id, **delta):
+    """ publish() the delta when the current transaction commits"""
+    transaction.on_commit(lambda: publish(event_id, delta))
+
+
+async def _cancel_on_disconnect(receive, stream, subscription):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscription.disconnected = True
+    stream.cancel()
+
+
+def _snapshot(event_id):
+    seat_map = get_seat_map(event_id)
+    if seat_map is None:
+        return None
+    booked = [seat[SEAT_PK] for row in seat_map['rows'] for seat in row['seats'] if not seat[SEAT_AVAILABLE]]
+    return dict(availability(seat_map), booked=booked, held=sorted(int(seat) for seat in active_holds(seat_map)))
+
+
+async def seat_stream(scope, receive, send, event_id):
+    """ ASGI handler streaming the deltas of the event, after a snapshot of its seats (see
+        _snapshot). A comment is sent after SSE_HEARTBEAT seconds of quiet"""
+    # subscribed first: the deltas committed while the snapshot is taken wait in the subscription
+    subscription = subscribe(event_id)
+    # only the snapshot is kept by the stream, not the seat map
+    snapshot = await sync_to_async(_snapshot)(event_id)
+    if snapshot is None:
+        unsubscribe(subscription)
+        await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Event not found'})
+        return
+
+    # a single task waiting for the disconnect, rather than a wait on both at every message
+    watcher = asyncio.ensure_future(_cancel_on_disconnect(receive, asyncio.current_task(), subscription))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n' + _message(snapshot, 'snapshot'),
+                    'more_body': True})
+        while True:
+            messages = await subscription.get()
+            await send({'type': 'http.response.body', 'body': b''.join(messages) or b': keepalive\n\n', 'more_body': True})
+    except asyncio.CancelledError:
+        if not subscription.disconnected:
+            raise
+    finally:
+        unsubscribe(subscription)
+        watcher.cancel()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from book2fest.images import process_images
+from book2fest.models import Artist, Picture
+
+
+class Command(BaseCommand):
+    help = "Generate the resized derivatives of the artist images and event pictures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Process also the images that already have derivatives")
+
+    def handle(self, *args, **options):
+        for model, field_name in ((Artist, 'image'), (Picture, 'img')):
+            instances = model.objects.all()
+            if not options['all']:
+                instances = instances.filter(**{f'{field_name}_hash': ''})
+
+            processed = process_images(instances, field_name)
+            failed = sum(1 for instance in processed if not getattr(instance, f'{field_name}_hash'))
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: {len(processed)} images processed, {failed} failed"))
@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book2fest.importer import import_file, summary, IMPORT_FORMATS
+from book2fest.models import OrganizerProfile
+
+
+class Command(BaseCommand):
+    help = "Import events, with their artists, services and seats, from a JSON or CSV file (see book2fest.importer)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSON or CSV file")
+        parser.add_argument('--organizer', required=True, help="username of the organizer of the events")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="format of the file (default: from the extension)")
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without importing it")
+
+    def handle(self, *args, **options):
+        try:
+            organizer = OrganizerProfile.objects.get(user__username=options['organizer'])
+        except OrganizerProfile.DoesNotExist:
+            raise CommandError(f"No organizer with username {options['organizer']}")
+        import_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError(f"Unknown format {import_format}, use --format")
+
+        with open(options['path'], 'rb') as file:
+            report = import_file(organizer, file, import_format, dry_run=options['dry_run'])
+
+        if report.errors:
+            raise CommandError("\n".join([f"Nothing imported, {len(report.errors)} errors:"] + report.errors))
+        self.stdout.write(self.style.SUCCESS(summary(report)))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from book2fest.counters import rebuild_counters
+from book2fest.models import EventProfile
+
+
+class Command(BaseCommand):
+    help = "Recalculate seats_available, avg_rating and the rating summary of events from seats and reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('events', nargs='*', type=int, help="pk of the events to rebuild (default: all)")
+
+    def handle(self, *args, **options):
+        events = EventProfile.objects.all()
+        if options['events']:
+            events = events.filter(pk__in=options['events'])
+
+        total = rebuild_counters(events)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters of {total} events"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from book2fest.search import rebuild_index, fts_enabled
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of events and artists"
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write(self.style.WARNING("Full-text search is not available on this database"))
+            return
+
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index"))
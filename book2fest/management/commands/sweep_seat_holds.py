@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from book2fest.holds import sweep_holds
+
+
+class Command(BaseCommand):
+    help = "Delete the expired seat holds"
+
+    def handle(self, *args, **options):
+        deleted = sweep_holds()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired seat holds"))
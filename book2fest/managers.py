@@ -0,0 +1,49 @@
+""" Named querysets that load exactly what the templates of each page touch"""
+from django.db import models
+from django.db.models import Prefetch
+
+
+def _related_model(model, field_name):
+    return model._meta.get_field(field_name).related_model
+
+
+class EventProfileQuerySet(models.QuerySet):
+
+    def listing(self):
+        """ Events of the home page cards: names of the artists"""
+        artist = _related_model(self.model, 'artist_list')
+        return self.prefetch_related(Prefetch('artist_list', queryset=artist.objects.only('id', 'full_name')))
+
+    def detail(self):
+        """ Event page: pictures. Artists and services are loaded by the cached fragments of the page"""
+        picture = self.model._meta.get_field('pictures').related_model
+        return self.prefetch_related(Prefetch('pictures', queryset=picture.objects.order_by('pk')))
+
+
+class TicketQuerySet(models.QuerySet):
+
+    def listing(self):
+        """ Tickets of the user ticket list: event of the seat and delivery"""
+        return self.select_related('seat__event', 'delivery')
+
+    def attendees(self):
+        """ Tickets of the event management page: user and seat type"""
+        return self.select_related('user__user', 'seat__seat_type')
+
+
+class ArtistQuerySet(models.QuerySet):
+
+    def listing(self):
+        """ Artists of the artist list: genre and category"""
+        return self.select_related('genre__category')
+
+
+class ReviewQuerySet(models.QuerySet):
+
+    def listing(self):
+        """ Reviews of the event page: name of the user"""
+        return self.select_related('ticket__user__user')
+
+    def published(self):
+        """ Reviews with a rating or a text, not the empty ones created when opening a ticket"""
+        return self.exclude(rating__isnull=True, content__isnull=True)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import resolve, Resolver404
+
+from book2fest import aio
+from book2fest.profiles import get_profile
+from book2fest.routers import replica_alias, use_primary
+
+_logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class QueryRecorder:
+    """ Database execute wrapper that counts the queries run and the time spent running them"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+        self._lock = threading.Lock()  # queries of an async view run in several threads
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.count += 1
+                self.duration += elapsed
+                self.queries.append((sql, elapsed))
+
+    def record(self):
+        """ Context manager that records the queries of every database connection of the thread"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class AsyncCapableMiddleware:
+    """ Middleware serving both sync and async requests. Under ASGI, the chain of the middleware
+        stays async up to the async views (see book2fest.aio): a single sync middleware would run
+        the whole request in the thread of the sync views. Subclasses return self.__acall__(request)
+        from __call__ when self.is_async"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # seen as a coroutine function by the handler, like django's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class QueryProfilingMiddleware(AsyncCapableMiddleware):
+    """ Count the SQL queries run by every view and their timing.
+
+        Results are logged and returned in the X-Query-Count and X-Query-Time headers. Views that
+        go over their budget in settings.QUERY_BUDGETS (view name -> max queries) log a warning.
+        Enabled by settings.QUERY_PROFILING (defaults to DEBUG). Async views record the queries
+        they run in the pool of book2fest.aio"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'QUERY_PROFILING', settings.DEBUG)
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with aio.recording(recorder):
+            response = await self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - start)
+
+    def report(self, request, response, recorder, elapsed):
+        view_name = request.resolver_match.view_name if request.resolver_match else request.path
+        budget = self.budgets.get(view_name)
+        msg = f'{view_name}: {recorder.count} queries in {recorder.duration * 1000:.1f}ms ' \
+              f'(response in {elapsed * 1000:.1f}ms)'
+        if budget is not None and recorder.count > budget:
+            _logger.warning(f'{msg}, over budget of {budget} queries')
+        else:
+            _logger.debug(msg)
+
+        response['X-Query-Count'] = recorder.count
+        response['X-Query-Time'] = f'{recorder.duration * 1000:.1f}ms'
+        return response
+
+
+class ProfileMiddleware(AsyncCapableMiddleware):
+    """ Resolve role and profile of the logged user once per request.
+
+        Sets request.role and request.profile (see book2fest.profiles). Must come after the
+        AuthenticationMiddleware"""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        get_profile(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        await aio.run(get_profile, request)
+        return await self.get_response(request)
+
+
+class PrimaryPinningMiddleware(AsyncCapableMiddleware):
+    """ Read from the primary database during the requests that write.
+
+        Requests with a non-safe method, requests to views with primary_database = True and the
+        requests of the same client for REPLICA_PIN_SECONDS after a write (so that users read their
+        own writes) are pinned to the primary, see book2fest.routers. Does nothing without a replica"""
+
+    cookie_name = 'book2fest_primary'
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = replica_alias() is not None
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled or not self.pinned(request):
+            return self.get_response(request)
+
+        with use_primary():
+            response = self.get_response(request)
+        return self.pin_client(request, response)
+
+    async def __acall__(self, request):
+        if not self.enabled or not self.pinned(request):
+            return await self.get_response(request)
+
+        # the context variable follows the request to the pool of book2fest.aio
+        with use_primary():
+            response = await self.get_response(request)
+        return self.pin_client(request, response)
+
+    def pin_client(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def pinned(self, request):
+        if request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES:
+            return True
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return getattr(getattr(match.func, 'view_class', None), 'primary_database', False)
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.18 on 2026-10-18 07:38
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Q
+
+
+def fill_counters(apps, schema_editor):
+    EventProfile = apps.get_model('book2fest', 'EventProfile')
+    events = EventProfile.objects.annotate(
+        available=Count('seat_event', filter=Q(seat_event__available=True), distinct=True),
+    )
+    for event in events:
+        ratings = apps.get_model('book2fest', 'Review').objects.filter(ticket__seat__event=event, rating__isnull=False)
+        totals = ratings.aggregate(total=Sum('rating'), count=Count('pk'))
+        event.seats_available = event.available
+        event.rating_sum = totals['total'] or 0.0
+        event.rating_count = totals['count']
+        event.avg_rating = event.rating_sum / event.rating_count if event.rating_count else 0.0
+        event.save(update_fields=['seats_available', 'rating_sum', 'rating_count', 'avg_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book2fest', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventprofile',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eventprofile',
+            name='rating_sum',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AlterField(
+            model_name='eventprofile',
+            name='avg_rating',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventprofile',
+            name='seats_available',
+            field=models.IntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+EVENT_FTS_SQL = """
+    CREATE VIRTUAL TABLE book2fest_event_fts USING fts5(
+        event_name, description, artists, genres, categories, tokenize = 'unicode61 remove_diacritics 2')"""
+
+ARTIST_FTS_SQL = """
+    CREATE VIRTUAL TABLE book2fest_artist_fts USING fts5(
+        full_name, genre, category, tokenize = 'unicode61 remove_diacritics 2')"""
+
+EVENT_DOCUMENTS_SQL = """
+    INSERT INTO book2fest_event_fts(rowid, event_name, description, artists, genres, categories)
+    SELECT e.id, e.event_name, e.brief_description || ' ' || e.description,
+        (SELECT group_concat(a.full_name, ' ') FROM book2fest_eventprofile_artist_list ea
+            JOIN book2fest_artist a ON a.id = ea.artist_id WHERE ea.eventprofile_id = e.id),
+        (SELECT group_concat(g.name, ' ') FROM book2fest_eventprofile_artist_list ea
+            JOIN book2fest_artist a ON a.id = ea.artist_id JOIN book2fest_genre g ON g.id = a.genre_id
+            WHERE ea.eventprofile_id = e.id),
+        (SELECT group_concat(c.name, ' ') FROM book2fest_eventprofile_artist_list ea
+            JOIN book2fest_artist a ON a.id = ea.artist_id JOIN book2fest_genre g ON g.id = a.genre_id
+            JOIN book2fest_category c ON c.id = g.category_id WHERE ea.eventprofile_id = e.id)
+    FROM book2fest_eventprofile e"""
+
+ARTIST_DOCUMENTS_SQL = """
+    INSERT INTO book2fest_artist_fts(rowid, full_name, genre, category)
+    SELECT a.id, a.full_name, g.name, c.name FROM book2fest_artist a
+        JOIN book2fest_genre g ON g.id = a.genre_id JOIN book2fest_category c ON c.id = g.category_id"""
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    """ Create and fill the FTS5 tables, only on SQLite builds with FTS5 (otherwise search
+        falls back to LIKE lookups)"""
+    if not fts5_available(schema_editor.connection):
+        return
+    for sql in (EVENT_FTS_SQL, ARTIST_FTS_SQL, EVENT_DOCUMENTS_SQL, ARTIST_DOCUMENTS_SQL):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS book2fest_event_fts")
+        schema_editor.execute("DROP TABLE IF EXISTS book2fest_artist_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book2fest', '0002_event_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
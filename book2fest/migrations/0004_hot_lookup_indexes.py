@@ -0,0 +1,41 @@
+# Generated by Django 3.2.18 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book2fest', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventprofile',
+            index=models.Index(fields=['cancelled', 'event_end'], name='event_cancelled_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventprofile',
+            index=models.Index(fields=['event_name', 'id'], name='event_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventprofile',
+            index=models.Index(fields=['event_start', 'id'], name='event_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventprofile',
+            index=models.Index(fields=['-avg_rating', 'id'], name='event_avg_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventprofile',
+            index=models.Index(fields=['-seats_available', 'id'], name='event_seats_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(fields=['event', 'row', 'number'], name='seat_event_row_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(condition=models.Q(('available', True)), fields=['event', 'row'], name='seat_event_available_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.18 on 2026-10-18 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book2fest', '0004_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='img_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.18 on 2026-10-18 08:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Count, Sum, Max
+import django.db.models.deletion
+
+
+def fill_reviews(apps, schema_editor):
+    Review = apps.get_model('book2fest', 'Review')
+    Seat = apps.get_model('book2fest', 'Seat')
+    RatingSummary = apps.get_model('book2fest', 'RatingSummary')
+
+    Review.objects.update(event=Subquery(Seat.objects.filter(ticket_seat=OuterRef('ticket')).values('event')[:1]))
+    summaries = {}
+    ratings = (Review.objects.filter(rating__isnull=False).order_by().values('event', 'rating')
+               .annotate(reviews=Count('pk'), total=Sum('rating'), last=Max('date')))
+    for row in ratings:
+        summary = summaries.setdefault(row['event'], RatingSummary(event_id=row['event']))
+        field = f"stars_{min(5, max(0, int(row['rating'] + 0.5)))}"
+        setattr(summary, field, getattr(summary, field) + row['reviews'])
+        summary.count += row['reviews']
+        summary.total += row['total']
+        summary.last_review = max(filter(None, (summary.last_review, row['last'])), default=None)
+    RatingSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book2fest', '0006_seat_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingSummary',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='book2fest.eventprofile')),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('stars_0', models.IntegerField(default=0)),
+                ('stars_1', models.IntegerField(default=0)),
+                ('stars_2', models.IntegerField(default=0)),
+                ('stars_3', models.IntegerField(default=0)),
+                ('stars_4', models.IntegerField(default=0)),
+                ('stars_5', models.IntegerField(default=0)),
+                ('last_review', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='event',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='book2fest.eventprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['event', '-date', 'id'], name='review_event_date_idx'),
+        ),
+        migrations.RunPython(fill_reviews, migrations.RunPython.noop),
+    ]
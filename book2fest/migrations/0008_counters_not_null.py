@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def fill_nulls(apps, schema_editor):
+    EventProfile = apps.get_model('book2fest', 'EventProfile')
+    EventProfile.objects.filter(seats_available__isnull=True).update(seats_available=0)
+    EventProfile.objects.filter(avg_rating__isnull=True).update(avg_rating=0.0)
+
+
+# the counters are never NULL (see book2fest.counters): without NULLs, the next pages of the event
+# list ordered by -avg_rating or -seats_available are a range of their index
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book2fest', '0007_rating_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_nulls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='eventprofile',
+            name='avg_rating',
+            field=models.FloatField(blank=True, default=0.0),
+        ),
+        migrations.AlterField(
+            model_name='eventprofile',
+            name='seats_available',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.shortcuts import redirect
 from django.contrib import messages
-from book2fest.models import OrganizerProfile, UserProfile, EventProfile
+from book2fest.models import EventProfile
+from book2fest.profiles import get_profile, ROLE_ORGANIZER, ROLE_USER
 
 class OrganizerRequiredMixin:
     """ Mixin that requires a Organize User logged to dispatch, otherwise
@@ -10,13 +11,13 @@ class OrganizerRequiredMixin:
         self.profile = None
 
     def dispatch(self, request, *args, **kwargs):
-        try:
-            self.profile = OrganizerProfile.objects.get(user=request.user)
+        role, profile = get_profile(request)  # resolved once per request by the ProfileMiddleware
+        if role == ROLE_ORGANIZER:
+            self.profile = profile
             return super().dispatch(request, *args, **kwargs)
 
-        except ObjectDoesNotExist:
-            messages.error(request, "You have no authorization to access this page." )
-            return redirect('book2fest:user-profile')
+        messages.error(request, "You have no authorization to access this page." )
+        return redirect('book2fest:user-profile')
 
 
 
@@ -27,13 +28,13 @@ class UserRequiredMixin:
         self.profile = None
 
     def dispatch(self, request, *args, **kwargs):
-        try:
-            self.profile = UserProfile.objects.get(user=request.user)
+        role, profile = get_profile(request)
+        if role == ROLE_USER:
+            self.profile = profile
             return super().dispatch(request, *args, **kwargs)
 
-        except ObjectDoesNotExist:
-            messages.error(request, "You have no authorization to access this page.")
-            return redirect('book2fest:organizer-profile')
+        messages.error(request, "You have no authorization to access this page.")
+        return redirect('book2fest:organizer-profile')
 
 
 class EventOwnerMixin:
@@ -48,7 +49,7 @@ class EventOwnerMixin:
             self.event_profile = EventProfile.objects.get(pk=kwargs.get('pk')) # checks if event exists
 
             if self.profile: #check id user is logged in
-                if self.event_profile.user == self.profile: #checks if user is owner
+                if self.event_profile.user_id == self.profile.pk: #checks if user is owner
                     return super().dispatch(request, *args, **kwargs)
 
         except ObjectDoesNotExist:
@@ -1,11 +1,13 @@
 from django.core.validators import FileExtensionValidator
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import IntegerField, When, Count, Case, Sum
+from django.db.models import IntegerField, When, Count, Case, Sum, Q
 from django.db.models.functions import datetime
 from django.template.defaulttags import register
 from django.utils.datetime_safe import date
 
+from book2fest.managers import EventProfileQuerySet, TicketQuerySet, ArtistQuerySet, ReviewQuerySet
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, related_name='user_profile', on_delete=models.CASCADE)
@@ -43,8 +45,11 @@ class Genre(models.Model):
 class Artist(models.Model):
     full_name = models.CharField(max_length=32)
     image = models.ImageField(upload_to='images/')
+    image_hash = models.CharField(max_length=32, blank=True, default='', editable=False)  # see book2fest.images
     genre = models.ForeignKey(Genre, related_name='artist_genre', on_delete=models.CASCADE)
 
+    objects = ArtistQuerySet.as_manager()
+
     def __str__(self):
         return self.full_name
 
@@ -88,13 +93,29 @@ class EventProfile(models.Model):
     address = models.CharField(max_length=32)
     how_to_reach = models.CharField(max_length=300)
     max_capacity = models.IntegerField()
-    seats_available = models.IntegerField(default=None, blank=True, null=True)
-    avg_rating = models.FloatField(default=None, blank=True, null=True)
+    # denormalized counters, maintained by book2fest.counters
+    seats_available = models.IntegerField(default=0, blank=True)
+    avg_rating = models.FloatField(default=0.0, blank=True)
+    rating_sum = models.FloatField(default=0.0)
+    rating_count = models.IntegerField(default=0)
     event_start = models.DateTimeField()
     event_end = models.DateTimeField()
     services = models.ManyToManyField(Service)
     cancelled = models.BooleanField(default=False)
 
+    objects = EventProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # HomeView: events not cancelled and not ended
+            models.Index(fields=['cancelled', 'event_end'], name='event_cancelled_end_idx'),
+            # EventList orderings, with the pk tie-breaker of the cursor pagination
+            models.Index(fields=['event_name', 'id'], name='event_name_idx'),
+            models.Index(fields=['event_start', 'id'], name='event_start_idx'),
+            models.Index(fields=['-avg_rating', 'id'], name='event_avg_rating_idx'),
+            models.Index(fields=['-seats_available', 'id'], name='event_seats_available_idx'),
+        ]
+
     @property
     def is_past(self):
         return date.today() > self.event_end
@@ -112,6 +133,7 @@ class Picture(models.Model):
     name = models.CharField(max_length=20)
     description = models.CharField(max_length=200)
     img = models.ImageField(upload_to='pictures/')
+    img_hash = models.CharField(max_length=32, blank=True, default='', editable=False)  # see book2fest.images
     event = models.ForeignKey(EventProfile, related_name='pictures', on_delete=models.PROTECT)
 
     def __str__(self):
@@ -134,23 +156,81 @@ class Seat(models.Model):
     available = models.BooleanField(default=True)
     seat_type = models.ForeignKey(SeatType, related_name='seat_type', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # seat map and seat numbering, per row
+            models.Index(fields=['event', 'row', 'number'], name='seat_event_row_number_idx'),
+            # available seats of an event (booking form, counters), only the available ones are indexed
+            models.Index(fields=['event', 'row'], condition=Q(available=True), name='seat_event_available_idx'),
+        ]
+
     def __str__(self):
         return f'{self.event}: {self.seat_type.name} #{self.number} on row {self.row}'
 
 
+class SeatHold(models.Model):
+    """ Short lived hold of a user on a seat, see book2fest.holds"""
+    seat = models.OneToOneField(Seat, primary_key=True, related_name='hold', on_delete=models.CASCADE)
+    user = models.ForeignKey(UserProfile, related_name='seat_holds', on_delete=models.CASCADE)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.seat_id} held by {self.user_id} until {self.expires_at}'
+
+
 class Ticket(models.Model):
     seat = models.OneToOneField(Seat, related_name='ticket_seat', on_delete=models.CASCADE)
     user = models.ForeignKey(UserProfile, related_name="ticket_user", on_delete=models.CASCADE)
     delivery = models.ForeignKey(Delivery, related_name='ticket_delivery', on_delete=models.CASCADE)
 
+    objects = TicketQuerySet.as_manager()
+
 
 class Review(models.Model):
     rating = models.FloatField(null=True)
     date = models.DateTimeField(default=datetime.Now())
     content = models.TextField(null=True)
     ticket = models.OneToOneField(Ticket, related_name='review_structure', on_delete=models.CASCADE)
+    # event of the ticket, denormalized on save to page the reviews of an event with an index
+    event = models.ForeignKey(EventProfile, related_name='reviews', null=True, editable=False, on_delete=models.CASCADE)
+
+    objects = ReviewQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # reviews of the event page, newest first, with the pk tie-breaker of the cursor pagination
+            models.Index(fields=['event', '-date', 'id'], name='review_event_date_idx'),
+        ]
 
     def __str__(self):
         return f'{self.ticket.seat.event.event_name}-{self.rating}'
 
 
+class RatingSummary(models.Model):
+    """ Ratings of the reviews of an event, maintained by book2fest.counters"""
+    STARS = range(6)
+
+    event = models.OneToOneField(EventProfile, primary_key=True, related_name='rating_summary', on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    # histogram: reviews per rating, rounded to the nearest star
+    stars_0 = models.IntegerField(default=0)
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+    last_review = models.DateTimeField(null=True)
+
+    @staticmethod
+    def stars_field(rating):
+        """ Name of the histogram field of the rating"""
+        return f'stars_{min(5, max(0, int(rating + 0.5)))}'
+
+    @property
+    def histogram(self):
+        """ (stars, reviews, percentage of the reviews) from 5 stars down"""
+        return [(stars, getattr(self, f'stars_{stars}'), round(100 * getattr(self, f'stars_{stars}') / self.count) if self.count else 0)
+                for stars in reversed(self.STARS)]
+
+
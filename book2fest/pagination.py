@@ -0,0 +1,160 @@
+""" Keyset (cursor) pagination for list views.
+
+    Pages are fetched with a WHERE on the values of the ordering fields of the last row of the
+    previous page, instead of an OFFSET, so deep pages cost the same as the first one. The pk is
+    always added to the ordering as tie-breaker, to make the order total. The values of a cursor
+    come from the client: they are converted by the fields of the ordering, and a cursor whose
+    values do not fit is invalid."""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+
+def _field_value(obj, field):
+    for attr in field.split('__'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _ordering_field(queryset, name):
+    """ Field of an ordering name of the queryset: a field of the model, through relations, or an annotation"""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    model, parts = queryset.model, name.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    return model._meta.pk if parts[-1] == 'pk' else model._meta.get_field(parts[-1])
+
+
+def _nullable(queryset, name):
+    # an annotation can be NULL whatever its output field
+    return name in queryset.query.annotations or _ordering_field(queryset, name).null
+
+
+def keyset_filter(ordering, values, queryset):
+    """ Q selecting the rows of the queryset that come after the row with the given values of the
+        ordering fields: a >= va AND ((a > va) OR (a = va AND b > vb) OR ...)
+
+        The redundant a >= va lets the database search the index of the first field instead of
+        scanning it from the start. The NULLs of nullable fields sort where the database puts them:
+        before the other values, or after them if connection.features.nulls_order_largest"""
+    nulls_largest = connections[queryset.db].features.nulls_order_largest
+    condition = Q()
+    equal = Q()
+    bound = None
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        # NULLs come after the other values in this direction
+        nulls_after = _nullable(queryset, name) and nulls_largest != descending
+        if value is None:
+            after = None if nulls_after else Q(**{f'{name}__isnull': False})
+            same = Q(**{f'{name}__isnull': True})
+        else:
+            after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            if nulls_after:
+                after |= Q(**{f'{name}__isnull': True})
+            same = Q(**{name: value})
+        if after is not None:
+            condition |= equal & after
+        if bound is None:
+            bound = Q()
+            if value is not None:
+                bound = Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+                if nulls_after:
+                    bound |= Q(**{f'{name}__isnull': True})
+        equal &= same
+    return bound & condition if bound else condition
+
+
+def encode_cursor(ordering, values):
+    # datetimes with their microseconds: DjangoJSONEncoder keeps milliseconds only
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    data = json.dumps({'o': ordering, 'v': values}, cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor, ordering, queryset):
+    """ Values of the cursor for the ordering of the queryset, converted by the fields of the
+        ordering. None if the cursor is invalid or was made for another ordering"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(data, dict) or data.get('o') != ordering or not isinstance(data.get('v'), list) \
+            or len(data['v']) != len(ordering):
+        return None
+    values = []
+    for field, value in zip(ordering, data['v']):
+        name = field.lstrip('-')
+        if value is None and not _nullable(queryset, name):
+            return None
+        try:
+            values.append(None if value is None else _ordering_field(queryset, name).to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            return None
+    return values
+
+
+class KeysetPage:
+    """ Page of a keyset paginated list, used as page_obj in the templates"""
+
+    def __init__(self, object_list, next_url=None, first_url=None):
+        self.object_list = object_list
+        self.next_url = next_url
+        self.first_url = first_url
+
+    @property
+    def has_next(self):
+        return self.next_url is not None
+
+    @property
+    def has_previous(self):
+        return self.first_url is not None
+
+
+class KeysetPaginationMixin:
+    """ ListView mixin paginating the queryset with cursors. The active ordering is the one of
+        get_ordering() or, if None, the ordering of the queryset. It keeps the other GET
+        parameters (search, filters, ordering) in the links to the next page"""
+    paginate_by = 20
+    cursor_param = 'cursor'
+
+    def get_keyset_ordering(self, queryset):
+        ordering = self.get_ordering() or queryset.query.order_by
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        ordering = [field for field in ordering if field.lstrip('-') not in ('pk', 'id')]
+        return ordering + ['pk']
+
+    def _page_url(self, cursor):
+        params = self.request.GET.copy()
+        params.pop(self.cursor_param, None)
+        if cursor:
+            params[self.cursor_param] = cursor
+        return f'?{params.urlencode()}'
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+
+        cursor = self.request.GET.get(self.cursor_param)
+        values = decode_cursor(cursor, ordering, queryset) if cursor else None
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values, queryset))
+
+        rows = list(queryset[:page_size + 1])
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_url = self._page_url(encode_cursor(ordering, [_field_value(last, field.lstrip('-')) for field in ordering]))
+
+        page = KeysetPage(rows, next_url=next_url, first_url=self._page_url(None) if values is not None else None)
+        return None, page, rows, page.has_next or page.has_previous
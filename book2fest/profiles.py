@@ -0,0 +1,73 @@
+""" Role and profile of the logged user, resolved once per request.
+
+    ProfileMiddleware sets request.role (ROLE_USER, ROLE_ORGANIZER or None) and request.profile
+    (UserProfile, OrganizerProfile or None). The resolved profile is cached per session for
+    PROFILE_CACHE_TIMEOUT seconds; saving or deleting a profile invalidates the cache of its user."""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from book2fest.models import UserProfile, OrganizerProfile
+
+PROFILE_CACHE_TIMEOUT = getattr(settings, 'PROFILE_CACHE_TIMEOUT', 60)
+
+ROLE_USER = 'user'
+ROLE_ORGANIZER = 'organizer'
+
+
+def _cache_key(session_key):
+    return f'book2fest:profile:{session_key}'
+
+
+def _stamp_key(user_id):
+    return f'book2fest:profile-stamp:{user_id}'
+
+
+def resolve_profile(user):
+    """ Return (role, profile) of the user, (None, None) if the user has no profile"""
+    if not user.is_authenticated:
+        return None, None
+
+    profile = UserProfile.objects.filter(user=user).first()
+    if profile:
+        return ROLE_USER, profile
+
+    profile = OrganizerProfile.objects.filter(user=user).first()
+    if profile:
+        return ROLE_ORGANIZER, profile
+
+    return None, None
+
+
+def get_profile(request):
+    """ Return (role, profile) of the user logged in the request, resolved at most once per request"""
+    if not hasattr(request, 'role'):
+        request.role, request.profile = _cached_profile(request)
+    return request.role, request.profile
+
+
+def _cached_profile(request):
+    user = request.user
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    if not user.is_authenticated or not session_key:
+        return resolve_profile(user)
+
+    key, stamp_key = _cache_key(session_key), _stamp_key(user.pk)
+    cached = cache.get_many([key, stamp_key])
+    entry = cached.get(key)
+    # an entry is valid for the user it was resolved for, if no profile of the user changed since
+    if entry and entry[0] == user.pk and entry[1] > cached.get(stamp_key, 0):
+        role, profile = entry[2], entry[3]
+    else:
+        role, profile = resolve_profile(user)
+        cache.set(key, (user.pk, time.time(), role, profile), PROFILE_CACHE_TIMEOUT)
+
+    if profile:
+        profile.user = user  # the user of the request is always fresh
+    return role, profile
+
+
+def invalidate(user_id):
+    """ Drop the cached profile of the user in every session"""
+    cache.set(_stamp_key(user_id), time.time(), PROFILE_CACHE_TIMEOUT)
@@ -0,0 +1,61 @@
+""" "Events attended by people who attended my events", computed with set-based queries.
+
+    recommended_events() ranks upcoming events by the number of co-attendees holding a ticket
+    for them and caches the ranking per user. The cache of a user is invalidated when the user
+    books or loses a ticket; rankings of the other users expire after RECOMMENDATIONS_TIMEOUT.
+    Events cancelled or finished meanwhile are left out of the cached rankings when loaded."""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from book2fest.models import EventProfile, Ticket
+
+RECOMMENDATIONS_TIMEOUT = getattr(settings, 'RECOMMENDATIONS_TIMEOUT', 10 * 60)
+RECOMMENDATIONS_SIZE = 20  # events ranked and cached per user
+
+
+def _cache_key(user_id):
+    return f'book2fest:recommended:{user_id}'
+
+
+def _upcoming(queryset):
+    return queryset.filter(cancelled=False, event_end__gt=timezone.now())
+
+
+def rank_events(user_id, limit=RECOMMENDATIONS_SIZE):
+    """ Return the pk of the upcoming events attended by co-attendees of the user, that the user
+        has no ticket for, ordered by number of co-attendees (single query)"""
+    my_events = Ticket.objects.filter(user__user_id=user_id).values('seat__event')
+    co_attendees = Ticket.objects.filter(seat__event__in=my_events).exclude(user__user_id=user_id).values('user')
+
+    ranking = (_upcoming(EventProfile.objects)
+               .filter(seat_event__ticket_seat__user__in=co_attendees)
+               .exclude(pk__in=my_events)
+               .annotate(overlap=Count('seat_event__ticket_seat__user', distinct=True))
+               .order_by('-overlap', 'event_start', 'pk')
+               .values_list('pk', flat=True))
+    return list(ranking[:limit])
+
+
+def recommended_events(user, limit=5, queryset=None):
+    """ Return the list of events recommended to the user, best first"""
+    if not user.is_authenticated:
+        return []
+
+    key = _cache_key(user.pk)
+    ranking = cache.get(key)
+    if ranking is None:
+        ranking = rank_events(user.pk)
+        cache.set(key, ranking, RECOMMENDATIONS_TIMEOUT)
+
+    if not ranking:
+        return []
+    queryset = EventProfile.objects.all() if queryset is None else queryset
+    events = _upcoming(queryset).in_bulk(ranking)
+    return [events[pk] for pk in ranking if pk in events][:limit]
+
+
+def invalidate(user_id):
+    """ Drop the cached recommendations of the user"""
+    cache.delete(_cache_key(user_id))
@@ -0,0 +1,56 @@
+""" Routing of the queries between the primary database and an optional read replica.
+
+    When settings.DATABASE_REPLICA names a configured database, reads go to it and writes to the
+    primary ('default'). Reads go to the primary as well inside a transaction of the primary and
+    while pinned with use_primary(): the PrimaryPinningMiddleware pins the requests that write, so
+    that a booking never reads stale seats from the replica."""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+# a context variable follows the request from the middleware to sync views run in a thread (ASGI)
+_pinned = contextvars.ContextVar('book2fest_use_primary', default=False)
+
+
+def replica_alias():
+    """ Alias of the read replica, None if there is none"""
+    alias = getattr(settings, 'DATABASE_REPLICA', None)
+    return alias if alias and alias in connections.databases else None
+
+
+@contextmanager
+def use_primary():
+    """ Route every read of the block to the primary database"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def pinned_to_primary():
+    return _pinned.get()
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replica = replica_alias()
+        if replica is None or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # primary and replica hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema from the primary
+        if db == replica_alias():
+            return False
+        return None
@@ -0,0 +1,147 @@
+""" Full-text search over events and artists, backed by SQLite FTS5.
+
+    Two FTS5 tables are kept in sync by the signals in book2fest.signals:
+
+        book2fest_event_fts(event_name, description, artists, genres, categories), rowid = event pk
+        book2fest_artist_fts(full_name, genre, category), rowid = artist pk
+
+    Queries are prefix matching: every word of the query must be the prefix of a word of the
+    searched column(s). Matching rows are ranked by bm25 with event_rank() and artist_rank(). When
+    FTS5 is not available (e.g. on other databases) searches fall back to LIKE lookups, unranked."""
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.expressions import RawSQL
+
+from book2fest.models import EventProfile, Artist
+
+EVENT_FTS = 'book2fest_event_fts'
+ARTIST_FTS = 'book2fest_artist_fts'
+
+# search-filter of the views -> FTS column
+EVENT_COLUMNS = {'event_name': 'event_name', 'artist': 'artists', 'genre': 'genres', 'category': 'categories'}
+ARTIST_COLUMNS = {'name': 'full_name', 'genre': 'genre', 'category': 'category'}
+
+# search-filter of the views -> LIKE lookup, used when FTS5 is not available
+EVENT_LOOKUPS = {'event_name': 'event_name__contains', 'artist': 'artist_list__full_name__contains',
+                 'genre': 'artist_list__genre__name__contains', 'category': 'artist_list__genre__category__name__contains'}
+ARTIST_LOOKUPS = {'name': 'full_name__contains', 'genre': 'genre__name__contains',
+                  'category': 'genre__category__name__contains'}
+
+EVENT_DOCUMENTS_SQL = f"""
+    INSERT INTO {EVENT_FTS}(rowid, event_name, description, artists, genres, categories)
+    SELECT e.id, e.event_name, e.brief_description || ' ' || e.description,
+        (SELECT group_concat(a.full_name, ' ') FROM book2fest_eventprofile_artist_list ea
+            JOIN book2fest_artist a ON a.id = ea.artist_id WHERE ea.eventprofile_id = e.id),
+        (SELECT group_concat(g.name, ' ') FROM book2fest_eventprofile_artist_list ea
+            JOIN book2fest_artist a ON a.id = ea.artist_id JOIN book2fest_genre g ON g.id = a.genre_id
+            WHERE ea.eventprofile_id = e.id),
+        (SELECT group_concat(c.name, ' ') FROM book2fest_eventprofile_artist_list ea
+            JOIN book2fest_artist a ON a.id = ea.artist_id JOIN book2fest_genre g ON g.id = a.genre_id
+            JOIN book2fest_category c ON c.id = g.category_id WHERE ea.eventprofile_id = e.id)
+    FROM book2fest_eventprofile e"""
+
+ARTIST_DOCUMENTS_SQL = f"""
+    INSERT INTO {ARTIST_FTS}(rowid, full_name, genre, category)
+    SELECT a.id, a.full_name, g.name, c.name FROM book2fest_artist a
+        JOIN book2fest_genre g ON g.id = a.genre_id JOIN book2fest_category c ON c.id = g.category_id"""
+
+REINDEX_CHUNK_SIZE = 500
+
+_enabled = {}
+
+
+def fts_enabled(using='default'):
+    """ True if the FTS5 tables exist on the database"""
+    if using not in _enabled:
+        connection = connections[using]
+        _enabled[using] = connection.vendor == 'sqlite' and EVENT_FTS in connection.introspection.table_names()
+    return _enabled[using]
+
+
+def match_expression(query, column=None):
+    """ FTS5 query matching the rows where every word of query is the prefix of a word
+        (of column, if given). None if the query has no words"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    expression = ' AND '.join(f'"{word}"*' for word in words)
+    return f'{column} : ({expression})' if column else expression
+
+
+def _reindex(table, documents_sql, key, pks, using):
+    if not fts_enabled(using):
+        return
+    pks = list(pks)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(pks), REINDEX_CHUNK_SIZE):
+            chunk = pks[start:start + REINDEX_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(f'{documents_sql} WHERE {key} IN ({placeholders})', chunk)
+
+
+def index_events(pks, using='default'):
+    """ (Re)index the events with the given pk"""
+    _reindex(EVENT_FTS, EVENT_DOCUMENTS_SQL, 'e.id', pks, using)
+
+
+def index_artists(pks, using='default'):
+    """ (Re)index the artists with the given pk"""
+    _reindex(ARTIST_FTS, ARTIST_DOCUMENTS_SQL, 'a.id', pks, using)
+
+
+def rebuild_index(using='default'):
+    """ Rebuild both the FTS tables from scratch"""
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        for table, documents_sql in ((EVENT_FTS, EVENT_DOCUMENTS_SQL), (ARTIST_FTS, ARTIST_DOCUMENTS_SQL)):
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(documents_sql)
+
+
+def _matching(model, table, columns, lookups, query, field):
+    """ Expression usable in pk__in selecting the rows matching the query"""
+    if fts_enabled():
+        expression = match_expression(query, columns.get(field))
+        if expression is None:
+            return model.objects.none().values('pk')
+        return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [expression])
+    lookup = lookups.get(field) or next(iter(lookups.values()))
+    return model.objects.filter(**{lookup: query}).values('pk')
+
+
+def search_events(query, field=None):
+    """ Expression usable in pk__in selecting the events matching the query. field is a
+        search-filter of the views (event_name, artist, genre, category), None for all"""
+    return _matching(EventProfile, EVENT_FTS, EVENT_COLUMNS, EVENT_LOOKUPS, query, field)
+
+
+def search_artists(query, field=None):
+    """ Expression usable in pk__in selecting the artists matching the query. field is a
+        search-filter of ArtistList (name, genre, category), None for all"""
+    return _matching(Artist, ARTIST_FTS, ARTIST_COLUMNS, ARTIST_LOOKUPS, query, field)
+
+
+def _rank(table, columns, query, field, key):
+    if not fts_enabled():
+        return None
+    expression = match_expression(query, columns.get(field))
+    if expression is None:
+        return None
+    # (SELECT rank FROM table WHERE table MATCH %s AND rowid = <key>)
+    return Func(Value(expression), F(key), template=f'(SELECT rank FROM {table} WHERE {table} MATCH %(expressions)s)',
+                arg_joiner=' AND rowid = ', output_field=FloatField())
+
+
+def event_rank(query, field=None, key='pk'):
+    """ Expression of the bm25 rank of the events matching the query, lower is better, for
+        annotate() and order_by(). key is the lookup of the event pk. None without FTS5"""
+    return _rank(EVENT_FTS, EVENT_COLUMNS, query, field, key)
+
+
+def artist_rank(query, field=None, key='pk'):
+    """ Expression of the bm25 rank of the artists matching the query, like event_rank()"""
+    return _rank(ARTIST_FTS, ARTIST_COLUMNS, query, field, key)
@@ -0,0 +1,66 @@
+""" Seat map generation: create the seats of an event from a layout of seat blocks"""
+from collections import namedtuple
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Max, IntegerField
+from django.db.models.functions import Cast
+
+from book2fest import allocator, caching, live, seatmap
+from book2fest.counters import seats_changed
+from book2fest.models import Seat, EventProfile
+
+SEATS_CHUNK_SIZE = 1000
+
+# rows: iterable of row names, every row gets seats_per_row seats of the given type and price
+SeatBlock = namedtuple('SeatBlock', ['rows', 'seats_per_row', 'seat_type', 'price'])
+
+
+def _next_numbers(event, rows):
+    """ Return {row: first free seat number} for the rows of the event that already have seats"""
+    last = (Seat.objects.filter(event=event, row__in=rows).order_by().values('row')
+            .annotate(last=Max(Cast('number', IntegerField()))).values_list('row', 'last'))
+    return {row: number + 1 for row, number in last}
+
+
+def _build_seats(event, layout, next_numbers):
+    for block in layout:
+        for row in block.rows:
+            start = next_numbers.get(row, 0)
+            next_numbers[row] = start + block.seats_per_row
+            for number in range(start, start + block.seats_per_row):
+                yield Seat(event=event, row=row, number=number, price=block.price, seat_type=block.seat_type,
+                           available=True)
+
+
+def generate_seats(event, layout, chunk_size=SEATS_CHUNK_SIZE):
+    """ Check the maximum capacity of event, then create the seats of the layout with chunked
+        bulk inserts in a single transaction. Seat numbers continue from the last one of each row.
+        Return (flag, msg) like add_seats"""
+    layout = list(layout)
+    if any(block.seats_per_row < 0 for block in layout):
+        return False, "Can't add a negative number of seats"
+    total_new = sum(len(block.rows) * block.seats_per_row for block in layout)
+
+    with transaction.atomic():
+        # lock the event row (where supported), so concurrent generators can't exceed the capacity
+        EventProfile.objects.select_for_update().filter(pk=event.pk).exists()
+        total_event_seats = Seat.objects.filter(event=event).aggregate(total=Count('pk'))['total']
+        if total_event_seats + total_new > event.max_capacity:
+            return False, "Max capacity exceeded"
+
+        rows = {row for block in layout for row in block.rows}
+        seats = _build_seats(event, layout, _next_numbers(event, rows))
+        while True:
+            chunk = list(islice(seats, chunk_size))
+            if not chunk:
+                break
+            Seat.objects.bulk_create(chunk)
+
+        seats_changed(event.pk, total_new)
+        transaction.on_commit(lambda: seatmap.invalidate(event.pk))
+        transaction.on_commit(lambda: allocator.invalidate(event.pk))
+        live.publish_on_commit(event.pk, changed=True)
+        caching.bump_on_commit(event.pk)  # bulk_create sends no signals
+
+    return True, f"Added {total_new} seats"
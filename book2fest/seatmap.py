@@ -0,0 +1,248 @@
+""" Cached, serialized seat map of an event.
+
+    The seat map is built with a single query and kept in the cache in a compact form:
+
+        {'event': pk, 'name': 'Event - 2021', 'available': 10, 'occupied': 2,
+         'types': {'1': 'Parterre'},
+         'rows': [{'row': 'A', 'seats': [[seat pk, number, price, seat type pk, available], ...]}, ...],
+         'holds': {'<seat pk>': [expiry timestamp, user profile pk], ...}}
+
+    Bookings and seat holds patch the cached seat map in place, new seats invalidate it. Expired
+    holds are ignored when reading. Patches are serialized per event by a lock in the cache, and
+    stamp a new generation of the seat map: a seat map built from the db is cached only if no
+    patch happened meanwhile, since it may have been read before the change. The same structure is used by the event page, the ticket form
+    and the seat map JSON endpoint, which hides the holders."""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from book2fest.models import EventProfile, Seat
+
+SEAT_MAP_TIMEOUT = getattr(settings, 'SEAT_MAP_TIMEOUT', 5 * 60)
+# seconds a patch may hold the lock of a seat map, if its process dies meanwhile
+SEAT_MAP_LOCK_TIMEOUT = getattr(settings, 'SEAT_MAP_LOCK_TIMEOUT', 5)
+
+# positions of the fields of a seat in the seat map
+SEAT_PK, SEAT_NUMBER, SEAT_PRICE, SEAT_TYPE, SEAT_AVAILABLE = range(5)
+
+
+def _cache_key(event_id):
+    return f'book2fest:seatmap:v2:{event_id}'
+
+
+def _lock_key(event_id):
+    return f'{_cache_key(event_id)}:lock'
+
+
+def _generation_key(event_id):
+    return f'{_cache_key(event_id)}:generation'
+
+
+@contextmanager
+def _locked(event_id, wait=SEAT_MAP_LOCK_TIMEOUT):
+    """ Lock of the cached seat map of the event, across threads and processes. Yields whether it
+        was acquired within wait seconds"""
+    key, token = _lock_key(event_id), uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    acquired = cache.add(key, token, SEAT_MAP_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.002)
+        acquired = cache.add(key, token, SEAT_MAP_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def _patch(event_id, patch):
+    """ Apply patch(seat_map) to the cached seat map of the event, if any, under the lock"""
+    key = _cache_key(event_id)
+    with _locked(event_id) as acquired:
+        cache.set(_generation_key(event_id), uuid.uuid4().hex, None)
+        if not acquired:
+            cache.delete(key)  # not patched, so not left stale either
+            return
+        seat_map = cache.get(key)
+        if seat_map is not None:
+            patch(seat_map)
+            cache.set(key, seat_map, SEAT_MAP_TIMEOUT)
+
+
+def _seat_number(number):
+    try:
+        return int(number)
+    except ValueError:
+        return number
+
+
+def build_seat_map(event_id):
+    """ Build the seat map of the event from the db, None if the event does not exist"""
+    event = EventProfile.objects.filter(pk=event_id).only('event_name', 'event_start').first()
+    if event is None:
+        return None
+
+    seats = (Seat.objects.filter(event=event_id).order_by()
+             .values_list('pk', 'row', 'number', 'price', 'seat_type', 'seat_type__name', 'available',
+                          'hold__expires_at', 'hold__user'))
+
+    rows = {}
+    types = {}
+    holds = {}
+    available = 0
+    now = time.time()
+    for pk, row, number, price, seat_type, type_name, is_available, hold_expires, holder in seats:
+        rows.setdefault(row, []).append([pk, _seat_number(number), price, seat_type, int(is_available)])
+        types[str(seat_type)] = type_name
+        available += is_available
+        if is_available and hold_expires and hold_expires.timestamp() > now:
+            holds[str(pk)] = [hold_expires.timestamp(), holder]
+
+    for row_seats in rows.values():
+        row_seats.sort(key=lambda seat: (isinstance(seat[SEAT_NUMBER], str), seat[SEAT_NUMBER], seat[SEAT_PK]))
+
+    total = sum(len(row_seats) for row_seats in rows.values())
+    return {
+        'event': event.pk,
+        'name': str(event),
+        'available': available,
+        'occupied': total - available,
+        'types': types,
+        'rows': [{'row': row, 'seats': rows[row]} for row in sorted(rows)],
+        'holds': holds,
+    }
+
+
+def refresh_seat_map(event_id):
+    """ Build the seat map of the event from the db and cache it, unless a patch happened
+        meanwhile or another thread holds the lock. None if the event does not exist"""
+    generation = cache.get(_generation_key(event_id))
+    seat_map = build_seat_map(event_id)
+    if seat_map is not None:
+        with _locked(event_id, wait=0) as acquired:
+            if acquired and cache.get(_generation_key(event_id)) == generation:
+                cache.set(_cache_key(event_id), seat_map, SEAT_MAP_TIMEOUT)
+    return seat_map
+
+
+def get_seat_map(event_id):
+    """ Return the seat map of the event, from the cache when possible"""
+    seat_map = cache.get(_cache_key(event_id))
+    if seat_map is None:
+        seat_map = refresh_seat_map(event_id)
+    return seat_map
+
+
+def seats_booked(event_id, seat_ids):
+    """ Mark the seats as not available in the cached seat map, if any"""
+    seat_ids = set(seat_ids)
+
+    def patch(seat_map):
+        for seat_id in seat_ids:
+            seat_map['holds'].pop(str(seat_id), None)
+        for row in seat_map['rows']:
+            for seat in row['seats']:
+                if seat[SEAT_PK] in seat_ids and seat[SEAT_AVAILABLE]:
+                    seat[SEAT_AVAILABLE] = 0
+                    seat_map['available'] -= 1
+                    seat_map['occupied'] += 1
+
+    _patch(event_id, patch)
+
+
+def seat_held(event_id, seat_id, expires_at, profile_id):
+    """ Add the hold of the user on the seat to the cached seat map, if any"""
+    def patch(seat_map):
+        seat_map['holds'] = active_holds(seat_map)  # lazily drop the expired holds
+        seat_map['holds'][str(seat_id)] = [expires_at.timestamp(), profile_id]
+
+    _patch(event_id, patch)
+
+
+def seat_released(event_id, seat_id):
+    """ Remove the hold on the seat from the cached seat map, if any"""
+    def patch(seat_map):
+        seat_map['holds'] = active_holds(seat_map)
+        seat_map['holds'].pop(str(seat_id), None)
+
+    _patch(event_id, patch)
+
+
+def active_holds(seat_map, now=None):
+    """ Holds of the seat map that did not expire yet"""
+    now = time.time() if now is None else now
+    return {seat: hold for seat, hold in seat_map['holds'].items() if hold[0] > now}
+
+
+def public_seat_map(seat_map):
+    """ Seat map without the holders of the seats: holds are reported as seat pk -> expiry timestamp"""
+    return dict(seat_map, holds={seat: hold[0] for seat, hold in active_holds(seat_map).items()})
+
+
+def invalidate(event_id):
+    """ Drop the cached seat map of the event"""
+    with _locked(event_id):
+        cache.set(_generation_key(event_id), uuid.uuid4().hex, None)
+        cache.delete(_cache_key(event_id))
+
+
+def seat_rows(seat_map, profile_id=None):
+    """ Rows of seats of the seat map as lists of dicts, for the templates.
+
+        Seats held by other users are not available, the ones held by the user are flagged as held"""
+    types = seat_map['types']
+    holds = active_holds(seat_map)
+    rows = []
+    for row in seat_map['rows']:
+        seats = []
+        for seat in row['seats']:
+            hold = holds.get(str(seat[SEAT_PK]))
+            held_by_me = bool(hold) and hold[1] == profile_id
+            seats.append({'pk': seat[SEAT_PK], 'row': row['row'], 'number': seat[SEAT_NUMBER], 'price': seat[SEAT_PRICE],
+                          'seat_type': types[str(seat[SEAT_TYPE])],
+                          'available': bool(seat[SEAT_AVAILABLE]) and (not hold or held_by_me),
+                          'held': bool(hold) and not held_by_me, 'held_by_me': held_by_me})
+        rows.append(seats)
+    return rows
+
+
+def seat_choices(seat_map, profile_id=None):
+    """ (pk, label) of the seats of the seat map that the user can book, labelled like Seat.__str__.
+        Seats held by other users are left out"""
+    types = seat_map['types']
+    holds = active_holds(seat_map)
+    choices = []
+    for row in seat_map['rows']:
+        for seat in row['seats']:
+            hold = holds.get(str(seat[SEAT_PK]))
+            if not seat[SEAT_AVAILABLE] or (hold and hold[1] != profile_id):
+                continue
+            label = f"{seat_map['name']}: {types[str(seat[SEAT_TYPE])]} #{seat[SEAT_NUMBER]} on row {row['row']}"
+            choices.append((seat[SEAT_PK], f'{label} (held by you)' if hold else label))
+    return choices
+
+
+def adjacent_seats(seat_map, quantity, row=None, seat_type=None, profile_id=None):
+    """ pks of the first quantity seats in a row with consecutive numbers that the user can book,
+        in the row and of the seat type (pk) if given. None if there are none"""
+    holds = active_holds(seat_map)
+    for seat_row in seat_map['rows']:
+        if row is not None and seat_row['row'] != row:
+            continue
+        run = []
+        for seat in seat_row['seats']:
+            hold = holds.get(str(seat[SEAT_PK]))
+            bookable = (seat[SEAT_AVAILABLE] and (not hold or hold[1] == profile_id)
+                        and (seat_type is None or seat[SEAT_TYPE] == seat_type) and isinstance(seat[SEAT_NUMBER], int))
+            if not bookable:
+                run = []
+                continue
+            if run and seat[SEAT_NUMBER] != run[-1][SEAT_NUMBER] + 1:
+                run = []
+            run.append(seat)
+            if len(run) == quantity:
+                return [seat[SEAT_PK] for seat in run]
+    return None
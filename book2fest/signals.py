@@ -0,0 +1,227 @@
+import threading
+
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, post_init, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from book2fest import allocator, caching, counters, live, profiles, recommendations, seatmap, search, sqlite
+from book2fest.models import Ticket, Seat, Review, EventProfile, Artist, Genre, Category, UserProfile, \
+    OrganizerProfile, Service
+
+_pending = threading.local()
+
+
+def _rebuild_on_commit(event):
+    """ Schedule a counters rebuild of the event when the current transaction commits.
+        Deleting an event with thousands of seats ends up in a single rebuild"""
+    events, flush = getattr(_pending, 'batch', (None, None))
+    if events is not None and caching._scheduled(flush):
+        events.add(event)
+        return
+
+    events = {event}
+
+    def flush():
+        counters.rebuild_counters(EventProfile.objects.filter(pk__in=events))
+
+    _pending.batch = (events, flush)
+    transaction.on_commit(flush)
+
+
+def tickets_created(event_id, seat_ids, user_id):
+    """ Side effects of new tickets of the user (auth user pk) for the seats of the event. Run by
+        the post_save receiver of Ticket, and by the bulk inserts of tickets, which send no signals"""
+    seat_ids = list(seat_ids)
+    counters.seats_changed(event_id, -len(seat_ids))
+    recommendations.invalidate(user_id)
+    transaction.on_commit(lambda: seatmap.seats_booked(event_id, seat_ids))
+    transaction.on_commit(lambda: allocator.seats_taken(event_id, seat_ids))
+    live.publish_on_commit(event_id, booked=seat_ids)
+    caching.bump_on_commit(event_id)
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_created(sender, instance, created, **kwargs):
+    if created:
+        tickets_created(instance.seat.event_id, [instance.seat_id], instance.user.user_id)
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_deleted(sender, instance, **kwargs):
+    # the seat of a deleted ticket can be booked again
+    Seat.objects.filter(pk=instance.seat_id, available=False).update(available=True)
+    recommendations.invalidate(instance.user.user_id)
+    event = Seat.objects.filter(pk=instance.seat_id).values_list('event', flat=True).first()
+    if event:
+        _rebuild_on_commit(event)
+        seatmap.invalidate(event)
+        allocator.invalidate(event)
+        live.publish_on_commit(event, released=[instance.seat_id])
+        caching.bump_on_commit(event)
+
+
+@receiver(post_save, sender=Seat)
+def seat_saved(sender, instance, **kwargs):
+    caching.bump_on_commit(instance.event_id)
+
+
+@receiver(post_delete, sender=Seat)
+def seat_deleted(sender, instance, **kwargs):
+    _rebuild_on_commit(instance.event_id)
+    seatmap.invalidate(instance.event_id)
+    allocator.invalidate(instance.event_id)
+    live.publish_on_commit(instance.event_id, changed=True)
+    caching.bump_on_commit(instance.event_id)
+
+
+def _bump_events(events):
+    caching.bump_on_commit(None)  # the catalogue even without events, e.g. for a new artist
+    for event in events:
+        caching.bump_on_commit(event)
+
+
+_UNKNOWN = object()
+
+
+@receiver(post_init, sender=Review)
+def review_loaded(sender, instance, **kwargs):
+    # remember the rating stored in the db, to update the counters by difference
+    if not instance.pk:
+        instance._saved_rating = None
+    else:
+        instance._saved_rating = instance.__dict__.get('rating', _UNKNOWN)  # do not load deferred ratings
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, **kwargs):
+    # the event of the ticket, for the reviews of the event page and the counters
+    if instance.event_id is None:
+        instance.event_id = Seat.objects.filter(ticket_seat=instance.ticket_id).values_list('event', flat=True).get()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    caching.bump_on_commit(instance.event_id)
+    old, new = instance._saved_rating, instance.rating
+    if old is _UNKNOWN:
+        _rebuild_on_commit(instance.event_id)
+    elif old != new:
+        counters.rating_changed(instance.event_id, (new or 0.0) - (old or 0.0), (new is not None) - (old is not None))
+    if old is not _UNKNOWN and (old, new) != (None, None):
+        counters.rating_summary_changed(instance.event_id, old, new)
+    instance._saved_rating = new
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    caching.bump_on_commit(instance.event_id)
+    if instance._saved_rating is _UNKNOWN:
+        _rebuild_on_commit(instance.event_id)
+    elif instance._saved_rating is not None:
+        counters.rating_changed(instance.event_id, -instance._saved_rating, -1)
+        counters.rating_summary_changed(instance.event_id, instance._saved_rating, None)
+
+
+@receiver(post_save, sender=EventProfile)
+def event_saved(sender, instance, **kwargs):
+    search.index_events([instance.pk])
+    caching.bump_on_commit(instance.pk)
+
+
+@receiver(m2m_changed, sender=EventProfile.artist_list.through)
+def event_artists_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        events = [instance.pk]
+    elif pk_set:
+        events = pk_set
+    else:
+        events = list(instance.eventprofile_set.values_list('pk', flat=True))
+    search.index_events(events)
+    _bump_events(events)
+
+
+@receiver(m2m_changed, sender=EventProfile.services.through)
+def event_services_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        caching.bump_on_commit(instance.pk)
+    else:
+        _bump_events(pk_set or instance.eventprofile_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Service)
+def service_saved(sender, instance, **kwargs):
+    _bump_events(instance.eventprofile_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=EventProfile)
+def event_deleted(sender, instance, **kwargs):
+    search.index_events([instance.pk])  # the event is not found anymore, so it is removed from the index
+    caching.bump_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Artist)
+def artist_saved(sender, instance, **kwargs):
+    events = list(instance.eventprofile_set.values_list('pk', flat=True))
+    search.index_artists([instance.pk])
+    search.index_events(events)
+    _bump_events(events)
+
+
+@receiver(pre_delete, sender=Artist)
+def artist_deleting(sender, instance, **kwargs):
+    # the events of the artist can't be found after the delete
+    instance._search_events = list(instance.eventprofile_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Artist)
+def artist_deleted(sender, instance, **kwargs):
+    search.index_artists([instance.pk])
+    search.index_events(instance._search_events)
+    _bump_events(instance._search_events)
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, **kwargs):
+    artists = Artist.objects.filter(genre=instance)
+    events = list(EventProfile.objects.filter(artist_list__in=artists).values_list('pk', flat=True).distinct())
+    search.index_artists(artists.values_list('pk', flat=True))
+    search.index_events(events)
+    _bump_events(events)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    artists = Artist.objects.filter(genre__category=instance)
+    events = list(EventProfile.objects.filter(artist_list__in=artists).values_list('pk', flat=True).distinct())
+    search.index_artists(artists.values_list('pk', flat=True))
+    search.index_events(events)
+    _bump_events(events)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=OrganizerProfile)
+@receiver(post_delete, sender=OrganizerProfile)
+def profile_changed(sender, instance, **kwargs):
+    profiles.invalidate(instance.user_id)
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    """ Close the persistent connections that can no longer be used before the request uses them,
+        for the databases with CONN_HEALTH_CHECKS (built in Django from 4.1 on)"""
+    for connection in connections.all():
+        if (connection.settings_dict.get('CONN_HEALTH_CHECKS') and connection.connection is not None
+                and not connection.in_atomic_block and not connection.is_usable()):
+            connection.close()
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    sqlite.configure_connection(connection)
@@ -0,0 +1,68 @@
+""" SQLite tuning for concurrent readers and writers.
+
+    configure_connection() runs the PRAGMAs of SQLITE_PRAGMAS, updated with the ones of
+    settings.SQLITE_PRAGMAS, on every new SQLite connection (see the connection_created receiver in book2fest.signals). With the default ones
+    the database runs in WAL mode: readers no longer wait for the writer, and writers wait up to
+    busy_timeout ms for the lock instead of failing. retry_on_locked retries the writes that still
+    fail with "database is locked", e.g. when a read transaction can not be upgraded to a write."""
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError
+
+_logger = logging.getLogger(__name__)
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',          # readers do not block the writer and vice versa
+    'synchronous': 'normal',        # safe with WAL, fsync only at checkpoints
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,           # negative: KiB, i.e. 32 MB of page cache per connection
+    'busy_timeout': 5000,           # ms to wait for a lock before "database is locked"
+}
+
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.02  # seconds, doubled at every retry
+
+
+def pragmas():
+    return {**SQLITE_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def configure_connection(connection):
+    """ Run the configured PRAGMAs on a new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def retry_on_locked(func=None, *, retries=LOCK_RETRIES, backoff=LOCK_BACKOFF, using=None):
+    """ Retry the decorated function with exponential backoff when the database is locked.
+
+        Only an outermost transaction can be retried: inside an atomic block the error is raised
+        to the caller, which owns the transaction"""
+    if func is None:
+        return functools.partial(retry_on_locked, retries=retries, backoff=backoff, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        connection = connections[using or DEFAULT_DB_ALIAS]
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_locked_error(e) or connection.in_atomic_block or attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt * (0.5 + random.random())
+                _logger.info(f'{func.__name__}: database is locked, retry {attempt + 1} in {delay:.3f}s')
+                time.sleep(delay)
+
+    return wrapper
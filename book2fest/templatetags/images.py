@@ -0,0 +1,25 @@
+from django import template
+from django.utils.html import format_html
+
+from book2fest.images import image_url as derivative_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(field_file, size, fmt='jpeg'):
+    """ {% image_url artist.image 'thumb' %} -> url of the thumb sized derivative of the image"""
+    return derivative_url(field_file, size, fmt)
+
+
+@register.simple_tag
+def picture(field_file, size, alt='', css_class='', style=''):
+    """ {% picture img.img 'hero' alt=img.name %} -> <picture> element serving the WebP derivative
+        of the given size, with the JPEG one as fallback"""
+    webp, jpeg = derivative_url(field_file, size, 'webp'), derivative_url(field_file, size, 'jpeg')
+    if webp == jpeg:
+        # no derivatives, the original upload is served
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">', jpeg, alt, css_class, style)
+    return format_html('<picture><source srcset="{}" type="image/webp">'
+                       '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy"></picture>',
+                       webp, jpeg, alt, css_class, style)
@@ -1,9 +1,60 @@
-from django.test import TestCase
-from book2fest.models import EventProfile, OrganizerProfile, UserProfile, Ticket, Seat, SeatType, Delivery
+import asyncio
+import csv
+import importlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command, CommandError
+from django.db import connection, connections, transaction, router, OperationalError
+from django.db.models import Max, IntegerField, Value
+from django.db.models.functions import Cast, NullIf
+from django.http import HttpResponse
+from django.template import Template, Context
+from django.test import TestCase, TransactionTestCase, SimpleTestCase, AsyncClient, RequestFactory, override_settings
+from django.urls import reverse, clear_url_caches, resolve
 from django.utils import timezone
-from datetime import timedelta
-from django.urls import reverse
+from notifications.models import Notification
+from PIL import Image
+
+from book2fest import allocator, live, aio, seatmap, sqlite
+from book2fest.api import keyset_page, EVENT_FIELDS, EVENT_LIST_FIELDS, EVENT_ORDERING
+from book2fest.booking import book_seat, book_seats, book_adjacent_seats, book_best_available, SEATS_TAKEN, GROUP_SIZE, \
+    GROUP_BOOKING_SIZE, NO_SEATS_AVAILABLE
+from book2fest.counters import rebuild_counters, rating_summary_changed
+from book2fest.exports import EXPORT_COLUMNS
+from book2fest.holds import place_hold, release_hold, sweep_holds, SEAT_HELD, SEAT_HOLDS_PER_USER
+from book2fest.images import IMAGE_SIZES, IMAGE_FORMATS, derivative_name
+from book2fest.importer import import_events
+from book2fest.middleware import QueryRecorder, PrimaryPinningMiddleware
+from book2fest.models import EventProfile, OrganizerProfile, UserProfile, Ticket, Seat, SeatType, Delivery, Review, \
+    Artist, Genre, Category, Service, ServiceImage, Picture, SeatHold, RatingSummary
+from book2fest.pagination import encode_cursor, decode_cursor, keyset_filter
+from book2fest.profiles import ROLE_USER, ROLE_ORGANIZER
+from book2fest.recommendations import recommended_events
+from book2fest.routers import use_primary, pinned_to_primary as use_primary_pinned
+from book2fest.search import search_events, search_artists
+from book2fest.seating import generate_seats, SeatBlock
+from book2fest.seatmap import get_seat_map, seat_choices
+from book2fest.sqlite import retry_on_locked
 from book2fest.views import add_seats
 
 def create_user(username, password):
@@ -191,4 +242,1856 @@ class AddSeatsTests(TestCase):
         total_seat_after = Seat.objects.all().filter(event=test_event).count()
 
         self.assertEqual(val,True) # checks return value
-        self.assertEqual(total_seat_before+total_new, total_seat_after) # checks that the correct amount of seats have been added
\ No newline at end of file
+        self.assertEqual(total_seat_before+total_new, total_seat_after) # checks that the correct amount of seats have been added
+
+
+    def test_add_seats_continues_row_numbering(self):
+        """ If add seats twice on the same row
+         -> Numbers continue from the last seat of the row"""
+
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=0, cancelled=False)
+        test_seat_type = SeatType.objects.create(name="test-seat-type")
+
+        add_seats(total_new=3, price=30.0, row="A", seat_type=test_seat_type, event=test_event)
+        add_seats(total_new=2, price=30.0, row="A", seat_type=test_seat_type, event=test_event)
+
+        numbers = sorted(int(number) for number in Seat.objects.filter(event=test_event, row="A").values_list('number', flat=True))
+        self.assertEqual(numbers, [0, 1, 2, 3, 4])
+
+
+class GenerateSeatsTests(TestCase):
+
+    def test_generate_seats_layout(self):
+        """ If generate a layout with several blocks
+         -> every row gets its seats with type and price of its block"""
+
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        test_event = create_event(user=test_organizer, max_capacity=100, seats_available=0, days=10, cancelled=False)
+        vip, standard = SeatType.objects.create(name="vip"), SeatType.objects.create(name="standard")
+
+        val, __ = generate_seats(test_event, [SeatBlock("AB", 5, vip, 80.0), SeatBlock("CDE", 10, standard, 30.0)], chunk_size=7)
+
+        self.assertEqual(val, True)
+        self.assertEqual(Seat.objects.filter(event=test_event, seat_type=vip, price=80.0).count(), 10)
+        self.assertEqual(Seat.objects.filter(event=test_event, seat_type=standard, row="E").count(), 10)
+        test_event.refresh_from_db()
+        self.assertEqual(test_event.seats_available, 40)
+
+    def test_generate_seats_max_cap_exceed(self):
+        """ If the layout exceeds the event max capacity
+         -> Return False and do not add any seat"""
+
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        test_event = create_event(user=test_organizer, max_capacity=20, seats_available=0, days=10, cancelled=False)
+        test_seat_type = SeatType.objects.create(name="test-seat-type")
+
+        val, __ = generate_seats(test_event, [SeatBlock("AB", 5, test_seat_type, 80.0), SeatBlock("C", 11, test_seat_type, 30.0)])
+
+        self.assertEqual(val, False)
+        self.assertEqual(Seat.objects.filter(event=test_event).count(), 0)
+
+class BookSeatTests(TestCase):
+
+    def setUp(self):
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=1, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+
+    def test_book_seat_twice(self):
+        """ If two users try to book the same seat
+        -> Only the first one gets a ticket and the seat is no more available"""
+
+        test_seat = create_seat(self.test_event, True)
+        first = create_user_profile(create_user("test-first", "test-pw"))
+        second = create_user_profile(create_user("test-second", "test-pw"))
+
+        ticket, __ = book_seat(first, self.test_event, test_seat, self.test_delivery)
+        other, __ = book_seat(second, self.test_event, test_seat, self.test_delivery)
+
+        self.assertEqual(ticket.user, first)  # first user got the ticket
+        self.assertEqual(other, None)  # second user got a "seat taken" result
+        self.assertEqual(Ticket.objects.filter(seat=test_seat).count(), 1)
+        self.assertEqual(Seat.objects.get(pk=test_seat.pk).available, False)
+
+    def test_book_seat_of_another_event(self):
+        """ If user tries to book a seat that belongs to another event
+        -> Ticket not created and seat still available"""
+
+        other_event = create_event(user=self.test_event.user, max_capacity=10, seats_available=1, days=10, cancelled=False)
+        test_seat = create_seat(other_event, True)
+        test_user = create_user_profile(create_user("test-user", "test-pw"))
+
+        ticket, __ = book_seat(test_user, self.test_event, test_seat, self.test_delivery)
+
+        self.assertEqual(ticket, None)
+        self.assertEqual(Seat.objects.get(pk=test_seat.pk).available, True)
+
+
+class CountersTests(TestCase):
+
+    def setUp(self):
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=4, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+
+    def book(self, username):
+        profile = create_user_profile(create_user(username, "test-pw"))
+        seat = Seat.objects.filter(event=self.test_event, available=True).first()
+        ticket, __ = book_seat(profile, self.test_event, seat, self.test_delivery)
+        return ticket
+
+    def test_counters_follow_bookings_and_reviews(self):
+        """ Booking seats and reviewing tickets
+        -> seats_available and avg_rating are updated without recalculation"""
+
+        first, second = self.book("test-first"), self.book("test-second")
+        Review.objects.create(ticket=first, rating=4.0)
+        review = Review.objects.create(ticket=second, rating=2.0)
+        review.rating = 5.0
+        review.save()
+
+        self.test_event.refresh_from_db()
+        self.assertEqual(self.test_event.seats_available, 2)
+        self.assertEqual(self.test_event.avg_rating, 4.5)
+
+    def test_rebuild_counters(self):
+        """ Rebuilding the counters from scratch
+        -> same values as the incremental updates"""
+
+        Review.objects.create(ticket=self.book("test-first"), rating=3.0)
+        EventProfile.objects.filter(pk=self.test_event.pk).update(seats_available=0, avg_rating=0.0, rating_sum=0.0, rating_count=0)
+
+        rebuild_counters()
+
+        self.test_event.refresh_from_db()
+        self.assertEqual(self.test_event.seats_available, 3)
+        self.assertEqual(self.test_event.avg_rating, 3.0)
+
+    def test_delete_ticket(self):
+        """ Deleting a ticket
+        -> its seat is available again"""
+
+        ticket = self.book("test-first")
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.delete()
+
+        self.test_event.refresh_from_db()
+        self.assertEqual(Seat.objects.get(pk=ticket.seat_id).available, True)
+        self.assertEqual(self.test_event.seats_available, 4)
+
+    def test_event_list_does_not_write(self):
+        """ Listing events
+        -> no UPDATE is run"""
+
+        with self.assertNumQueries(1):
+            self.client.get(reverse('book2fest:event-list'))
+
+
+class RecommendationsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        self.test_seat_type = SeatType.objects.create(name="test-seat-type")
+
+    def new_event(self):
+        event = create_event(user=self.test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        add_seats(total_new=5, price=30.0, row="A", seat_type=self.test_seat_type, event=event)
+        return event
+
+    def book(self, profile, event):
+        seat = Seat.objects.filter(event=event, available=True).first()
+        return book_seat(profile, event, seat, self.test_delivery)[0]
+
+    def test_recommended_events(self):
+        """ Co-attendees of the user events hold tickets for other events
+        -> those events are recommended ranked by co-attendees, without the user events"""
+
+        me, friend, other = [create_user_profile(create_user(name, "test-pw")) for name in ("test-me", "test-friend", "test-other")]
+        mine, popular, niche = self.new_event(), self.new_event(), self.new_event()
+        for profile, event in ((me, mine), (friend, mine), (other, mine), (friend, popular), (other, popular), (other, niche)):
+            self.book(profile, event)
+
+        self.assertEqual(recommended_events(me.user), [popular, niche])
+
+    def test_recommendations_invalidated_on_new_ticket(self):
+        """ The user books a recommended event
+        -> the event is not recommended anymore"""
+
+        me, friend = create_user_profile(create_user("test-me", "test-pw")), create_user_profile(create_user("test-friend", "test-pw"))
+        mine, other = self.new_event(), self.new_event()
+        self.book(me, mine)
+        self.book(friend, mine)
+        self.book(friend, other)
+        self.assertEqual(recommended_events(me.user), [other])  # cached
+
+        self.book(me, other)
+
+        self.assertEqual(recommended_events(me.user), [])
+
+    def test_cancelled_and_finished_not_recommended(self):
+        """ Recommended events are cancelled or finish after the ranking has been cached
+        -> they are not recommended anymore, the next ones in the ranking are"""
+
+        me, friend = create_user_profile(create_user("test-me", "test-pw")), create_user_profile(create_user("test-friend", "test-pw"))
+        mine, cancelled, finished, other = self.new_event(), self.new_event(), self.new_event(), self.new_event()
+        for profile, event in ((me, mine), (friend, mine), (friend, cancelled), (friend, finished), (friend, other)):
+            self.book(profile, event)
+        self.assertEqual(recommended_events(me.user, limit=2), [cancelled, finished])  # cached
+
+        EventProfile.objects.filter(pk=cancelled.pk).update(cancelled=True)
+        EventProfile.objects.filter(pk=finished.pk).update(event_end=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(recommended_events(me.user, limit=2), [other])
+
+
+class SeatMapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=3, price=30.0, row="B", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+
+    def test_seat_map_patched_on_booking(self):
+        """ Booking a seat after the seat map has been cached
+        -> the cached seat map shows the seat as booked without being rebuilt"""
+
+        get_seat_map(self.test_event.pk)
+        seat = Seat.objects.filter(event=self.test_event).first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_seat(create_user_profile(create_user("test-user", "test-pw")), self.test_event, seat, self.test_delivery)
+
+        with self.assertNumQueries(0):
+            seat_map = get_seat_map(self.test_event.pk)
+        self.assertEqual(seat_map['available'], 2)
+        self.assertEqual([s[0] for s in seat_map['rows'][0]['seats'] if not s[4]], [seat.pk])
+
+    def test_seat_map_endpoint(self):
+        """ GET the seat map of an event
+        -> JSON with its rows of seats, 404 if the event does not exist"""
+
+        response = self.client.get(reverse('book2fest:event-seat-map', kwargs={'pk': self.test_event.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rows'][0]['row'], "B")
+        self.assertEqual([s[1] for s in response.json()['rows'][0]['seats']], [0, 1, 2])
+        self.assertEqual(self.client.get(reverse('book2fest:event-seat-map', kwargs={'pk': 0})).status_code, 404)
+
+    def test_event_page_uses_seat_map(self):
+        """ GET the event page
+        -> the ticket form offers the available seats of the seat map"""
+
+        response = self.client.get(reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "#2 on row B")
+
+
+class SeatMapConcurrencyTests(TransactionTestCase):
+    """ The seat map is patched from several threads"""
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=160, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=160, price=30.0, row="B", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+
+    def test_concurrent_bookings(self):
+        """ 160 seats booked, the seat map patched by 16 threads at once as their bookings commit
+        -> the cached seat map is the one of the db, no patch is lost"""
+
+        get_seat_map(self.test_event.pk)
+        seats = list(Seat.objects.filter(event=self.test_event).order_by('pk').values_list('pk', flat=True))
+        Seat.objects.filter(event=self.test_event).update(available=False)
+
+        def patch(i):
+            for seat in seats[i::16]:
+                seatmap.seats_booked(self.test_event.pk, [seat])
+
+        backend = type(caches['default'])
+        get = backend.get
+
+        def slow_get(self, *args, **kwargs):
+            value = get(self, *args, **kwargs)
+            time.sleep(0.001)  # like a cache over the network
+            return value
+
+        threads = [threading.Thread(target=patch, args=(i,)) for i in range(16)]
+        with mock.patch.object(backend, 'get', slow_get):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        cached = cache.get(seatmap._cache_key(self.test_event.pk))
+        self.assertEqual(cached, seatmap.build_seat_map(self.test_event.pk))
+        self.assertEqual(cached['available'], 0)
+
+    def test_stale_build_not_cached(self):
+        """ Seat map built from the db, then a booking commits and patches the seat map before the build is stored
+        -> the build is not cached, the next read builds the seat map again"""
+
+        seat = Seat.objects.filter(event=self.test_event).first()
+        build = seatmap.build_seat_map
+
+        def build_then_book(event_id):
+            seat_map = build(event_id)
+            Seat.objects.filter(pk=seat.pk).update(available=False)
+            seatmap.seats_booked(event_id, [seat.pk])
+            return seat_map
+
+        with mock.patch('book2fest.seatmap.build_seat_map', side_effect=build_then_book):
+            self.assertEqual(get_seat_map(self.test_event.pk)['available'], 160)
+        self.assertIsNone(cache.get(seatmap._cache_key(self.test_event.pk)))
+        self.assertEqual(get_seat_map(self.test_event.pk)['available'], 159)
+
+
+class QueryBudgetTests(TestCase):
+    """ Every view runs at most settings.QUERY_BUDGETS queries, regardless of the number of rows"""
+
+    sizes = (2, 6)
+
+    def setUp(self):
+        cache.clear()
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        self.test_seat_type = SeatType.objects.create(name="test-seat-type")
+        self.test_genre = Genre.objects.create(name="test-genre", category=Category.objects.create(name="test-category"))
+
+    def seed(self, size):
+        """ Create size events, each one with size artists, services, pictures and reviewed tickets"""
+        for __ in range(size):
+            event = create_event(user=self.test_organizer, max_capacity=size, seats_available=0, days=10, cancelled=False)
+            for i in range(size):
+                event.artist_list.add(Artist.objects.create(full_name=f"test-artist-{i}", genre=self.test_genre, image="images/red.jpg"))
+                event.services.add(Service.objects.create(name=f"test-service-{i}", description="test", icon=ServiceImage.objects.create(path="services/wc.svg")))
+                Picture.objects.create(name=f"test-picture-{i}", description="test", img="pictures/red.jpg", event=event)
+            add_seats(total_new=size, price=30.0, row="A", seat_type=self.test_seat_type, event=event)
+            for seat in Seat.objects.filter(event=event):
+                ticket, __ = book_seat(self.test_user, event, seat, self.test_delivery)
+                Review.objects.create(ticket=ticket, rating=3.0, content="test")
+        return event
+
+    def assertQueryBudget(self, view_name, user=None, **kwargs):
+        """ GET the view on datasets of increasing size, the number of queries must not grow"""
+        if user:
+            self.client.force_login(user)
+            self.client.get(reverse('book2fest:profile'))  # the profile is resolved once per session
+        counts = []
+        for size in self.sizes:
+            event = self.seed(size)
+            url = reverse(view_name, kwargs={'pk': event.pk} if kwargs.get('event') else None)
+            recorder = QueryRecorder()
+            with recorder.record():
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append(recorder.count)
+
+        self.assertLessEqual(max(counts), settings.QUERY_BUDGETS[view_name], f"queries: {counts}")
+        self.assertEqual(counts[0], counts[-1], f"the number of queries grows with rows: {counts}")
+
+    def test_home(self):
+        self.assertQueryBudget('homepage', user=self.test_user.user)
+
+    def test_event_list(self):
+        self.assertQueryBudget('book2fest:event-list', user=self.test_user.user)
+
+    def test_event_detail(self):
+        self.assertQueryBudget('book2fest:event-detail', user=self.test_user.user, event=True)
+
+    def test_ticket_list(self):
+        self.assertQueryBudget('book2fest:ticket-list', user=self.test_user.user)
+
+    def test_manage_seat(self):
+        self.assertQueryBudget('book2fest:manage-seat', user=self.test_organizer.user, event=True)
+
+    def test_artist_list(self):
+        self.assertQueryBudget('book2fest:artist-list', user=self.test_user.user)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        for i in range(45):
+            event = create_event(user=test_organizer, max_capacity=10, seats_available=i % 4, days=10, cancelled=False)
+            event.event_name, event.avg_rating = f"test-event-{i % 3}", i % 5
+            event.save()
+
+    def walk(self, params):
+        """ Follow the next links from the first page, return the pk of the events of every page"""
+        pages = []
+        url = reverse('book2fest:event-list')
+        response = self.client.get(url, params)
+        while True:
+            pages.append([event.pk for event in response.context['object_list']])
+            if not response.context['page_obj'].has_next:
+                return pages
+            response = self.client.get(url + response.context['page_obj'].next_url)
+
+    def test_pages_cover_all_events_once(self):
+        """ Walking the pages of the events ordered by rating, with ties
+        -> every event is listed exactly once, in order"""
+
+        pages = self.walk({'order-filter': 'avg_rating'})
+
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        ordered = list(EventProfile.objects.order_by('-avg_rating', 'pk').values_list('pk', flat=True))
+        self.assertEqual(sum(pages, []), ordered)
+
+    def test_pages_of_ranked_search(self):
+        """ Walking the pages of a search without ordering, with ties of the rank
+        -> every matching event is listed exactly once, best match first"""
+
+        best = EventProfile.objects.order_by('pk').last()
+        best.event_name = "test-event test-event"
+        best.save()
+        pages = self.walk({'search': 'test-event'})
+
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(pages[0][0], best.pk)
+        self.assertEqual(sorted(sum(pages, [])), list(EventProfile.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_pages_with_null_values(self):
+        """ Walking pages of 7 events ordered by a value that is NULL for the events without rating, both ways
+        -> every event is listed exactly once, in the order of the database"""
+
+        queryset = EventProfile.objects.annotate(rating=NullIf('avg_rating', Value(0.0)))
+        for ordering in (['rating', 'pk'], ['-rating', 'pk']):
+            listed, cursor = [], None
+            while True:
+                page = queryset.order_by(*ordering)
+                if cursor:
+                    page = page.filter(keyset_filter(ordering, decode_cursor(cursor, ordering, queryset), queryset))
+                rows = list(page.values_list('pk', 'rating')[:7])
+                listed += [pk for pk, __ in rows]
+                if len(rows) < 7:
+                    break
+                cursor = encode_cursor(ordering, [rows[-1][1], rows[-1][0]])
+            self.assertEqual(listed, list(queryset.order_by(*ordering).values_list('pk', flat=True)))
+
+    def test_forged_cursors(self):
+        """ GET the event list with cursors whose values do not fit the fields of the ordering
+        -> the first page"""
+
+        url = reverse('book2fest:event-list')
+        first = self.client.get(url, {'order-filter': 'event_start'})
+        for values in (["garbage", 1], [None, 1], ["2020-01-01T00:00:00+00:00", [1]], [{}, 1]):
+            response = self.client.get(url, {'order-filter': 'event_start', 'cursor': encode_cursor(['event_start', 'pk'], values)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['object_list']), list(first.context['object_list']))
+
+    def test_pages_keep_search(self):
+        """ Walking the pages of a search
+        -> the next pages keep the search and the ordering"""
+
+        pages = self.walk({'search': 'test-event-1', 'search-filter': 'event_name', 'order-filter': 'seats_available'})
+
+        self.assertEqual(sum(pages, []), list(EventProfile.objects.filter(event_name="test-event-1")
+                                              .order_by('-seats_available', 'pk').values_list('pk', flat=True)))
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.rock = Genre.objects.create(name="Rock", category=Category.objects.create(name="Music"))
+        self.artist = Artist.objects.create(full_name="Freddie Mercury", genre=self.rock, image="images/red.jpg")
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.test_event.event_name = "Summer Festival"
+        self.test_event.save()
+        self.test_event.artist_list.add(self.artist)
+        self.other_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+
+    def events(self, query, field=None):
+        return list(EventProfile.objects.filter(pk__in=search_events(query, field)))
+
+    def test_prefix_search(self):
+        """ Searching the prefix of words of event name, artist, genre and category
+        -> the event is found, only in the searched field"""
+
+        self.assertEqual(self.events("summ fest", "event_name"), [self.test_event])
+        self.assertEqual(self.events("merc", "artist"), [self.test_event])
+        self.assertEqual(self.events("roc", "genre"), [self.test_event])
+        self.assertEqual(self.events("mus", "category"), [self.test_event])
+        self.assertEqual(self.events("merc", "event_name"), [])
+
+    def test_ranked_search(self):
+        """ GET the event list, the artist list and the ticket list with a search and no ordering
+        -> best matches first, by bm25 rank; the ordering of the user comes first when given"""
+
+        test_user = create_user_profile(create_user("test-user", "test-pw"))
+        test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        seat_type = SeatType.objects.create(name="test-seat-type")
+        for event in (self.other_event, self.test_event):
+            add_seats(total_new=1, price=30.0, row="A", seat_type=seat_type, event=event)
+            book_seat(test_user, event, Seat.objects.filter(event=event).first(), test_delivery)
+        self.other_event.event_name = "Summer summer"  # best match, created after the other one
+        self.other_event.save()
+        self.test_event.avg_rating = 5
+        self.test_event.save()
+        queen = Artist.objects.create(full_name="Queen Summer Tribute Band", genre=self.rock, image="images/red.jpg")
+        summer = Artist.objects.create(full_name="Summer", genre=self.rock, image="images/red.jpg")
+
+        response = self.client.get(reverse('book2fest:event-list'), {'search': 'summer'})
+        self.assertEqual(list(response.context['object_list']), [self.other_event, self.test_event])
+        response = self.client.get(reverse('book2fest:event-list'), {'search': 'summer', 'order-filter': 'avg_rating'})
+        self.assertEqual(list(response.context['object_list']), [self.test_event, self.other_event])
+
+        response = self.client.get(reverse('book2fest:artist-list'), {'search': 'summer'})
+        self.assertEqual(list(response.context['object_list']), [summer, queen])
+
+        self.client.force_login(test_user.user)
+        response = self.client.get(reverse('book2fest:ticket-list'), {'search': 'summer'})
+        self.assertEqual([ticket.seat.event for ticket in response.context['object_list']], [self.other_event, self.test_event])
+
+    def test_index_follows_changes(self):
+        """ Renaming a genre and removing an artist from the event
+        -> the index is updated"""
+
+        self.rock.name = "Metal"
+        self.rock.save()
+        self.assertEqual(self.events("metal", "genre"), [self.test_event])
+        self.assertEqual(list(Artist.objects.filter(pk__in=search_artists("metal", "genre"))), [self.artist])
+
+        self.test_event.artist_list.remove(self.artist)
+        self.assertEqual(self.events("metal", "genre"), [])
+
+    def test_event_list_search(self):
+        """ GET the event list with a search
+        -> only the matching events are listed"""
+
+        response = self.client.get(reverse('book2fest:event-list'), {'search': 'fest', 'search-filter': 'event_name'})
+
+        self.assertEqual(list(response.context['object_list']), [self.test_event])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class QueryPlanTests(TestCase):
+    """ The hot queries are answered with an index, without full table scans or sorts"""
+
+    def assertUsesIndex(self, queryset, sorted=True, scan=False):
+        """ Every table is searched with an index; with scan, the index may be read in order from the start
+            instead (first page of a listing, the LIMIT stops the scan)"""
+        plan = queryset.explain()
+        self.assertIn("USING", plan)  # USING INDEX, USING COVERING INDEX or USING INTEGER PRIMARY KEY
+        for line in plan.splitlines():
+            if scan:
+                self.assertIsNone(re.search(r"\bSCAN \w+$", line), f"full table scan: {plan}")
+            else:
+                self.assertNotIn("SCAN ", line, f"scan: {plan}")
+        if sorted:
+            self.assertNotIn("TEMP B-TREE", plan, f"sort without index: {plan}")
+
+    def test_available_seats(self):
+        self.assertUsesIndex(Seat.objects.filter(event=1, available=True))
+
+    def test_seat_map(self):
+        self.assertUsesIndex(Seat.objects.filter(event=1).order_by('row', 'number'))
+
+    def test_seat_numbering(self):
+        self.assertUsesIndex(Seat.objects.filter(event=1, row__in=["A"]).order_by().values('row')
+                             .annotate(last=Max(Cast('number', IntegerField()))))
+
+    def test_home_available_events(self):
+        # the index of the ordering is read up to the first 5 upcoming events
+        self.assertUsesIndex(EventProfile.objects.filter(cancelled=False, event_end__gt=timezone.now()).order_by('avg_rating')[:5], scan=True)
+
+    def test_event_list_orderings(self):
+        cursors = {'event_name': "test", 'event_start': timezone.now(), '-avg_rating': 2.5, '-seats_available': 10}
+        for ordering, value in cursors.items():
+            self.assertUsesIndex(EventProfile.objects.order_by(ordering, 'pk')[:21], scan=True)
+            # next page of the keyset pagination
+            queryset = EventProfile.objects.order_by(ordering, 'pk')
+            self.assertUsesIndex(queryset.filter(keyset_filter([ordering, 'pk'], [value, 1], queryset))[:21])
+
+    def test_event_reviews(self):
+        self.assertUsesIndex(Review.objects.filter(ticket__seat__event=1))
+        # newest reviews of the event page, and next page of the review list
+        self.assertUsesIndex(Review.objects.filter(event=1).published().order_by('-date', 'pk')[:10])
+        self.assertUsesIndex(Review.objects.filter(event=1, date__lt=timezone.now()).published().order_by('-date', 'pk')[:21])
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False)
+class EventCancelTests(TestCase):
+
+    def test_cancel_notifies_every_holder_once(self):
+        """ Cancelling an event where a user holds two tickets
+        -> every ticket holder gets exactly one notification and the job progress is complete"""
+
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=3, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=test_event)
+        first, second = create_user_profile(create_user("test-first", "test-pw")), create_user_profile(create_user("test-second", "test-pw"))
+        for profile, seat in zip((first, first, second), Seat.objects.filter(event=test_event)):
+            book_seat(profile, test_event, seat, test_delivery)
+
+        self.client.force_login(test_organizer.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('book2fest:event-cancel', kwargs={'pk': test_event.pk}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(EventProfile.objects.get(pk=test_event.pk).cancelled, True)
+        self.assertEqual(sorted(Notification.objects.values_list('recipient__username', flat=True)), ["test-first", "test-second"])
+        self.assertEqual(Notification.objects.filter(target_object_id=test_event.pk, verb='Event CANCELLED!').count(), 2)
+
+
+class ProfileResolutionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+
+    def profile_queries(self, url):
+        """ GET the url and return the queries run on the profile tables"""
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.client.get(url)
+        return response, [sql for sql, __ in recorder.queries if 'profile"' in sql and 'eventprofile' not in sql]
+
+    def test_profile_resolved_once_per_session(self):
+        """ Two requests of the same session
+        -> the profile is resolved by the first one only and exposed on the request"""
+
+        self.client.force_login(self.test_user.user)
+        response, queries = self.profile_queries(reverse('book2fest:ticket-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.wsgi_request.role, ROLE_USER)
+        self.assertEqual(response.wsgi_request.profile, self.test_user)
+
+        response, queries = self.profile_queries(reverse('book2fest:ticket-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_profile_saved_invalidates_cache(self):
+        """ A user that completes the registration as organizer after a request
+        -> the next request sees the organizer profile"""
+
+        test_user = create_user("test-new", "test-pw")
+        self.client.force_login(test_user)
+        response, __ = self.profile_queries(reverse('book2fest:event-list'))
+        self.assertEqual(response.wsgi_request.role, None)
+
+        new_organizer = create_organizer(test_user)
+        response, queries = self.profile_queries(reverse('book2fest:event-list'))
+        self.assertEqual(response.wsgi_request.role, ROLE_ORGANIZER)
+        self.assertEqual(response.context['organizer'], new_organizer)
+
+    def test_role_required(self):
+        """ Organizer opening a user page and user opening an organizer page
+        -> both get redirected"""
+
+        self.client.force_login(self.test_organizer.user)
+        response = self.client.get(reverse('book2fest:ticket-list'))
+        self.assertRedirects(response, reverse('book2fest:organizer-profile'))
+
+        self.client.force_login(self.test_user.user)
+        response = self.client.get(reverse('book2fest:event-create'))
+        self.assertRedirects(response, reverse('book2fest:user-profile'))
+
+
+def create_image(name, color, size=(2000, 1200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageDerivativesTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        cache.clear()
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=self.test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.client.force_login(self.test_organizer.user)
+
+    def upload(self, *images):
+        return self.client.post(reverse('book2fest:event-images-upload', kwargs={'pk': self.test_event.pk}),
+                                {'name': "test-picture", 'description': "test", 'img': list(images)})
+
+    def test_upload_generates_derivatives(self):
+        """ Organizer uploading two pictures
+        -> every size and format of both pictures is generated and fits its box"""
+
+        response = self.upload(create_image("red.jpg", "red"), create_image("blue.jpg", "blue"))
+        self.assertRedirects(response, reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk}))
+
+        pictures = Picture.objects.filter(event=self.test_event)
+        self.assertEqual(len(pictures), 2)
+        self.assertNotEqual(pictures[0].img_hash, pictures[1].img_hash)
+        for picture in pictures:
+            for size, box in IMAGE_SIZES.items():
+                for fmt in IMAGE_FORMATS:
+                    with default_storage.open(derivative_name(picture.img_hash, size, fmt)) as derivative:
+                        image = Image.open(derivative)
+                        self.assertEqual(image.format, fmt.upper())
+                        self.assertLessEqual(image.width, box[0])
+                        self.assertLessEqual(image.height, box[1])
+
+    def test_identical_content_shares_derivatives(self):
+        """ Same image uploaded twice
+        -> both pictures point to the same derivatives, generated once"""
+
+        self.upload(create_image("red.jpg", "red"))
+        self.upload(create_image("red-copy.jpg", "red"))
+
+        first, second = Picture.objects.filter(event=self.test_event).order_by('pk')
+        self.assertEqual(first.img_hash, second.img_hash)
+        __, files = default_storage.listdir(f'derivatives/{first.img_hash[:2]}')
+        self.assertEqual(len(files), len(IMAGE_SIZES) * len(IMAGE_FORMATS))
+
+    def test_picture_tag(self):
+        """ Rendering the picture tag of a processed and of a legacy picture
+        -> WebP source with JPEG fallback of the given size, original upload for the legacy one"""
+
+        self.upload(create_image("red.jpg", "red"))
+        processed = Picture.objects.get(event=self.test_event)
+        legacy = Picture.objects.create(name="legacy", description="test", img="pictures/legacy.jpg", event=self.test_event)
+
+        template = Template("{% load images %}{% picture picture.img 'card' alt=picture.name %}")
+        html = template.render(Context({'picture': processed}))
+        self.assertIn(f'srcset="{default_storage.url(derivative_name(processed.img_hash, "card", "webp"))}"', html)
+        self.assertIn(f'src="{default_storage.url(derivative_name(processed.img_hash, "card", "jpeg"))}"', html)
+
+        html = template.render(Context({'picture': legacy}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn(f'src="{legacy.img.url}"', html)
+
+
+class SeatHoldTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=6, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+        self.seats = list(Seat.objects.filter(event=self.test_event).order_by('pk'))
+        self.holder = create_user_profile(create_user("test-holder", "test-pw"))
+        self.other = create_user_profile(create_user("test-other", "test-pw"))
+
+    def test_held_seat_booked_by_holder_only(self):
+        """ Seat held by a user
+        -> another user can neither hold nor book it, the holder books it and the hold ends"""
+
+        expires, __ = place_hold(self.holder, self.test_event, self.seats[0].pk)
+        self.assertIsNotNone(expires)
+
+        self.assertEqual(place_hold(self.other, self.test_event, self.seats[0].pk), (None, SEAT_HELD))
+        ticket, __ = book_seat(self.other, self.test_event, self.seats[0], self.test_delivery)
+        self.assertIsNone(ticket)
+
+        ticket, __ = book_seat(self.holder, self.test_event, self.seats[0], self.test_delivery)
+        self.assertEqual(ticket.user, self.holder)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_expired_hold_taken_over(self):
+        """ Hold that expired
+        -> another user can hold the seat, the sweep deletes only the expired holds"""
+
+        place_hold(self.holder, self.test_event, self.seats[0].pk, ttl=-1)
+        place_hold(self.holder, self.test_event, self.seats[1].pk, ttl=-1)
+
+        expires, __ = place_hold(self.other, self.test_event, self.seats[0].pk)
+        self.assertIsNotNone(expires)
+        self.assertEqual(SeatHold.objects.get(seat=self.seats[0]).user, self.other)
+
+        self.assertEqual(sweep_holds(), 1)
+        self.assertEqual(list(SeatHold.objects.values_list('seat', flat=True)), [self.seats[0].pk])
+
+    def test_hold_limit(self):
+        """ User holding the maximum number of seats
+        -> can renew the holds but not hold another seat, until one is released"""
+
+        for seat in self.seats[:SEAT_HOLDS_PER_USER]:
+            self.assertIsNotNone(place_hold(self.holder, self.test_event, seat.pk)[0])
+
+        self.assertIsNotNone(place_hold(self.holder, self.test_event, self.seats[0].pk)[0])
+        self.assertIsNone(place_hold(self.holder, self.test_event, self.seats[SEAT_HOLDS_PER_USER].pk)[0])
+
+        self.assertEqual(release_hold(self.holder, self.test_event, self.seats[0].pk)[0], True)
+        self.assertIsNotNone(place_hold(self.holder, self.test_event, self.seats[SEAT_HOLDS_PER_USER].pk)[0])
+
+    def test_seat_map_respects_holds(self):
+        """ Hold placed after the seat map has been cached
+        -> the seat is offered to the holder only and the public seat map hides the holder"""
+
+        get_seat_map(self.test_event.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            expires, __ = place_hold(self.holder, self.test_event, self.seats[0].pk)
+
+        with self.assertNumQueries(0):
+            seat_map = get_seat_map(self.test_event.pk)
+        self.assertNotIn(self.seats[0].pk, [pk for pk, __ in seat_choices(seat_map, self.other.pk)])
+        self.assertIn(self.seats[0].pk, [pk for pk, __ in seat_choices(seat_map, self.holder.pk)])
+
+        response = self.client.get(reverse('book2fest:event-seat-map', kwargs={'pk': self.test_event.pk}))
+        self.assertEqual(response.json()['holds'], {str(self.seats[0].pk): expires.timestamp()})
+
+        cache.clear()  # the rebuilt seat map has the hold too
+        self.assertEqual(get_seat_map(self.test_event.pk)['holds'], seat_map['holds'])
+
+    def test_hold_endpoint(self):
+        """ User holding a seat through the endpoint, then another user trying the same seat
+        -> the first gets the hold, the second is told the seat is held"""
+
+        url = reverse('book2fest:event-seat-hold', kwargs={'pk': self.test_event.pk})
+        self.client.force_login(self.holder.user)
+        response = self.client.post(url, {'seat': self.seats[0].pk}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['held'], True)
+
+        self.client.force_login(self.other.user)
+        response = self.client.post(url, {'seat': self.seats[0].pk})
+        self.assertRedirects(response, reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk}))
+        self.assertEqual([str(m) for m in response.wsgi_request._messages], [SEAT_HELD])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """ The test database is the primary, a second SQLite file stands in for the replica"""
+
+    def setUp(self):
+        cache.clear()
+        replica_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, replica_dir, ignore_errors=True)
+        connections.databases['test-replica'] = {'ENGINE': 'django.db.backends.sqlite3',
+                                            'NAME': os.path.join(replica_dir, 'replica.sqlite3')}
+        self.addCleanup(self.drop_replica)
+        replica = override_settings(DATABASE_REPLICA='test-replica')
+        replica.enable()
+        self.addCleanup(replica.disable)
+
+        with connections['test-replica'].schema_editor() as editor:
+            for model in (User, OrganizerProfile, EventProfile):
+                editor.create_model(model)
+
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        EventProfile.objects.filter(pk=self.test_event.pk).update(event_name="primary-name")
+
+        # the replica lags behind: it has the event with its old name
+        for instance in (test_organizer.user, test_organizer, self.test_event):
+            instance.save(using='test-replica')
+        EventProfile.objects.using('test-replica').filter(pk=self.test_event.pk).update(event_name="replica-name")
+
+    def drop_replica(self):
+        connections['test-replica'].close()
+        del connections['test-replica']
+        del connections.databases['test-replica']
+
+    def event_name(self):
+        return EventProfile.objects.get(pk=self.test_event.pk).event_name
+
+    def test_reads_go_to_replica(self):
+        """ Reading an event outside and inside a transaction or a primary block
+        -> read from the replica only outside, writes always go to the primary"""
+
+        self.assertEqual(self.event_name(), "replica-name")
+        with use_primary():
+            self.assertEqual(self.event_name(), "primary-name")
+        with transaction.atomic():
+            self.assertEqual(self.event_name(), "primary-name")
+
+        self.assertEqual(router.db_for_write(EventProfile), 'default')
+        self.assertFalse(router.allow_migrate('test-replica', 'book2fest'))
+
+    def test_requests_that_write_pinned_to_primary(self):
+        """ GET, POST, GET right after the POST and GET of a view that writes
+        -> only the first GET reads from the replica"""
+
+        middleware = PrimaryPinningMiddleware(lambda request: HttpResponse(self.event_name()))
+        factory = RequestFactory()
+
+        self.assertEqual(middleware(factory.get('/')).content, b"replica-name")
+
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b"primary-name")
+        self.assertIn(middleware.cookie_name, response.cookies)
+
+        request = factory.get('/')
+        request.COOKIES[middleware.cookie_name] = '1'
+        self.assertEqual(middleware(request).content, b"primary-name")
+
+        cancel = reverse('book2fest:event-cancel', kwargs={'pk': self.test_event.pk})
+        self.assertEqual(middleware(factory.get(cancel)).content, b"primary-name")
+
+
+def flaky(failures):
+    """ Function raising "database is locked" the first failures calls"""
+    calls = []
+
+    def write():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise OperationalError("database is locked")
+        return len(calls)
+    return write
+
+
+class SQLiteTuningTests(TestCase):
+
+    def test_pragmas_applied(self):
+        """ New SQLite connection
+        -> runs with the PRAGMAs of book2fest.sqlite"""
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], sqlite.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 10000})
+    def test_pragmas_overridden(self):
+        """ settings.SQLITE_PRAGMAS with a PRAGMA
+        -> that PRAGMA is overridden, the others keep their default"""
+
+        self.assertEqual(sqlite.pragmas(), dict(sqlite.SQLITE_PRAGMAS, busy_timeout=10000))
+
+    def test_no_retry_inside_atomic(self):
+        """ Lock error inside an outer transaction
+        -> raised at once, the owner of the transaction has to handle it"""
+
+        write = flaky(1)
+        with self.assertRaises(OperationalError):
+            retry_on_locked(write, backoff=0)()
+
+
+class RetryOnLockedTests(SimpleTestCase):
+
+    def test_retry_until_unlocked(self):
+        """ Write failing twice with a lock error
+        -> retried until it succeeds"""
+
+        self.assertEqual(retry_on_locked(flaky(2), backoff=0)(), 3)
+
+    def test_give_up(self):
+        """ Write failing more times than the retries, or with another error
+        -> the error is raised"""
+
+        with self.assertRaises(OperationalError):
+            retry_on_locked(flaky(3), retries=2, backoff=0)()
+
+        def broken():
+            raise OperationalError("no such table")
+        with self.assertRaises(OperationalError):
+            retry_on_locked(broken, backoff=0)()
+
+
+class PageCacheTests(TransactionTestCase):
+    """ Versions are bumped when the transactions commit"""
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=2, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+
+    def test_anonymous_pages_cached_until_change(self):
+        """ Anonymous user GETs the home page and the event list twice, then a seat is booked
+        -> the second GET is served from the cache, the one after the booking is not"""
+
+        for url in (reverse('homepage'), reverse('book2fest:event-list')):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+
+        book_seat(self.test_user, self.test_event, Seat.objects.filter(event=self.test_event).first(), self.test_delivery)
+
+        for url in (reverse('homepage'), reverse('book2fest:event-list')):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+
+    def test_logged_user_not_cached(self):
+        """ Logged user GETs the event list twice
+        -> the page is never cached"""
+
+        self.client.force_login(self.test_user.user)
+        url = reverse('book2fest:event-list')
+        self.client.get(url)
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+
+    def test_event_fragments_follow_version(self):
+        """ Anonymous user GETs the event page, then an artist of the event is renamed
+        -> the artists fragment is rendered again with the new name"""
+
+        genre = Genre.objects.create(name="test-genre", category=Category.objects.create(name="test-category"))
+        artist = Artist.objects.create(full_name="test-artist", genre=genre, image="images/red.jpg")
+        self.test_event.artist_list.add(artist)
+        url = reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk})
+        self.assertContains(self.client.get(url), "test-artist")
+
+        artist.full_name = "test-renamed"
+        artist.save()
+        response = self.client.get(url)
+        self.assertContains(response, "test-renamed")
+        self.assertNotContains(response, "test-artist:")
+
+
+class TicketExportTests(TestCase):
+
+    def setUp(self):
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=self.test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=3, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+        test_user = create_user_profile(create_user("test-user", "test-pw"))
+        seats = Seat.objects.filter(event=self.test_event).order_by('-number')
+        self.tickets = [book_seat(test_user, self.test_event, seat, test_delivery)[0] for seat in seats[:2]]
+        Review.objects.create(ticket=self.tickets[0], rating=4.0)
+        self.url = reverse('book2fest:ticket-export', kwargs={'pk': self.test_event.pk})
+
+    def test_csv(self):
+        """ Organizer exports the tickets of the event as CSV
+        -> one line per ticket after the header, by row and number, with the rating of the review"""
+
+        self.client.force_login(self.test_organizer.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([line['ticket'] for line in lines], [str(ticket.pk) for ticket in reversed(self.tickets)])
+        self.assertEqual([line['rating'] for line in lines], ['', '4.0'])
+        self.assertEqual(lines[0]['email'], "")
+        self.assertEqual(lines[0]['delivery'], "test-delivery")
+
+    def test_jsonl(self):
+        """ Organizer exports the tickets of the event as JSON lines
+        -> one object per ticket with every column"""
+
+        self.client.force_login(self.test_organizer.user)
+        response = self.client.get(self.url, {'format': 'jsonl'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(list(lines[1]), [column for column, __ in EXPORT_COLUMNS])
+        self.assertEqual(lines[1]['rating'], 4.0)
+
+    def test_not_allowed(self):
+        """ Another organizer exports the tickets, or the format is unknown
+        -> redirected without the export"""
+
+        other = create_organizer(create_user("test-other", "test-pw"))
+        self.client.force_login(other.user)
+        self.assertRedirects(self.client.get(self.url), reverse('homepage'))
+
+        self.client.force_login(self.test_organizer.user)
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertRedirects(response, reverse('book2fest:manage-seat', kwargs={'pk': self.test_event.pk}), fetch_redirect_response=False)
+
+
+class TicketExportAsgiTests(TransactionTestCase):
+    """ Under ASGI the middleware resolve the profile in the threads of book2fest.aio"""
+
+    def setUp(self):
+        TicketExportTests.setUp(self)
+
+    def test_asgi(self):
+        """ Organizer exports the tickets of the event through the ASGI application
+        -> the whole export is streamed, the queries run out of the event loop"""
+        from base_project.asgi import application
+
+        self.client.force_login(self.test_organizer.user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        async def export():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'method': 'GET', 'path': self.url, 'query_string': b'format=jsonl',
+                'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())]})
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            messages = [await communicator.receive_output(5)]
+            while messages[-1].get('more_body', messages[-1]['type'] == 'http.response.start'):
+                messages.append(await communicator.receive_output(5))
+            return messages
+
+        messages = async_to_sync(export)()
+        self.assertEqual(messages[0]['status'], 200)
+        lines = b''.join(message.get('body', b'') for message in messages[1:]).decode().splitlines()
+        self.assertEqual([json.loads(line)['ticket'] for line in lines], [ticket.pk for ticket in reversed(self.tickets)])
+
+
+class ImportEventsTests(TestCase):
+
+    def setUp(self):
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.rock = Genre.objects.create(name="Rock", category=Category.objects.create(name="Music"))
+        self.artist = Artist.objects.create(full_name="Freddie Mercury", genre=self.rock, image="images/red.jpg")
+        Service.objects.create(name="WC", description="test", icon=ServiceImage.objects.create(path="services/wc.svg"))
+
+    def entry(self, name, **kwargs):
+        entry = {'event_name': name, 'brief_description': "test", 'description': "test", 'city': "Modena",
+                 'province': "MO", 'cap': "41121", 'country': "Italy", 'address': "test", 'how_to_reach': "test",
+                 'max_capacity': 100, 'event_start': "2030-07-01T20:00", 'event_end': "2030-07-01T23:00",
+                 'artists': ["Freddie Mercury", {'full_name': "Brian May", 'genre': "Rock"}],
+                 'services': ["WC"],
+                 'seats': [{'rows': "A-C", 'seats_per_row': 10, 'seat_type': "Stalls", 'price': 30}]}
+        entry.update(kwargs)
+        return entry
+
+    def test_import(self):
+        """ Import two events sharing an existing and a new artist
+        -> events, artists, services and seats created, counters and search index up to date"""
+
+        report = import_events(self.test_organizer, [self.entry("Summer Festival"), self.entry("Winter Festival")])
+
+        self.assertEqual(report.errors, [])
+        self.assertEqual((report.events, report.artists, report.seat_types, report.seats), (2, 1, 1, 60))
+        events = EventProfile.objects.filter(user=self.test_organizer)
+        self.assertEqual(events.count(), 2)
+        self.assertEqual(Artist.objects.filter(full_name="Brian May").count(), 1)
+        for event in events:
+            self.assertEqual(sorted(event.artist_list.values_list('full_name', flat=True)), ["Brian May", "Freddie Mercury"])
+            self.assertEqual(list(event.services.values_list('name', flat=True)), ["WC"])
+            self.assertEqual(event.seats_available, 30)
+            self.assertEqual(Seat.objects.filter(event=event, seat_type__name="Stalls").count(), 30)
+        self.assertEqual(set(EventProfile.objects.filter(pk__in=search_events("brian", "artist"))), set(events))
+
+    def test_invalid_entry(self):
+        """ Import a valid event and one with an unknown genre, too many seats and a bad province
+        -> nothing is created, every error is reported"""
+
+        report = import_events(self.test_organizer, [
+            self.entry("Summer Festival"),
+            self.entry("Winter Festival", province="Modena", max_capacity=10,
+                       artists=[{'full_name': "Ozzy", 'genre': "Metal"}]),
+        ])
+
+        self.assertEqual(len(report.errors), 3)
+        self.assertTrue(all(error.startswith("event 2 (Winter Festival)") for error in report.errors))
+        self.assertFalse(EventProfile.objects.exists())
+        self.assertFalse(Artist.objects.filter(full_name="Brian May").exists())
+
+    def test_malformed_values(self):
+        """ Import events whose artists, services and seats are values of the wrong type, then upload them
+        -> nothing is created, every bad value is reported as an error of its event; the upload shows them"""
+
+        entries = [
+            self.entry("Summer Festival", artists=[5, {'full_name': ["Brian May"], 'genre': "Rock"},
+                                                   {'full_name': "Brian May", 'genre': {'name': "Rock"}}]),
+            self.entry("Winter Festival", services=[{'a': 1}, ["WC"]], seats=["A-C", 5, {'rows': "A", 'seats_per_row': "ten", 'price': 1}]),
+            self.entry("Autumn Festival", artists="Freddie Mercury", services=5),
+        ]
+
+        report = import_events(self.test_organizer, entries)
+
+        self.assertEqual([error.split(':')[0] for error in report.errors],
+                         ["event 1 (Summer Festival)"] * 3 + ["event 2 (Winter Festival)"] * 5 + ["event 3 (Autumn Festival)"] * 2)
+        self.assertFalse(EventProfile.objects.exists())
+
+        self.client.force_login(self.test_organizer.user)
+        upload = SimpleUploadedFile("events.json", json.dumps({'events': entries}).encode())
+        response = self.client.post(reverse('book2fest:event-import'), {'file': upload})
+        self.assertRedirects(response, reverse('book2fest:event-import'), fetch_redirect_response=False)
+        self.assertFalse(EventProfile.objects.exists())
+
+    def test_dry_run(self):
+        """ Dry run of a valid import
+        -> validated and counted, nothing is created"""
+
+        report = import_events(self.test_organizer, [self.entry("Summer Festival")], dry_run=True)
+
+        self.assertEqual((report.errors, report.events, report.seats), ([], 1, 30))
+        self.assertFalse(EventProfile.objects.exists())
+        self.assertFalse(SeatType.objects.exists())
+
+    def test_csv_command(self):
+        """ Import a CSV file with the management command, then a file with errors
+        -> the events of the first file are created, the second one fails"""
+
+        columns = ['event_name', 'brief_description', 'description', 'city', 'province', 'cap', 'country', 'address',
+                   'how_to_reach', 'max_capacity', 'event_start', 'event_end', 'artists', 'services', 'seats']
+        entry = self.entry("Summer Festival", artists="Freddie Mercury; Brian May:Rock:Music", services="WC",
+                           seats="A-B:5:Stalls:30; C:10:Gallery:20")
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            writer.writerow([entry[column] for column in columns])
+            writer.writerow([entry[column] if column != 'artists' else "Ozzy" for column in columns])
+        self.addCleanup(os.remove, file.name)
+
+        with self.assertRaises(CommandError):
+            call_command('import_events', file.name, organizer="test-organizer")
+        self.assertFalse(EventProfile.objects.exists())
+
+        with open(file.name) as source, open(file.name + '.ok.csv', 'w') as target:
+            target.writelines(source.readlines()[:2])
+        self.addCleanup(os.remove, file.name + '.ok.csv')
+        call_command('import_events', file.name + '.ok.csv', organizer="test-organizer", stdout=StringIO())
+        event = EventProfile.objects.get()
+        self.assertEqual(event.seats_available, 20)
+        self.assertEqual(event.artist_list.count(), 2)
+
+    def test_upload(self):
+        """ Organizer uploads a JSON file
+        -> the events are created and the organizer is redirected to the event list"""
+
+        self.client.force_login(self.test_organizer.user)
+        upload = SimpleUploadedFile("events.json", json.dumps({'events': [self.entry("Summer Festival")]}).encode())
+
+        response = self.client.post(reverse('book2fest:event-import'), {'file': upload})
+
+        self.assertRedirects(response, reverse('book2fest:event-list'), fetch_redirect_response=False)
+        self.assertTrue(EventProfile.objects.filter(event_name="Summer Festival", user=self.test_organizer).exists())
+
+
+class RatingSummaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=30, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=30, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+        self.seats = iter(Seat.objects.filter(event=self.test_event).order_by('pk'))
+
+    def book(self):
+        ticket, __ = book_seat(self.test_user, self.test_event, next(self.seats), self.test_delivery)
+        return ticket
+
+    def histogram(self):
+        summary = RatingSummary.objects.get(event=self.test_event)
+        return summary.count, summary.total, [reviews for __, reviews, __ in summary.histogram]
+
+    def test_review_updates_summary(self):
+        """ User rates two tickets through the ticket page, changes a rating, then a review is deleted
+        -> count, sum and histogram follow every change, like a rebuild from scratch"""
+
+        self.client.force_login(self.test_user.user)
+        first, second = self.book(), self.book()
+        for ticket, rating in ((first, 4.0), (second, 2.4)):
+            self.client.get(reverse('book2fest:ticket-manage', kwargs={'pk': ticket.pk}))
+            self.client.post(reverse('book2fest:ticket-manage', kwargs={'pk': ticket.pk}), {'rating': rating, 'content': "test"})
+        self.assertEqual(self.histogram(), (2, 6.4, [0, 1, 0, 1, 0, 0]))
+        self.assertIsNotNone(RatingSummary.objects.get(event=self.test_event).last_review)
+
+        self.client.post(reverse('book2fest:ticket-manage', kwargs={'pk': second.pk}), {'rating': 5.0, 'content': "test"})
+        self.assertEqual(self.histogram(), (2, 9.0, [1, 1, 0, 0, 0, 0]))
+
+        Review.objects.get(ticket=first).delete()
+        self.assertEqual(self.histogram(), (1, 5.0, [1, 0, 0, 0, 0, 0]))
+
+        rebuild_counters()
+        self.assertEqual(self.histogram(), (1, 5.0, [1, 0, 0, 0, 0, 0]))
+
+    def test_update_parameters(self):
+        """ A rating added, changed and removed on an existing summary
+        -> the summary is updated with numbers as parameters, no booleans"""
+
+        Review.objects.create(ticket=self.book(), rating=3.0, content="test")
+        params = []
+
+        def record(execute, sql, query_params, many, context):
+            if sql.startswith('UPDATE') and 'ratingsummary' in sql:
+                params.extend(query_params)
+            return execute(sql, query_params, many, context)
+
+        with connection.execute_wrapper(record):
+            for old, new in ((None, 4.0), (4.0, 2.0), (2.0, None)):
+                rating_summary_changed(self.test_event.pk, old, new)
+        self.assertTrue(params)
+        self.assertFalse([param for param in params if isinstance(param, bool)])
+        self.assertEqual(self.histogram(), (1, 3.0, [0, 0, 1, 0, 0, 0]))
+
+    def test_reviews_newest_first(self):
+        """ Event with 25 reviews and an empty one
+        -> the event page shows the 10 newest ones, the review pages all of them newest first, 20 at a time"""
+
+        now = timezone.now()
+        reviews = [Review.objects.create(ticket=self.book(), rating=3.0, content=f"test-{i}", date=now - timedelta(days=i))
+                   for i in range(25)]
+        Review.objects.create(ticket=self.book())
+
+        response = self.client.get(reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk}))
+        self.assertEqual(list(response.context['reviews']), reviews[:10])
+
+        response = self.client.get(reverse('book2fest:event-reviews', kwargs={'pk': self.test_event.pk}))
+        self.assertEqual(list(response.context['object_list']), reviews[:20])
+        self.assertEqual(response.context['rating_summary'].count, 25)
+        response = self.client.get(reverse('book2fest:event-reviews', kwargs={'pk': self.test_event.pk}) + response.context['page_obj'].next_url)
+        self.assertEqual(list(response.context['object_list']), reviews[20:])
+        self.assertFalse(response.context['page_obj'].has_next)
+
+
+class GroupBookingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=20, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        self.seat_type = SeatType.objects.create(name="test-seat-type")
+        add_seats(total_new=6, price=30.0, row="A", seat_type=self.seat_type, event=self.test_event)
+        self.seats = list(Seat.objects.filter(event=self.test_event).order_by('pk'))
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+        self.other = create_user_profile(create_user("test-other", "test-pw"))
+
+    def available(self):
+        return list(Seat.objects.filter(event=self.test_event, available=True).order_by('pk'))
+
+    def test_all_or_nothing(self):
+        """ Group of three seats where one is booked and then one held by another user, then three free seats
+        -> nothing is booked while any seat is taken, then all the three seats with their tickets and counters"""
+
+        book_seat(self.other, self.test_event, self.seats[2], self.test_delivery)
+        place_hold(self.other, self.test_event, self.seats[3].pk)
+
+        for group in (self.seats[0:3], self.seats[1:4], self.seats[3:6]):
+            self.assertEqual(book_seats(self.test_user, self.test_event, [seat.pk for seat in group], self.test_delivery), (None, SEATS_TAKEN))
+        self.assertEqual(self.available(), self.seats[:2] + self.seats[3:])
+        self.assertFalse(Ticket.objects.filter(user=self.test_user).exists())
+
+        get_seat_map(self.test_event.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            tickets, __ = book_seats(self.test_user, self.test_event, [self.seats[0].pk, self.seats[1].pk, self.seats[4].pk], self.test_delivery)
+        self.assertEqual([ticket.seat for ticket in tickets], [self.seats[0], self.seats[1], self.seats[4]])
+        self.assertEqual(Ticket.objects.filter(user=self.test_user).count(), 3)
+        self.assertEqual(self.available(), [self.seats[3], self.seats[5]])
+        self.test_event.refresh_from_db()
+        self.assertEqual(self.test_event.seats_available, 2)
+        self.assertEqual(get_seat_map(self.test_event.pk)['available'], 2)
+
+    def test_same_side_effects(self):
+        """ A seat booked alone, then a group of two
+        -> the side effects of the new tickets are the same ones, run once per booking"""
+
+        with mock.patch('book2fest.signals.tickets_created') as tickets_created:
+            book_seat(self.test_user, self.test_event, self.seats[0], self.test_delivery)
+            book_seats(self.test_user, self.test_event, [self.seats[2].pk, self.seats[1].pk], self.test_delivery)
+        self.assertEqual(tickets_created.call_args_list, [
+            mock.call(self.test_event.pk, [self.seats[0].pk], self.test_user.user_id),
+            mock.call(self.test_event.pk, [self.seats[1].pk, self.seats[2].pk], self.test_user.user_id)])
+
+    def test_group_size(self):
+        """ Empty group or larger than GROUP_BOOKING_SIZE
+        -> nothing is booked"""
+
+        self.assertEqual(book_seats(self.test_user, self.test_event, [], self.test_delivery), (None, GROUP_SIZE))
+        self.assertEqual(book_adjacent_seats(self.test_user, self.test_event, GROUP_BOOKING_SIZE + 1, self.test_delivery), (None, GROUP_SIZE))
+
+    def test_adjacent_seats(self):
+        """ Three adjacent seats in a row where the third seat is booked, then three more
+        -> the first three consecutive free seats are booked, then no seats"""
+
+        add_seats(total_new=3, price=30.0, row="B", seat_type=SeatType.objects.create(name="test-other-type"), event=self.test_event)
+        book_seat(self.other, self.test_event, self.seats[2], self.test_delivery)
+
+        tickets, __ = book_adjacent_seats(self.test_user, self.test_event, 3, self.test_delivery, row="A", seat_type=self.seat_type.pk)
+        self.assertEqual([ticket.seat for ticket in tickets], self.seats[3:6])
+
+        tickets, __ = book_adjacent_seats(self.test_user, self.test_event, 3, self.test_delivery, seat_type=self.seat_type.pk)
+        self.assertIsNone(tickets)
+
+    def test_endpoint(self):
+        """ User books listed seats with JSON, then adjacent seats with the form of the event page
+        -> JSON with the tickets, then redirected to the ticket list"""
+
+        self.client.force_login(self.test_user.user)
+        url = reverse('book2fest:event-group-booking', kwargs={'pk': self.test_event.pk})
+        self.assertContains(self.client.get(reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk})), 'group-booking-form')
+
+        response = self.client.post(url, json.dumps({'seats': [self.seats[0].pk, self.seats[1].pk], 'delivery': self.test_delivery.pk}),
+                                    content_type='application/json', HTTP_ACCEPT='application/json')
+        self.assertTrue(response.json()['booked'])
+        self.assertEqual([ticket['seat'] for ticket in response.json()['tickets']], [self.seats[0].pk, self.seats[1].pk])
+
+        response = self.client.post(url, {'quantity': 2, 'row': "A", 'delivery': self.test_delivery.pk})
+        self.assertRedirects(response, reverse('book2fest:ticket-list'), fetch_redirect_response=False)
+        self.assertEqual(self.available(), self.seats[4:])
+
+
+class AllocatorTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=20, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        self.seat_type = SeatType.objects.create(name="test-seat-type")
+        self.other_type = SeatType.objects.create(name="test-other-type")
+        add_seats(total_new=6, price=30.0, row="A", seat_type=self.seat_type, event=self.test_event)
+        add_seats(total_new=4, price=50.0, row="B", seat_type=self.seat_type, event=self.test_event)
+        add_seats(total_new=3, price=50.0, row="C", seat_type=self.other_type, event=self.test_event)
+        seats = Seat.objects.filter(event=self.test_event).order_by('row', 'pk')
+        self.rows = {row: [seat for seat in seats if seat.row == row] for row in "ABC"}
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+        self.other = create_user_profile(create_user("test-other", "test-pw"))
+
+    def pks(self, row, start, end):
+        return [seat.pk for seat in self.rows[row][start:end]]
+
+    def test_best_block(self):
+        """ Rows of 30 and 50 seats, where the second seat of the row at 50 is booked
+        -> the most expensive block within the price, of the seat type if given, else None"""
+
+        book_seat(self.other, self.test_event, self.rows["B"][1], self.test_delivery)
+        index = allocator.build_index(get_seat_map(self.test_event.pk))
+
+        self.assertEqual(allocator.best_block(index, 1), self.pks("B", 0, 1))
+        self.assertEqual(allocator.best_block(index, 2), self.pks("B", 2, 4))
+        self.assertEqual(allocator.best_block(index, 3), self.pks("C", 0, 3))
+        self.assertEqual(allocator.best_block(index, 3, seat_type=self.seat_type.pk), self.pks("A", 0, 3))
+        self.assertEqual(allocator.best_block(index, 2, max_price=40), self.pks("A", 0, 2))
+        self.assertIsNone(allocator.best_block(index, 2, max_price=20))
+        self.assertIsNone(allocator.best_block(index, 7))
+
+    def test_incremental_update(self):
+        """ Index of the event, then a booking, a hold and its release
+        -> the booked and held seats are taken off the index, the release has it built again"""
+
+        index = allocator.get_index(self.test_event.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            book_seat(self.other, self.test_event, self.rows["A"][2], self.test_delivery)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_hold(self.other, self.test_event, self.rows["B"][0].pk)
+
+        self.assertIs(allocator.get_index(self.test_event.pk), index)
+        self.assertEqual(index['types'][self.seat_type.pk]['seats'],
+                         [self.pks("B", 1, 4), self.pks("A", 0, 2), self.pks("A", 3, 6)])
+        self.assertEqual(index, allocator.build_index(get_seat_map(self.test_event.pk)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_hold(self.other, self.test_event, self.rows["B"][0].pk)
+        self.assertEqual(allocator.find_block(self.test_event.pk, 4, seat_type=self.seat_type.pk), self.pks("B", 0, 4))
+
+    def test_book_best_available(self):
+        """ Stale cached index where the best seats were taken, then more seats than available
+        -> the next best block is booked on a fresh index, then nothing"""
+
+        allocator.get_index(self.test_event.pk)
+        Seat.objects.filter(pk__in=self.pks("B", 0, 1)).update(available=False)  # behind the back of the index
+
+        tickets, __ = book_best_available(self.test_user, self.test_event, 2, self.test_delivery)
+        self.assertEqual([ticket.seat_id for ticket in tickets], self.pks("B", 1, 3))
+        tickets, __ = book_best_available(self.test_user, self.test_event, 2, self.test_delivery)
+        self.assertEqual([ticket.seat_id for ticket in tickets], self.pks("C", 0, 2))
+        self.assertEqual(book_best_available(self.test_user, self.test_event, 7, self.test_delivery), (None, NO_SEATS_AVAILABLE))
+
+    def test_book_best_available_freed_seats(self):
+        """ Cached index of a sold out event, then seats freed behind its back
+        -> the seats are booked on a fresh index"""
+
+        Seat.objects.filter(event=self.test_event).update(available=False)
+        seatmap.invalidate(self.test_event.pk)
+        self.assertIsNone(allocator.find_block(self.test_event.pk, 1))
+        Seat.objects.filter(pk__in=self.pks("A", 0, 2)).update(available=True)
+
+        tickets, __ = book_best_available(self.test_user, self.test_event, 2, self.test_delivery)
+        self.assertEqual([ticket.seat_id for ticket in tickets], self.pks("A", 0, 2))
+
+    def test_hold_expiry(self):
+        """ A seat of the row at 50 is held, then the hold expires
+        -> the seat is off the index while held, back when the hold expires: the row is booked as best block;
+        the hold does not extend the state of the index"""
+
+        allocator.get_index(self.test_event.pk)
+        expires = cache.get(allocator._cache_key(self.test_event.pk))['expires']
+        with self.captureOnCommitCallbacks(execute=True):
+            place_hold(self.other, self.test_event, self.rows["B"][1].pk, ttl=0.2)
+        self.assertEqual(cache.get(allocator._cache_key(self.test_event.pk))['expires'], expires)
+        self.assertEqual(allocator.find_block(self.test_event.pk, 4), self.pks("A", 0, 4))
+
+        time.sleep(0.3)
+        self.assertEqual(allocator.find_block(self.test_event.pk, 4), self.pks("B", 0, 4))
+        tickets, __ = book_best_available(self.test_user, self.test_event, 4, self.test_delivery)
+        self.assertEqual([ticket.seat_id for ticket in tickets], self.pks("B", 0, 4))
+
+    def test_endpoint(self):
+        """ User asks the group booking endpoint for the best two seats up to 40 each
+        -> the first two seats of the row at 30 are booked"""
+
+        self.client.force_login(self.test_user.user)
+        response = self.client.post(reverse('book2fest:event-group-booking', kwargs={'pk': self.test_event.pk}),
+                                    json.dumps({'quantity': 2, 'max_price': 40, 'delivery': self.test_delivery.pk}),
+                                    content_type='application/json', HTTP_ACCEPT='application/json')
+        self.assertTrue(response.json()['booked'])
+        self.assertEqual([ticket['seat'] for ticket in response.json()['tickets']], self.pks("A", 0, 2))
+
+
+class ApiTests(TransactionTestCase):
+    """ Versions are bumped when the transactions commit"""
+
+    def setUp(self):
+        cache.clear()
+        self.test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=self.test_organizer, max_capacity=20, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        self.seat_type = SeatType.objects.create(name="test-seat-type")
+        add_seats(total_new=4, price=30.0, row="A", seat_type=self.seat_type, event=self.test_event)
+        self.genre = Genre.objects.create(name="test-genre", category=Category.objects.create(name="test-category"))
+        self.artist = Artist.objects.create(full_name="test-artist", genre=self.genre, image="images/red.jpg")
+        self.test_event.artist_list.add(self.artist)
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+
+    def test_fields(self):
+        """ Event list with the default fields, some fields, unknown fields
+        -> the default fields, the chosen ones, 400 with the available fields"""
+
+        response = self.client.get(reverse('book2fest:api-event-list'))
+        self.assertEqual(list(response.json()['results'][0]), list(EVENT_LIST_FIELDS))
+        self.assertIsNone(response.json()['next'])
+
+        response = self.client.get(reverse('book2fest:api-event-list') + '?fields=name,seats_available')
+        self.assertEqual(response.json()['results'], [{'name': self.test_event.event_name, 'seats_available': 4}])
+
+        response = self.client.get(reverse('book2fest:api-event-list') + '?fields=name,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", response.json()['error'])
+
+    def test_pagination(self):
+        """ Five events read two at a time, then an invalid cursor
+        -> every event once by start, then an error"""
+
+        for days in (12, 11, 13, 14):
+            create_event(user=self.test_organizer, max_capacity=10, seats_available=0, days=days, cancelled=False)
+        events = list(EventProfile.objects.order_by('event_start', 'pk').values_list('pk', flat=True))
+
+        pages, cursor = [], None
+        while True:
+            rows, cursor, __ = keyset_page(EventProfile.objects.all(), EVENT_ORDERING, EVENT_FIELDS, ['id'], cursor, page_size=2)
+            pages.append([row['id'] for row in rows])
+            if cursor is None:
+                break
+        self.assertEqual(pages, [events[0:2], events[2:4], events[4:]])
+        self.assertEqual(keyset_page(EventProfile.objects.all(), EVENT_ORDERING, EVENT_FIELDS, ['id'], "invalid"),
+                         (None, None, "Invalid cursor"))
+
+    def test_forged_cursors(self):
+        """ Event list with cursors whose values do not fit the fields of the ordering
+        -> 400"""
+
+        for values in (["garbage", 1], [None, 1], ["2020-01-01T00:00:00+00:00", "x"]):
+            response = self.client.get(reverse('book2fest:api-event-list'), {'cursor': encode_cursor(EVENT_ORDERING, values)})
+            self.assertEqual(response.status_code, 400)
+
+    def test_event_detail(self):
+        """ Event with an artist, a missing event
+        -> the event with its artists and services, 404"""
+
+        response = self.client.get(reverse('book2fest:api-event-detail', kwargs={'pk': self.test_event.pk}) + '?fields=id,artists,services')
+        self.assertEqual(response.json(), {'id': self.test_event.pk, 'services': [],
+                                           'artists': [{'id': self.artist.pk, 'full_name': "test-artist", 'genre': "test-genre"}]})
+        self.assertEqual(self.client.get(reverse('book2fest:api-event-detail', kwargs={'pk': 0})).status_code, 404)
+
+    def test_conditional_get(self):
+        """ Availability polled with the ETag, before and after a booking
+        -> 304 without queries, then the new availability with a new ETag"""
+
+        url = reverse('book2fest:api-event-availability', kwargs={'pk': self.test_event.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.json()['seat_types'], [{'id': self.seat_type.pk, 'name': "test-seat-type", 'available': 4,
+                                                          'occupied': 0, 'min_price': 30.0, 'max_price': 30.0}])
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        seat = Seat.objects.filter(event=self.test_event).first()
+        book_seat(self.test_user, self.test_event, seat, self.test_delivery)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual((response.json()['available'], response.json()['occupied']), (3, 1))
+
+    def test_ratings_and_artists(self):
+        """ Rating summary of an event with a review, artist list before and after a new artist without events
+        -> count, average and histogram, a new ETag and the new artist"""
+
+        seat = Seat.objects.filter(event=self.test_event).first()
+        ticket, __ = book_seat(self.test_user, self.test_event, seat, self.test_delivery)
+        Review.objects.create(ticket=ticket, rating=4.0, content="test")
+        response = self.client.get(reverse('book2fest:api-event-ratings', kwargs={'pk': self.test_event.pk}))
+        self.assertEqual((response.json()['count'], response.json()['average'], response.json()['histogram']),
+                         (1, 4.0, [0, 0, 0, 0, 1, 0]))
+
+        url = reverse('book2fest:api-artist-list') + '?fields=full_name'
+        etag = self.client.get(url)['ETag']
+        Artist.objects.create(full_name="test-new-artist", genre=self.genre, image="images/red.jpg")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'], [{'full_name': "test-artist"}, {'full_name': "test-new-artist"}])
+
+
+class LiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        self.test_delivery = Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=3, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+        self.seats = list(Seat.objects.filter(event=self.test_event).order_by('pk'))
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+
+    def test_publish(self):
+        """ Booking, hold and release committed, deltas published from another thread
+        -> every subscriber of the event gets the deltas in order, the ones of other events nothing"""
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            book_seat(self.test_user, self.test_event, self.seats[0], self.test_delivery)
+            place_hold(self.test_user, self.test_event, self.seats[1].pk)
+            release_hold(self.test_user, self.test_event, self.seats[1].pk)
+
+        async def listen():
+            subscriptions = [live.subscribe(self.test_event.pk) for __ in range(3)]
+            other = live.subscribe(0)
+            for callback in callbacks:
+                callback()
+            thread = threading.Thread(target=live.publish, args=(self.test_event.pk, {'changed': True}))
+            thread.start()
+            thread.join()
+            received = [b''.join(await asyncio.wait_for(subscription.get(), 1)) for subscription in subscriptions]
+            for subscription in subscriptions + [other]:
+                live.unsubscribe(subscription)
+            return received, other.messages
+
+        received, other = async_to_sync(listen)()
+        self.assertEqual(received, [b'data: {"booked": [%d]}\n\ndata: {"held": [%d]}\n\ndata: {"released": [%d]}\n\n'
+                                    b'data: {"changed": true}\n\n' % (self.seats[0].pk, self.seats[1].pk, self.seats[1].pk)] * 3)
+        self.assertEqual(other, [])
+        self.assertEqual(live.subscribers(self.test_event.pk), 0)
+
+    def test_seat_stream(self):
+        """ Browser opens the seat stream of the event through the ASGI application, a seat is booked, the browser leaves
+        -> event stream with the snapshot and the delta, then the stream ends and unsubscribes"""
+        from base_project.asgi import application
+
+        chunks = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            chunks.append(message)
+            if len(chunks) == 3:
+                disconnect.set()
+
+        async def browse():
+            path = reverse('book2fest:event-seat-stream', kwargs={'pk': self.test_event.pk})
+            stream = asyncio.ensure_future(application({'type': 'http', 'method': 'GET', 'path': path, 'headers': [],
+                                                        'query_string': b''}, receive, send))
+            while not live.subscribers(self.test_event.pk):
+                await asyncio.sleep(0.01)
+            live.publish(self.test_event.pk, {'booked': [self.seats[0].pk]})
+            await asyncio.wait_for(stream, 5)
+
+        async_to_sync(browse)()
+        self.assertEqual(chunks[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), chunks[0]['headers'])
+        self.assertIn(b'event: snapshot\ndata: {"event": %d, "available": 3' % self.test_event.pk, chunks[1]['body'])
+        self.assertEqual(chunks[2]['body'], b'data: {"booked": [%d]}\n\n' % self.seats[0].pk)
+        self.assertEqual(live.subscribers(self.test_event.pk), 0)
+
+        response = self.client.get(reverse('book2fest:event-seat-stream', kwargs={'pk': self.test_event.pk}))
+        self.assertEqual(response.status_code, 503)  # not under ASGI
+
+    def test_seat_stream_catches_up(self):
+        """ Event page rendered, a seat booked, then the browser connects to the seat stream while another seat is
+        booked, right after the snapshot is taken
+        -> the snapshot has the seat booked before, the page applies it; the delta of the other one follows"""
+        from base_project.asgi import application
+
+        response = self.client.get(reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk}))
+        self.assertContains(response, 'seatStream.addEventListener("snapshot"')
+        with self.captureOnCommitCallbacks(execute=True):
+            book_seat(self.test_user, self.test_event, self.seats[0], self.test_delivery)
+
+        take_snapshot = live._snapshot
+
+        def snapshot(event_id):
+            taken = take_snapshot(event_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                book_seat(self.test_user, self.test_event, self.seats[1], self.test_delivery)
+            return taken
+
+        chunks = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            chunks.append(message)
+            if len(chunks) == 3:
+                disconnect.set()
+
+        async def browse():
+            path = reverse('book2fest:event-seat-stream', kwargs={'pk': self.test_event.pk})
+            await asyncio.wait_for(application({'type': 'http', 'method': 'GET', 'path': path, 'headers': [],
+                                                'query_string': b''}, receive, send), 5)
+
+        with mock.patch.object(live, '_snapshot', side_effect=snapshot):
+            async_to_sync(browse)()
+        data = json.loads(chunks[1]['body'].split(b'data: ', 1)[1])
+        self.assertEqual((data['available'], data['booked'], data['held']), (2, [self.seats[0].pk], []))
+        self.assertEqual(chunks[2]['body'], b'data: {"booked": [%d]}\n\n' % self.seats[1].pk)
+
+
+@contextmanager
+def async_urls():
+    """ The urls of the project with the async views of book2fest.aio"""
+    import base_project.urls
+    import book2fest.urls
+
+    def reload():
+        importlib.reload(book2fest.urls)
+        importlib.reload(base_project.urls)
+        clear_url_caches()
+
+    with mock.patch.object(aio, 'ASYNC_VIEWS', True):
+        reload()
+    try:
+        yield
+    finally:
+        reload()
+
+
+def async_get(client, url):
+    """ GET of the AsyncClient, from sync code"""
+    async def get():
+        return await client.get(url)
+    return async_to_sync(get)()
+
+
+def without_csrf_tokens(content):
+    return re.sub(rb'name="csrfmiddlewaretoken" value="[^"]*"', b'', content)
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """ Queries of the async views run in other threads, which see committed data only"""
+
+    def setUp(self):
+        cache.clear()
+        test_organizer = create_organizer(create_user("test-organizer", "test-pw"))
+        self.test_event = create_event(user=test_organizer, max_capacity=10, seats_available=0, days=10, cancelled=False)
+        create_event(user=test_organizer, max_capacity=10, seats_available=0, days=-10, cancelled=False)
+        Delivery.objects.create(name="test-delivery", overprice=1.0, delivery_time=timedelta(days=2))
+        add_seats(total_new=3, price=30.0, row="A", seat_type=SeatType.objects.create(name="test-seat-type"), event=self.test_event)
+        genre = Genre.objects.create(name="test-genre", category=Category.objects.create(name="test-category"))
+        self.test_event.artist_list.add(Artist.objects.create(full_name="test-artist", genre=genre, image="images/red.jpg"))
+        self.test_user = create_user_profile(create_user("test-user", "test-pw"))
+        self.urls = [reverse('homepage'), reverse('book2fest:event-list'), reverse('book2fest:artist-list'),
+                     reverse('book2fest:event-detail', kwargs={'pk': self.test_event.pk})]
+
+    def test_same_pages(self):
+        """ Anonymous and logged user GET the home page, the event list, the artist list and the event page from the sync
+        views, then from the async ones through the ASGI handler
+        -> the same pages, served by coroutines"""
+
+        async_client = AsyncClient()
+        for user in (None, self.test_user.user):
+            if user:
+                self.client.force_login(user)
+                async_client.force_login(user)
+            for url in self.urls:
+                cache.clear()
+                expected = self.client.get(url)
+                cache.clear()
+                with async_urls():
+                    self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+                    response = async_get(async_client, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(without_csrf_tokens(response.content), without_csrf_tokens(expected.content))
+        self.assertContains(response, 'id="group-booking-form"')
+
+        with async_urls():
+            response = async_get(async_client, reverse('book2fest:event-detail', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_cache(self):
+        """ Anonymous user GETs the home page twice from the async view
+        -> the second one is served from the cache"""
+
+        with async_urls():
+            async_client = AsyncClient()
+            self.assertEqual(async_get(async_client, reverse('homepage'))['X-Page-Cache'], 'miss')
+            self.assertEqual(async_get(async_client, reverse('homepage'))['X-Page-Cache'], 'hit')
+
+    @override_settings(QUERY_PROFILING=True)
+    def test_queries_profiled(self):
+        """ Logged user GETs the event page from the sync view and from the async one, with query profiling on
+        -> the queries run in the pool are recorded too: the same ones, besides the setup of the connections of the pool"""
+
+        recorders = []
+
+        def recorder():
+            recorders.append(QueryRecorder())
+            return recorders[-1]
+
+        async_client = AsyncClient()
+        self.client.force_login(self.test_user.user)
+        async_client.force_login(self.test_user.user)
+        with mock.patch('book2fest.middleware.QueryRecorder', side_effect=recorder):
+            expected = self.client.get(self.urls[-1])
+            cache.clear()
+            with async_urls():
+                response = async_get(async_client, self.urls[-1])
+
+        self.assertEqual(int(response['X-Query-Count']), recorders[1].count)
+        queries = [sorted(sql for sql, __ in recorder.queries if not sql.startswith('PRAGMA')) for recorder in recorders]
+        self.assertEqual(len(queries[0]), int(expected['X-Query-Count']))
+        self.assertEqual(queries[1], queries[0])
+
+    @override_settings(QUERY_PROFILING=True)
+    def test_query_budgets(self):
+        """ Logged user GETs the pages from the async views, once the workers of the pool are connected
+        -> every page runs at most settings.QUERY_BUDGETS queries, like the sync view"""
+
+        barrier = threading.Barrier(aio.ASYNC_VIEWS_WORKERS, timeout=5)
+
+        def connect():
+            barrier.wait()  # one call per worker
+            connection.ensure_connection()
+
+        async_client = AsyncClient()
+        async_client.force_login(self.test_user.user)
+        async_to_sync(aio.gather)(*[connect] * aio.ASYNC_VIEWS_WORKERS)
+        with async_urls():
+            async_get(async_client, reverse('book2fest:profile'))  # the profile is resolved once per session
+            for url in self.urls:
+                cache.clear()
+                response = async_get(async_client, url)
+                view_name = resolve(url).view_name
+                self.assertLessEqual(int(response['X-Query-Count']), settings.QUERY_BUDGETS[view_name], view_name)
+
+    def test_concurrent_queries(self):
+        """ Two calls that wait for each other are gathered
+        -> they run at the same time in the pool, with the context variables of the caller"""
+
+        barrier = threading.Barrier(2, timeout=5)
+
+        def query():
+            barrier.wait()
+            return use_primary_pinned()
+
+        async def gather():
+            with use_primary():
+                return await aio.gather(query, query)
+
+        self.assertEqual(async_to_sync(gather)(), [True, True])
+
+    @override_settings(DEBUG=True)
+    def test_middleware_async(self):
+        """ Middleware chain loaded for ASGI
+        -> no middleware is adapted to sync, requests reach the async views without the thread of the sync views"""
+
+        with self.assertNoLogs('django.request', level=logging.DEBUG):
+            ASGIHandler().load_middleware(is_async=True)
+
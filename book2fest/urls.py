@@ -1,8 +1,11 @@
 from django.urls import path
 from . import views
+from .aio import page_view
 from .views import UserProfileView, OrganizerProfileView, CompleteRegistrationView, ArtistCreate, UserCreate, \
     OrganizerCreate, EventCreate, EventUpdate, EventDetail, EventList, ManageSeat, UserTicketList, ManageTicket, \
-    EventCancel, ArtistList, SeatTypeCreate, EventImagesUpload, ProfileView
+    EventCancel, ArtistList, SeatTypeCreate, EventImagesUpload, ProfileView, EventSeatMap, \
+    NotificationJobStatus, SeatHoldView, TicketExport, EventImport, EventReviews, GroupBookingView, ApiEventList, \
+    ApiEventDetail, ApiEventAvailability, ApiEventRatings, ApiArtistList, EventSeatStream
 
 app_name = "book2fest"
 
@@ -14,15 +17,28 @@ urlpatterns=[
     path('organizer/profile', OrganizerProfileView.as_view(), name='organizer-profile'),
     path('organizer/create', OrganizerCreate.as_view(), name='organizer-create'),
     path('event/create', EventCreate.as_view(), name='event-create' ),
-    path('event/<int:pk>/detail', EventDetail.as_view(), name='event-detail'),
-    path('event/list', EventList.as_view(), name='event-list'),
+    path('event/import', EventImport.as_view(), name='event-import'),
+    path('event/<int:pk>/detail', page_view(EventDetail), name='event-detail'),
+    path('event/<int:pk>/reviews', EventReviews.as_view(), name='event-reviews'),
+    path('event/<int:pk>/seat-map', EventSeatMap.as_view(), name='event-seat-map'),
+    path('event/<int:pk>/seat-stream', EventSeatStream.as_view(), name='event-seat-stream'),
+    path('event/<int:pk>/group-booking', GroupBookingView.as_view(), name='event-group-booking'),
+    path('event/<int:pk>/seat-hold', SeatHoldView.as_view(), name='event-seat-hold'),
+    path('event/list', page_view(EventList), name='event-list'),
     path('artist/create', ArtistCreate.as_view(), name='artist-create'),
-    path('artist/list', ArtistList.as_view(), name='artist-list'),
+    path('artist/list', page_view(ArtistList), name='artist-list'),
     path('event/<int:pk>/manage-seat', ManageSeat.as_view(), name='manage-seat' ),
+    path('event/<int:pk>/ticket-export', TicketExport.as_view(), name='ticket-export'),
     path('event/<int:pk>/cancel', EventCancel.as_view(), name='event-cancel'),
+    path('notification-job/<str:job_id>', NotificationJobStatus.as_view(), name='notification-job'),
     path('event/<int:pk>/update', EventUpdate.as_view(), name='event-update'),
     path('event/<int:pk>/image-upload', EventImagesUpload.as_view(), name='event-images-upload'),
     path('ticket/list', UserTicketList.as_view(), name='ticket-list' ),
     path('ticket/<int:pk>/manage', ManageTicket.as_view(), name='ticket-manage'),
-    path('seat-type/create', SeatTypeCreate.as_view(), name='seat-type-create')
+    path('seat-type/create', SeatTypeCreate.as_view(), name='seat-type-create'),
+    path('api/events', ApiEventList.as_view(), name='api-event-list'),
+    path('api/events/<int:pk>', ApiEventDetail.as_view(), name='api-event-detail'),
+    path('api/events/<int:pk>/availability', ApiEventAvailability.as_view(), name='api-event-availability'),
+    path('api/events/<int:pk>/ratings', ApiEventRatings.as_view(), name='api-event-ratings'),
+    path('api/artists', ApiArtistList.as_view(), name='api-artist-list'),
 ]
@@ -1,3 +1,4 @@
+import json
 import logging
 from datetime import date
 
@@ -5,17 +6,34 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Avg
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
 from django.views.generic import View, TemplateView, CreateView, DetailView, ListView, UpdateView
 from django.views.generic.edit import FormMixin
 
+from book2fest.aio import AsyncViewMixin
+from book2fest.booking import book_seat, book_seats, book_adjacent_seats, book_best_available
+from book2fest.caching import AnonymousPageCacheMixin, event_version, FRAGMENT_CACHE_TIMEOUT
+from book2fest.api import ConditionalApiMixin, EventConditionalApiMixin, api_error, parse_fields, serialize, keyset_page, \
+    event_related, availability, rating_summary, EVENT_FIELDS, EVENT_LIST_FIELDS, EVENT_ORDERING, EVENT_RELATED_FIELDS, \
+    ARTIST_FIELDS, ARTIST_LIST_FIELDS, ARTIST_ORDERING
+from book2fest.recommendations import recommended_events
+from book2fest.seating import generate_seats, SeatBlock
+from book2fest.seatmap import get_seat_map, seat_rows, public_seat_map
+from book2fest.fanout import notify_ticket_holders, get_progress
+from book2fest.exports import export_lines, EXPORT_FORMATS
+from book2fest.importer import import_file, summary
 from book2fest.forms import OrganizerProfileForm, UserProfileForm, ArtistForm, EventProfileForm, form_validation_error, \
-    TicketForm, SeatForm, ReviewForm, SeatTypeForm, PictureForm
+    TicketForm, SeatForm, ReviewForm, SeatTypeForm, PictureForm, EventImportForm, GroupBookingForm
 from book2fest.mixin import OrganizerRequiredMixin, UserRequiredMixin, EventOwnerMixin
-from book2fest.models import Artist, UserProfile, OrganizerProfile, EventProfile, SeatType, Ticket, Seat, Category, \
-    Genre, Review, Picture
+from book2fest.holds import place_hold, release_hold
+from book2fest.images import process_images
+from book2fest.pagination import KeysetPaginationMixin
+from book2fest.profiles import get_profile, ROLE_USER, ROLE_ORGANIZER
+from book2fest.search import search_events, search_artists, event_rank, artist_rank
+from book2fest.models import Artist, UserProfile, OrganizerProfile, EventProfile, SeatType, Ticket, Review, \
+    Picture, RatingSummary
 
 _logger = logging.getLogger(__name__)
 
@@ -92,10 +110,11 @@ class ProfileView(LoginRequiredMixin, View): #redirect view
         if isinstance(request.user, AnonymousUser):
             return redirect('login')
 
-        if UserProfile.objects.filter(user=request.user).exists():
+        role, __ = get_profile(request)
+        if role == ROLE_USER:
             return redirect('book2fest:user-profile')
 
-        if OrganizerProfile.objects.filter(user=request.user).exists():
+        if role == ROLE_ORGANIZER:
             return redirect('book2fest:organizer-profile')
 
 
@@ -155,12 +174,17 @@ class ArtistCreate(LoginRequiredMixin, OrganizerRequiredMixin, CreateView):
     permission_denied_message = "You must authenticate first!"
     success_url = reverse_lazy("book2fest:artist-list")
 
+    def form_valid(self, form):
+        response = super(ArtistCreate, self).form_valid(form)
+        process_images([self.object], 'image')
+        return response
+
     def handle_no_permission(self):
         messages.error(self.request, self.permission_denied_message)
         return super(ArtistCreate, self).handle_no_permission()
 
 
-class ArtistList(ListView):
+class ArtistList(AsyncViewMixin, KeysetPaginationMixin, ListView):
     model = Artist
     template_name = "book2fest/artist/list.html"
 
@@ -168,34 +192,21 @@ class ArtistList(ListView):
         result = super(ArtistList, self).get_queryset()
         query = self.request.GET.get('search', None)
         filter = self.request.GET.get('search-filter', None)
-        key = None
-        print(f'query {query}')
 
         if query:
-            if filter == 'name':
-                key = 'full_name__contains'
-
-            if filter == 'genre':
-                key = 'genre__name__contains'
-
-            if filter == 'category':
-                key = 'genre__category__name__contains'
+            result = Artist.objects.filter(pk__in=search_artists(query, filter))
+            rank = artist_rank(query, filter)
+            if rank is not None:
+                # best matches first, the rank is the keyset ordering of the pages
+                result = result.annotate(search_rank=rank).order_by('search_rank')
 
-            kwargs = {key: query}
-            result = Artist.objects.all().filter(**kwargs)
-
-        return result
+        return result.listing()
 
     def get_context_data(self):
         context = super(ArtistList, self).get_context_data()
-        try:
-            if not isinstance(self.request.user, AnonymousUser):
-                # if user is organizer -> show manage seat column in table
-                context['organizer'] = OrganizerProfile.objects.get(user=self.request.user)
-
-        except ObjectDoesNotExist:
-            context['organizer'] = None
-
+        # if user is organizer -> show manage seat column in table
+        role, profile = get_profile(self.request)
+        context['organizer'] = profile if role == ROLE_ORGANIZER else None
         return context
 
 
@@ -222,6 +233,31 @@ class EventCreate(LoginRequiredMixin, OrganizerRequiredMixin, CreateView):
         return super(EventCreate, self).handle_no_permission()
 
 
+class EventImport(LoginRequiredMixin, OrganizerRequiredMixin, View):
+    """ Creates the events of a JSON/CSV file at once, see book2fest.importer"""
+
+    def get(self, request, **kwargs):
+        return render(request, "book2fest/event/import.html", {'form': EventImportForm()})
+
+    def post(self, request, **kwargs):
+        form = EventImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            messages.error(request, form_validation_error(form))
+            return redirect(request.path_info)
+
+        file = form.cleaned_data.get('file')
+        report = import_file(self.profile, file, file.name.rsplit('.', 1)[-1].lower(),
+                             dry_run=form.cleaned_data.get('dry_run'))
+        if report.errors:
+            messages.error(request, summary(report))
+            return redirect(request.path_info)
+
+        messages.success(request, summary(report))
+        if report.dry_run:
+            return redirect(request.path_info)
+        return redirect('book2fest:event-list')
+
+
 class EventImagesUpload(LoginRequiredMixin, OrganizerRequiredMixin, EventOwnerMixin, View):
     event_profile = None
 
@@ -237,8 +273,10 @@ class EventImagesUpload(LoginRequiredMixin, OrganizerRequiredMixin, EventOwnerMi
 
         form = PictureForm(request.POST, request.FILES)
         if form.is_valid():
-            for img in request.FILES.getlist('img'):
-                Picture.objects.create(event=self.event_profile, img=img, name=form.cleaned_data.get('name'), description=form.cleaned_data.get('description'))
+            pictures = [Picture.objects.create(event=self.event_profile, img=img, name=form.cleaned_data.get('name'), description=form.cleaned_data.get('description'))
+                        for img in request.FILES.getlist('img')]
+            # thumbnail, card and hero sizes of all the pictures, in parallel
+            process_images(pictures, 'img')
             messages.success(request, "Uploaded images successfully!")
             return redirect('book2fest:event-detail', self.event_profile.pk)
         else:
@@ -253,55 +291,76 @@ class EventUpdate(LoginRequiredMixin, OrganizerRequiredMixin, EventOwnerMixin, U
     template_name = "book2fest/event/update.html"
 
 
-class EventDetail(FormMixin, DetailView):
+class EventDetail(AsyncViewMixin, FormMixin, DetailView):
     model = EventProfile
     form_class = TicketForm
     template_name = 'book2fest/event.html'
     success_url = '/home'
     profile = None
     ticket = None
+    reviews_shown = 10
 
+    def get_queryset(self):
+        queryset = super(EventDetail, self).get_queryset()
+        if self.request.method == 'GET':
+            return queryset.detail()
+        return queryset
+
+    def get_concurrent_queries(self):
+        pk = self.kwargs.get('pk')
+        return {'object': self.get_object,
+                'seat_map': lambda: get_seat_map(pk),
+                'event_version': lambda: event_version(pk),
+                'deliveries': lambda: list(TicketForm.base_fields['delivery'].queryset.all())}
 
     def get_context_data(self, **kwargs):
         context = super(EventDetail, self).get_context_data(**kwargs)
-        occupied_seats = Seat.objects.filter(event=self.object).filter(available=False)
-        righe = (Seat.objects.filter(event=self.object).values('name','number','price','row','available','seat_type').order_by('row','number'))
-
-        d = {}
-        for x in righe:
-            if x['row'] in d.keys():
-                d[x['row']].append(x)
-            else:
-                d[x['row']] = [x]
-        l = []
-        for x in d:
-            l.append(d[x])
+        results = self.query_results()
+        seat_map = results['seat_map']
+        role, profile = get_profile(self.request)
+        holder = profile.pk if role == ROLE_USER else None  # seats held by the user can be booked by the user only
 
         stars_number = int(self.object.avg_rating)
-        reviews = Review.objects.filter(ticket__seat__event=self.object)
-
-        context.update({'righe': l})
-        context.update({'occupied_seats': occupied_seats})
+        # newest reviews only, the others are paged by EventReviews
+        reviews = Review.objects.filter(event=self.object).published().listing().order_by('-date', 'pk')[:self.reviews_shown]
+
+        context.update({'righe': seat_rows(seat_map, holder)})
+        context.update({'holder': holder})
+        # artists, services and reviews are rendered in fragments cached until the event changes,
+        # the querysets run only when a fragment is rendered again
+        context.update({'event_version': results['event_version'], 'fragment_timeout': FRAGMENT_CACHE_TIMEOUT})
+        context.update({'artists': self.object.artist_list.select_related('genre__category')})
+        context.update({'services': self.object.services.select_related('icon')})
+        context.update({'rating_summary': RatingSummary.objects.filter(event=self.object).first})
+        context.update({'seat_map': seat_map})
         context.update({'stars_number': stars_number})
         context.update({'reviews': reviews})
         return context
 
+    def get_group_form(self, seat_map, ticket_form):
+        """ Group booking form, with the seat types of the seat map and the deliveries of the ticket form"""
+        group_form = GroupBookingForm(auto_id='group_%s')
+        group_form.fields['seat_type'].choices = [('', group_form.fields['seat_type'].empty_label)] + sorted(
+            (int(pk), name) for pk, name in seat_map['types'].items())
+        group_form.fields['delivery'].choices = ticket_form.fields['delivery'].choices
+        return group_form
+
     def form_valid(self, form):
         form.save()
 
     def get(self, request, **kwargs):
         # kwargs = self.get_form_kwargs()
-        form = TicketForm(event_pk=kwargs.get('pk')) # filter form with event_pk
-
-        self.object = self.get_object()
+        self.object = self.query_results()['object']
         context = self.get_context_data(object=self.object)
+        form = TicketForm(seat_map=context['seat_map'], holder=context['holder']) # only available seats of the event
+        field = form.fields['delivery']
+        field.choices = [('', field.empty_label)] + [(delivery.pk, field.label_from_instance(delivery))
+                                                     for delivery in self.query_results()['deliveries']]  # one query for both forms
+        if context['holder']:
+            context['group_form'] = self.get_group_form(context['seat_map'], form)
 
-        # Retrieve pictures
-        try:
-            context['pictures'] = Picture.objects.all().filter(event__pk=kwargs.get('pk'))
-
-        except ObjectDoesNotExist:
-            context['pictures'] = None
+        # pictures are prefetched with the event
+        context['pictures'] = self.object.pictures.all()
 
         context['form'] = form
         return self.render_to_response(context)
@@ -312,54 +371,224 @@ class EventDetail(FormMixin, DetailView):
         if isinstance(request.user, AnonymousUser):
             return redirect('login')
 
-        self.ticket = Ticket()
-        form = TicketForm(request.POST, request.FILES, instance=self.ticket)
+        form = TicketForm(request.POST, request.FILES, instance=Ticket())
+        event = self.get_object()
 
+        if form.is_valid() and not event.cancelled and not event.is_past:
+            #Get user profile and create ticket
+            role, self.profile = get_profile(request)      # retrieve logged user
+            if role != ROLE_USER:  # user is an organizer
+                messages.error(request,"Sorry,but you are not allowed to book tickets.")
+                return redirect("book2fest:organizer-profile")
 
-        try:
-            if form.is_valid() and not self.get_object().cancelled and not self.get_object().is_past:
-                #Get user profile and create ticket
-
-                self.profile = UserProfile.objects.get(user=request.user)      # retrieve logged user
-                self.ticket.user = self.profile
-                self.ticket.delivery = form.cleaned_data.get('delivery')
-                self.ticket.seat = form.cleaned_data.get('seat')
-
-                if self.ticket.seat.available:
-                    # save ticket
-                    self.ticket.save()
-                    self.ticket.seat.available = False
-                    self.ticket.seat.save()
-                    messages.success(request, 'Ticket booked successfully')
-                else:
-                    messages.error(request, "Something went wrong with your booking procedure. The seat is not available")
-                    return redirect('book2fest:event-list')
-
+            # claim the seat and save the ticket in a single transaction
+            self.ticket, msg = book_seat(self.profile, event, form.cleaned_data.get('seat'),
+                                         form.cleaned_data.get('delivery'))
+            if self.ticket:
+                messages.success(request, msg)
             else:
-                error = form_validation_error(form) if not form.is_valid() else "Something went wrong with your booking procedure. The event got cancelled or is past."
-                messages.error(request, error)
+                messages.error(request, msg)
                 return redirect('book2fest:event-list')
 
-        except ObjectDoesNotExist:  # if exception caught user is an organizer
-            messages.error(request,"Sorry,but you are not allowed to book tickets.")
-            return redirect("book2fest:organizer-profile")
+        else:
+            error = form_validation_error(form) if not form.is_valid() else "Something went wrong with your booking procedure. The event got cancelled or is past."
+            messages.error(request, error)
+            return redirect('book2fest:event-list')
 
         return redirect('book2fest:ticket-manage', self.ticket.pk)
 
 
 
-def get_seat_available(event_id):
-    """ Return the amount of seats available and unavailable for an event"""
-    if event_id:
-        return Seat.objects.all().filter(event=event_id, available=True).count()
-    else:
-        return None
+class EventReviews(KeysetPaginationMixin, ListView):
+    """ Reviews of an event, newest first"""
+    model = Review
+    template_name = 'book2fest/review/list.html'
+    ordering = ['-date']
+    paginate_by = 20
+    event = None
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.event = EventProfile.objects.get(pk=kwargs.get('pk'))
+        except ObjectDoesNotExist:
+            raise Http404("Event not found")
+        return super(EventReviews, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Review.objects.filter(event=self.event).published().listing()
+
+    def get_context_data(self, **kwargs):
+        context = super(EventReviews, self).get_context_data(**kwargs)
+        context.update({'event': self.event})
+        context.update({'rating_summary': RatingSummary.objects.filter(event=self.event).first()})
+        return context
+
+
+class EventSeatMap(View):
+    """ Seat map of the event as JSON"""
+
+    def get(self, request, **kwargs):
+        seat_map = get_seat_map(kwargs.get('pk'))
+        if seat_map is None:
+            raise Http404("Event not found")
+        return JsonResponse(public_seat_map(seat_map))
+
+
+class ApiEventList(ConditionalApiMixin, View):
+    """ Events by start as JSON, with the ?fields= among api.EVENT_FIELDS, paginated with ?cursor="""
+
+    def get(self, request, **kwargs):
+        fields, msg = parse_fields(request, EVENT_FIELDS, EVENT_LIST_FIELDS)
+        if fields is None:
+            return api_error(msg)
+        rows, next_cursor, msg = keyset_page(EventProfile.objects.all(), EVENT_ORDERING, EVENT_FIELDS, fields,
+                                             request.GET.get('cursor'))
+        if rows is None:
+            return api_error(msg)
+        return JsonResponse({'results': rows, 'next': next_cursor})
+
+
+class ApiEventDetail(EventConditionalApiMixin, View):
+    """ Event as JSON, with the ?fields= among api.EVENT_FIELDS and the artists and services"""
+
+    def get(self, request, **kwargs):
+        fields, msg = parse_fields(request, list(EVENT_FIELDS) + list(EVENT_RELATED_FIELDS),
+                                   list(EVENT_FIELDS) + list(EVENT_RELATED_FIELDS))
+        if fields is None:
+            return api_error(msg)
+        rows = serialize(EventProfile.objects.filter(pk=kwargs.get('pk')), EVENT_FIELDS,
+                         [field for field in fields if field in EVENT_FIELDS])
+        if not rows:
+            return api_error("Event not found", status=404)
+        return JsonResponse(dict(rows[0], **event_related(kwargs.get('pk'), fields)))
+
+
+class ApiEventAvailability(EventConditionalApiMixin, View):
+    """ Available seats of the event as JSON, per seat type, from the cached seat map"""
+
+    def get(self, request, **kwargs):
+        seat_map = get_seat_map(kwargs.get('pk'))
+        if seat_map is None:
+            return api_error("Event not found", status=404)
+        return JsonResponse(availability(seat_map))
+
+
+class ApiEventRatings(EventConditionalApiMixin, View):
+    """ Rating summary of the event as JSON"""
+
+    def get(self, request, **kwargs):
+        return JsonResponse(rating_summary(kwargs.get('pk')))
+
+
+class ApiArtistList(ConditionalApiMixin, View):
+    """ Artists by name as JSON, with the ?fields= among api.ARTIST_FIELDS, paginated with ?cursor="""
+
+    def get(self, request, **kwargs):
+        fields, msg = parse_fields(request, ARTIST_FIELDS, ARTIST_LIST_FIELDS)
+        if fields is None:
+            return api_error(msg)
+        rows, next_cursor, msg = keyset_page(Artist.objects.all(), ARTIST_ORDERING, ARTIST_FIELDS, fields,
+                                             request.GET.get('cursor'))
+        if rows is None:
+            return api_error(msg)
+        return JsonResponse({'results': rows, 'next': next_cursor})
+
+
+class EventSeatStream(View):
+    """ Server-sent events of the seats of the event, see book2fest.live. The stream is served by
+        the ASGI application (base_project.asgi), other servers get a 503 and browsers stop retrying"""
+
+    def get(self, request, **kwargs):
+        return JsonResponse({'error': "Live seat updates need the ASGI server"}, status=503)
+
+
+class SeatHoldView(LoginRequiredMixin, UserRequiredMixin, View):
+    """ Hold (action=hold) or release (action=release) a seat of the event for a few minutes.
+        Answers with JSON to requests accepting it, otherwise redirects to the event page"""
 
+    def post(self, request, **kwargs):
+        event = EventProfile.objects.filter(pk=kwargs.get('pk')).first()
+        if event is None:
+            raise Http404("Event not found")
+        try:
+            seat_id = int(request.POST.get('seat', ''))
+        except ValueError:
+            seat_id = None
+
+        if seat_id is None or event.cancelled or event.is_past:
+            held, msg = None, "Something went wrong with your request. The seat is not available"
+        elif request.POST.get('action', 'hold') == 'release':
+            held, msg = None, release_hold(self.profile, event, seat_id)[1]
+        else:
+            held, msg = place_hold(self.profile, event, seat_id)
 
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({'seat': seat_id, 'held': held is not None,
+                                 'expires': held.timestamp() if held else None, 'message': msg})
 
-class EventList(ListView):
+        if held:
+            messages.success(request, msg)
+        else:
+            messages.error(request, msg)
+        return redirect('book2fest:event-detail', event.pk)
+
+
+class GroupBookingView(LoginRequiredMixin, UserRequiredMixin, View):
+    """ Book several seats of the event at once, all of them or none: the listed seats, a number
+        of adjacent seats in a row or the best ones available, see GroupBookingForm.
+        Takes a form or a JSON body, answers with JSON to requests accepting it, otherwise redirects"""
+
+    def post(self, request, **kwargs):
+        event = EventProfile.objects.filter(pk=kwargs.get('pk')).first()
+        if event is None:
+            raise Http404("Event not found")
+
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                data = None
+            data = data if isinstance(data, dict) else {}
+            if isinstance(data.get('seats'), list):
+                data['seats'] = ','.join(str(seat) for seat in data['seats'])
+        else:
+            data = request.POST
+        form = GroupBookingForm(data)
+
+        if event.cancelled or event.is_past:
+            tickets, msg = None, "Something went wrong with your booking procedure. The event got cancelled or is past."
+        elif not form.is_valid():
+            tickets, msg = None, form_validation_error(form) or ' '.join(form.non_field_errors())
+        elif form.cleaned_data.get('seats'):
+            tickets, msg = book_seats(self.profile, event, form.cleaned_data['seats'], form.cleaned_data['delivery'])
+        elif form.cleaned_data.get('row'):
+            seat_type = form.cleaned_data.get('seat_type')
+            tickets, msg = book_adjacent_seats(self.profile, event, form.cleaned_data['quantity'],
+                                               form.cleaned_data['delivery'], row=form.cleaned_data['row'],
+                                               seat_type=seat_type.pk if seat_type else None)
+        else:
+            seat_type = form.cleaned_data.get('seat_type')
+            tickets, msg = book_best_available(self.profile, event, form.cleaned_data['quantity'],
+                                               form.cleaned_data['delivery'], max_price=form.cleaned_data.get('max_price'),
+                                               seat_type=seat_type.pk if seat_type else None)
+
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({'booked': tickets is not None, 'message': msg,
+                                 'tickets': [{'ticket': ticket.pk, 'seat': ticket.seat_id, 'row': ticket.seat.row,
+                                              'number': ticket.seat.number, 'price': ticket.seat.price}
+                                             for ticket in tickets or []]})
+
+        if tickets is None:
+            messages.error(request, msg)
+            return redirect('book2fest:event-detail', event.pk)
+        messages.success(request, msg)
+        return redirect('book2fest:ticket-list')
+
+
+class EventList(AnonymousPageCacheMixin, AsyncViewMixin, KeysetPaginationMixin, ListView):
     model = EventProfile
     template_name = "book2fest/event/list.html"
+    order_filters = ['event_name', 'event_start', 'avg_rating', 'seats_available']
 
     def get_queryset(self):
         result = super(EventList, self).get_queryset()
@@ -367,17 +596,12 @@ class EventList(ListView):
         filter = self.request.GET.get('search-filter', None)
 
         if query:
-            if filter == "category":
-                result = EventProfile.objects.all().filter(artist_list__genre__category__name__contains=query).distinct()
-
-            if filter == "genre":
-                result = EventProfile.objects.all().filter(artist_list__genre__name__contains=query).distinct()
-
-            if filter == "artist":
-                result = EventProfile.objects.all().filter(artist_list__full_name__contains=query).distinct()
-
-            if filter == "event_name":
-                result = EventProfile.objects.all().filter(event_name__contains=query)
+            # full-text search on event name, artists, genres or categories
+            result = EventProfile.objects.filter(pk__in=search_events(query, filter))
+            rank = event_rank(query, filter)
+            if rank is not None and self.get_ordering() is None:
+                # best matches first, the rank is the keyset ordering of the pages
+                result = result.annotate(search_rank=rank).order_by('search_rank')
 
         return result
 
@@ -385,6 +609,8 @@ class EventList(ListView):
     def get_ordering(self):
         ordering = self.request.GET.get('order-filter')
         # validate ordering here
+        if ordering not in self.order_filters:
+            return None
         if ordering == "avg_rating":
             ordering = "-avg_rating"
         if ordering == "seats_available":
@@ -395,63 +621,34 @@ class EventList(ListView):
     def get_context_data(self, *, object_list=None, **kwargs):
 
         context = super(EventList, self).get_context_data(**kwargs)
-        context['order_filters'] = ['event_name', 'event_start', 'avg_rating', 'seats_available']
-        try:
-            # count seats available and average rating for events
-            for event in self.object_list:
-
-                event.seats_available = get_seat_available(event.pk)
-
-                event_seats = Seat.objects.all().filter(event=event.pk)
-                event_tickets = Ticket.objects.all().filter(seat__in=event_seats)
-                qs = Review.objects.filter(ticket__in=event_tickets).aggregate(Avg('rating'))
-
-                if not qs.get('rating__avg'):
-                    event.avg_rating = 0.0
-                else:
-                    event.avg_rating = qs.get('rating__avg')
-
-                event.save()
-
-
-            if not isinstance(self.request.user, AnonymousUser):
-                # if user is organizer -> show manage seat column in table
-                context['organizer'] = OrganizerProfile.objects.get(user=self.request.user)
-
-        except ObjectDoesNotExist:
-            context['organizer'] = None
-
+        context['order_filters'] = self.order_filters
+        # seats available and average rating are kept up to date by book2fest.counters
+        # if user is organizer -> show manage seat column in table
+        role, profile = get_profile(self.request)
+        context['organizer'] = profile if role == ROLE_ORGANIZER else None
         return context
 
 def add_seats(total_new, price, row, seat_type, event):
-    """ Check the maximum capacity of event, then add seats"""
-    total_event_seats = Seat.objects.all().filter(event=event).count()
-
+    """ Check the maximum capacity of event, then add a row of seats"""
     if total_new < 0:
         return False, "Can't add a negative number of seats"
 
-    if total_event_seats + total_new <= event.max_capacity:
-        # can add seats
-        for number in range(total_new):
-            seat = Seat(price=price, row=row, number=number, seat_type=seat_type, available=True,
-                        event=event)
-            seat.save()
-        return True, f"Added {total_new} seats"
-    else:
-        return False, f"Max capacity exceeded"
+    return generate_seats(event, [SeatBlock([row], total_new, seat_type, price)])
 
 
 
 class ManageSeat(LoginRequiredMixin, OrganizerRequiredMixin, EventOwnerMixin, View):
     event_profile = None
     event_id = None
+    tickets_shown = 50  # the whole list of the tickets is downloaded with TicketExport
 
     def get(self, request, **kwargs):
         seat_types = SeatType.objects.all()
-        event_seats = Seat.objects.all().filter(event=self.event_profile)
-        event_tickets = Ticket.objects.all().filter(seat__in=event_seats).order_by('seat__row','seat__number')
+        event_tickets = Ticket.objects.filter(seat__event=self.event_profile)
+        tickets = event_tickets.attendees().order_by('seat__row','seat__number')[:self.tickets_shown]
 
-        context = {'event': self.event_profile, 'seat_types': seat_types, 'tickets':event_tickets}
+        context = {'event': self.event_profile, 'seat_types': seat_types, 'tickets': tickets,
+                   'tickets_total': event_tickets.count()}
         return render(request, 'book2fest/seat/create.html', context)
 
     def post(self, request, **kwargs):
@@ -476,17 +673,28 @@ class ManageSeat(LoginRequiredMixin, OrganizerRequiredMixin, EventOwnerMixin, Vi
         return redirect('book2fest:event-detail', pk=kwargs.get('pk'))
 
 
-from notifications.signals import notify
+class TicketExport(LoginRequiredMixin, OrganizerRequiredMixin, EventOwnerMixin, View):
+    """ Streams the tickets of the event as CSV or JSON lines (?format=csv|jsonl)"""
+    event_profile = None
+
+    def get(self, request, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            messages.error(request, f"Unknown export format: {export_format}")
+            return redirect('book2fest:manage-seat', pk=self.event_profile.pk)
+
+        response = StreamingHttpResponse(export_lines(self.event_profile, export_format),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="event-{self.event_profile.pk}-tickets.{export_format}"'
+        return response
+
+
 class EventCancel(ManageSeat):
+    primary_database = True  # toggles the event on GET, see book2fest.routers
 
     def get(self, request, **kwargs):
 
         if self.profile == self.event_profile.user:
-            profiles = []
-            tickets_users = Ticket.objects.filter(seat__event=self.event_profile).values_list('user')
-            for id in tickets_users:
-                profiles.append(UserProfile.objects.get(id=id[0]))
-
             if self.event_profile.cancelled:
                 self.event_profile.cancelled = False
                 self.event_profile.save()
@@ -499,9 +707,10 @@ class EventCancel(ManageSeat):
                 verb = 'Event CANCELLED!'
                 description = f'{self.event_profile.event_name} has been cancelled!'
 
-            #retrieve all users that bought ticket for this event
-            for profile in profiles:
-                notify.send(profile.user, recipient=profile.user, verb=verb, description=description, target=self.event_profile)
+            # notify all users that bought ticket for this event, in background
+            job_id = notify_ticket_holders(self.event_profile, verb, description)
+            messages.success(request, "All users that bought tickets for the event are being notified.")
+            _logger.info(f'Queued notification job {job_id} for event {self.event_profile.pk}')
 
         else:
             # show error you are not authorized
@@ -510,7 +719,17 @@ class EventCancel(ManageSeat):
         return redirect("book2fest:manage-seat", pk=self.event_profile.pk)
 
 
-class UserTicketList(LoginRequiredMixin, UserRequiredMixin, ListView):
+class NotificationJobStatus(LoginRequiredMixin, OrganizerRequiredMixin, View):
+    """ Progress of a notification job as JSON"""
+
+    def get(self, request, **kwargs):
+        progress = get_progress(kwargs.get('job_id'))
+        if progress is None or not EventProfile.objects.filter(pk=progress['event'], user=self.profile).exists():
+            raise Http404("Job not found")
+        return JsonResponse(progress)
+
+
+class UserTicketList(LoginRequiredMixin, UserRequiredMixin, KeysetPaginationMixin, ListView):
     model = Ticket
     template_name = "book2fest/ticket/list.html"
 
@@ -539,32 +758,17 @@ class UserTicketList(LoginRequiredMixin, UserRequiredMixin, ListView):
         tickets = Ticket.objects.all().filter(user=self.profile).order_by(ordering)
 
         if query:
+            tickets = tickets.filter(seat__event__in=search_events(query, filter))
+            rank = event_rank(query, filter, key='seat__event')
+            if rank is not None and order is None:
+                # tickets of the best matching events first
+                tickets = tickets.annotate(search_rank=rank).order_by('search_rank')
 
-            if filter == "category":
-                categories = Category.objects.all().filter(name__contains=query)
-                genres = Genre.objects.all().filter(category__in=categories)
-                artists = Artist.objects.all().filter(genre__in=genres)
-                events = EventProfile.objects.all().filter(artist_list__in=artists)
-
-            if filter == "genre":
-                genres = Genre.objects.all().filter(name__contains=query)
-                artists = Artist.objects.all().filter(genre__in=genres)
-                events = EventProfile.objects.all().filter(artist_list__in=artists)
-
-            if filter == "artist":
-                artists = Artist.objects.all().filter(full_name__contains=query)
-                events = EventProfile.objects.all().filter(artist_list__in=artists)
-
-            if filter == "event_name":
-                events = EventProfile.objects.all().filter(event_name__contains=query)
-
-            seats = Seat.objects.all().filter(event__in=events)
-            tickets = Ticket.objects.all().filter(seat__in=seats, user=self.profile).order_by(ordering).distinct()
-
-        return tickets
+        return tickets.listing()
 
 
 class ManageTicket(LoginRequiredMixin, UserRequiredMixin, View):
+    primary_database = True  # creates the review of the ticket on GET, see book2fest.routers
     ticket = None
     review = None
     form = None
@@ -610,31 +814,21 @@ class ManageTicket(LoginRequiredMixin, UserRequiredMixin, View):
         return redirect('book2fest:ticket-manage', self.ticket.pk)
 
 
-class HomeView(ListView):
+class HomeView(AnonymousPageCacheMixin, AsyncViewMixin, ListView):
     model = EventProfile
     template_name = "book2fest/home.html"
 
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super(HomeView, self).get_context_data(**kwargs)
+    def get_concurrent_queries(self):
         available = EventProfile.objects.filter(cancelled=False).filter(event_end__gt=date.today()).order_by('avg_rating')
         unavailable = EventProfile.objects.exclude(id__in=available).order_by('avg_rating')
+        available, unavailable = available.listing(), unavailable.listing()
+        return {"available": lambda: list(available[:5]),
+                "unavailable": lambda: list(unavailable[:5]),
+                "recommended": lambda: recommended_events(self.request.user, limit=5, queryset=EventProfile.objects.listing())}
 
-        recommended = {}
-        user_tickets = Ticket.objects.filter(user__user_id=self.request.user.id).values()  # ticket di eventi in cui è stato l'utente
-        for i in range(len(user_tickets)):
-            event_id = EventProfile.objects.filter(seat_event=user_tickets[i]['seat_id']).values()  # id evento al quale ha partecipato
-            all_event_tickets = Ticket.objects.filter(seat__event_id=event_id[0]['id']).values()  # tutti i ticket relativi allo stesso evento
-            for j in range(len(all_event_tickets)):
-                users_tickets = Ticket.objects.filter(user=all_event_tickets[j]['user_id']).values()    # insieme di ticket per ogni possessore di ticket in all_event_tickets
-                ticket_group = Ticket.objects.filter(user=users_tickets[0]['user_id']) # insieme di eventi per ogni possessore
-                for ticket in ticket_group:
-                    ev = EventProfile.objects.filter(seat_event__ticket_seat=ticket)
-                    id = ev.values('id')[0]['id']
-                    if id not in recommended.keys() and ev.filter(cancelled=False).filter(event_end__gt=date.today()):
-                        recommended[id] = ev[0]
-
-        context.update({"available":available[:5]})
-        context.update({"unavailable":unavailable[:5]})
-        context.update({"recommended":list(recommended.values())[:5]})
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super(HomeView, self).get_context_data(**kwargs)
+        # the three lists don't depend on each other, the async view gets them concurrently
+        context.update(self.query_results())
         return context
\ No newline at end of file